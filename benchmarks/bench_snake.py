@@ -0,0 +1,827 @@
+"""
+Copyright 2019
+Author: Joao Carvalho <joao.ac.carvalho@gmail.com>
+"""
+import argparse
+import copy
+import curses
+import fcntl
+import json
+import os
+import platform
+import pty
+import select
+import struct
+import subprocess
+import sys
+import tempfile
+import termios
+import time
+import tracemalloc
+from snake.agents import MOVES, AutopilotAgent
+from snake.arena import Arena
+from snake.components import Food, Point, Snake
+from snake.engine import Engine
+from snake.events import EventStream
+from snake.export import AsciicastWriter, GifWriter, export
+from snake.maps import load_map, parse_map
+from snake.render import AnsiScreen, CursesRenderer, ViewportRenderer
+from snake.replay import Recorder
+from snake.rng import GameRandom
+from snake.stats import percentile
+from snake.store import ScoreStore
+from snake.tournament import GameResult
+try:
+    from snake.observation import Observation
+except ImportError:
+    Observation = None
+try:
+    import numpy as np
+    from snake.vector import DIRECTIONS as VECTOR_DIRECTIONS, VectorEngine
+except ImportError:
+    VectorEngine = None
+
+
+# Board sizes and snake lengths measured. Lengths that do not fit in half of a board interior are skipped.
+BOARD_SIZES = [(20, 40), (200, 200), (2000, 2000)]
+LENGTHS = [3, 100, 10000, 1000000]
+# Direction of each position offset.
+DIRECTIONS = {move: direction for direction, move in MOVES.items()}
+# Largest board rendered on a pseudo-terminal.
+MAX_TERMINAL_CELLS = 200 * 200
+
+
+class NullOutput:
+    """
+    Binary output that drops everything written to it.
+    """
+
+    def write(self, data):
+        return len(data)
+
+
+class FakeScreen:
+
+    def __init__(self, height, width):
+        """
+        This class implements the subset of a curses window used by the renderer, writing to an in-memory character
+        grid instead of a terminal.
+
+        :param height: window height
+        :type height: int
+        :param width: window width
+        :type width: int
+        """
+        self.height = height
+        self.width = width
+        self.rows = [[' '] * width for _ in range(height)]
+
+    def erase(self):
+        for row in self.rows:
+            row[:] = ' ' * self.width
+
+    def border(self, ls, rs, ts, bs, tl, tr, bl, br):
+        self.rows[0][:] = tl + ts * (self.width - 2) + tr
+        self.rows[-1][:] = bl + bs * (self.width - 2) + br
+        for row in self.rows[1:-1]:
+            row[0] = ls
+            row[-1] = rs
+
+    def addch(self, y, x, ch):
+        if not (0 <= y < self.height and 0 <= x < self.width):
+            raise curses.error('addch() returned ERR')
+        self.rows[y][x] = ch
+
+    def addstr(self, y, x, string):
+        self.rows[y][x:x + len(string)] = string
+
+    def getmaxyx(self):
+        return self.height, self.width
+
+    def noutrefresh(self, *args):
+        pass
+
+
+def serpentine(board_height, board_width):
+    """
+    Path that covers the board interior row by row, alternating the direction of each row.
+
+    :param board_height: board game height
+    :type board_height: int
+    :param board_width: board game width
+    :type board_width: int
+    :return: list of positions
+    """
+    path = []
+    for y in range(1, board_height - 1):
+        xs = range(1, board_width - 1) if y % 2 == 1 else range(board_width - 2, 0, -1)
+        path.extend(Point(y, x) for x in xs)
+    return path
+
+
+def path_directions(path, start, stop=None):
+    """
+    Directions that move along a path.
+
+    :param path: list of adjacent positions
+    :type path: list
+    :param start: index of the first position
+    :type start: int
+    :param stop: index of the last position, defaults to the end of the path
+    :type stop: int
+    :return: list of directions, one per move
+    """
+    stop = len(path) - 1 if stop is None else min(stop, len(path) - 1)
+    return [DIRECTIONS[(path[i + 1].y - path[i].y, path[i + 1].x - path[i].x)] for i in range(start, stop)]
+
+
+def coil(engine, length, path):
+    """
+    Replace the engine snake with a snake of a given length lying along the start of a path, heading along it.
+
+    :param engine: game engine
+    :type engine: Engine
+    :param length: snake length
+    :type length: int
+    :param path: path covering the board, as returned by serpentine
+    :type path: list
+    """
+    engine.reset(0)
+    engine.snake.body = path[length - 1::-1]
+    engine.snake.head_direction = path_directions(path, length - 1, length)[0]
+    engine.rebuild_free_cells()
+    engine.place_food()
+
+
+def latency(call, calls, between=None):
+    """
+    Time each call of a function separately.
+
+    :param call: function to time
+    :type call: function
+    :param calls: number of calls
+    :type calls: int
+    :param between: function called before each timed call, outside of the measurement
+    :type between: function
+    :return: dictionary with the calls per second and the mean, median, 90th, 99th percentile and maximum latency
+             in microseconds
+    """
+    clock = time.perf_counter_ns
+    times = []
+    for _ in range(calls):
+        if between is not None:
+            between()
+        start = clock()
+        call()
+        times.append(clock() - start)
+    total = sum(times)
+    times.sort()
+    return {
+        'calls': calls,
+        'calls_per_s': calls / max(total, 1) * 1e9,
+        'mean_us': total / calls / 1e3,
+        'p50_us': percentile(times, 50) / 1e3,
+        'p90_us': percentile(times, 90) / 1e3,
+        'p99_us': percentile(times, 99) / 1e3,
+        'max_us': times[-1] / 1e3,
+    }
+
+
+def bench_board(board_height, board_width, length, calls):
+    """
+    Measure the hot paths of a game with a snake of a given length.
+
+    :param board_height: board game height
+    :type board_height: int
+    :param board_width: board game width
+    :type board_width: int
+    :param length: snake length
+    :type length: int
+    :param calls: number of timed calls of each function
+    :type calls: int
+    :return: list of results, one per function
+    """
+    path = serpentine(board_height, board_width)
+    results = {}
+
+    # Engine ticks, following the path so the snake never dies. The game restarts at the end of the path.
+    directions = path_directions(path, length - 1)
+    state = {'tick': len(directions)}
+
+    def next_tick():
+        if state['tick'] == len(directions) or engine.is_done():
+            coil(engine, length, path)
+            state['tick'] = 0
+        state['action'] = directions[state['tick']]
+        state['tick'] += 1
+
+    # The same ticks keeping the state hash up to date, and the hash itself.
+    engine = Engine(board_height=board_height, board_width=board_width, hashing=True)
+    results['engine.step.hashing'] = latency(lambda: engine.step(state['action']), calls, between=next_tick)
+
+    def tick():
+        next_tick()
+        engine.step(state['action'])
+
+    results['engine.state_hash'] = latency(engine.state_hash, calls, between=tick)
+    engine = Engine(board_height=board_height, board_width=board_width)
+    state['tick'] = len(directions)
+    results['engine.step'] = latency(lambda: engine.step(state['action']), calls, between=next_tick)
+
+    # Incremental and full frames of the renderer, on an in-memory screen.
+    renderer = CursesRenderer(FakeScreen(board_height, board_width), board_height, board_width, doupdate=lambda: None)
+    state['tick'] = len(directions)
+
+    def step():
+        next_tick()
+        if state['tick'] == 1:
+            renderer.invalidate()
+            renderer.render(engine)
+        engine.step(state['action'])
+
+    results['render'] = latency(lambda: renderer.render(engine), calls, between=step)
+    results['render.full'] = latency(lambda: renderer.render(engine), 10, between=renderer.invalidate)
+
+    # The same frames written to an output as ANSI escape sequences.
+    screen = AnsiScreen(NullOutput(), board_height, board_width)
+    renderer = CursesRenderer(screen, board_height, board_width, doupdate=screen.flush)
+    state['tick'] = len(directions)
+    frame_bytes = []
+
+    def ansi_frame():
+        renderer.render(engine)
+        frame_bytes.append(screen.last_update_bytes)
+
+    results['render.ansi'] = latency(ansi_frame, calls, between=step)
+    results['render.ansi']['bytes_per_frame'] = sum(frame_bytes) / len(frame_bytes)
+    frame_bytes.clear()
+    results['render.ansi.full'] = latency(ansi_frame, 10, between=renderer.invalidate)
+    results['render.ansi.full']['bytes_per_frame'] = sum(frame_bytes) / len(frame_bytes)
+
+    # The same frames through a viewport that follows the head, on an in-memory 80x24 terminal.
+    renderer = ViewportRenderer(FakeScreen(24, 80), board_height, board_width,
+                                newpad=lambda height, width: FakeScreen(height, width), doupdate=lambda: None)
+    state['tick'] = len(directions)
+    results['render.viewport'] = latency(lambda: renderer.render(engine), calls, between=step)
+    results['render.viewport.full'] = latency(lambda: renderer.render(engine), 10, between=renderer.invalidate)
+
+    coil(engine, length, path)
+    # Rollouts of 100 ticks from the same state, on a fork and on a deep copy of the engine.
+    rollout = directions[:100]
+
+    def fork_rollout():
+        child = engine.fork()
+        for direction in rollout:
+            child.step(direction)
+
+    def copy_rollout():
+        child = copy.deepcopy(engine)
+        for direction in rollout:
+            child.step(direction)
+
+    results['engine.fork'] = latency(engine.fork, calls)
+    results['engine.fork.rollout'] = latency(fork_rollout, min(calls, 1000))
+    results['engine.deepcopy.rollout'] = latency(copy_rollout, min(calls, 100))
+
+    # Observation planes updated after each engine tick.
+    if Observation is not None:
+        state['tick'] = len(directions)
+        next_tick()
+        observation = Observation(engine)
+
+        def observe_step():
+            next_tick()
+            engine.step(state['action'])
+
+        results['observation.update'] = latency(observation.update, calls, between=observe_step)
+
+    results['check_snake_collision'] = latency(engine.check_snake_collision, calls)
+    results['place_food'] = latency(engine.place_food, calls)
+
+    def turn():
+        next_tick()
+        engine.snake.change_direction(state['action'])
+
+    state['tick'] = len(directions)
+    results['snake.move'] = latency(lambda: engine.snake.move(), calls, between=turn)
+
+    # Snake growing to the left along the first row, restarted before it leaves the board.
+    start = board_width - 4
+    cells = [y * board_width + x for y, x in path[start + length - 1:start - 1:-1]]
+    snake = Snake(initial_size=2, board_height=board_height, board_width=board_width)
+    snake.set_cells(cells)
+
+    def regrow():
+        if snake.size - length == board_width - 2:
+            snake.set_cells(cells)
+
+    results['snake.increase_body'] = latency(snake.increase_body, calls, between=regrow)
+
+    return [dict(name=name, board='{}x{}'.format(board_height, board_width), length=length, **result)
+            for name, result in results.items()]
+
+
+def _terminal_frames(stdscr, board_height, board_width, length, calls, sync):
+    """
+    Render frames on a curses screen, in the pseudo-terminal child of bench_terminal. The parent is told through
+    the sync pipes when the first full frame and then all the frames were sent, and counts the bytes in between.
+    """
+    curses.curs_set(0)
+    stdscr.resize(board_height, board_width)
+    path = serpentine(board_height, board_width)
+    engine = Engine(board_height=board_height, board_width=board_width)
+    directions = path_directions(path, length - 1)
+    renderer = CursesRenderer(stdscr, board_height, board_width)
+    state = {'tick': len(directions)}
+
+    def step():
+        if state['tick'] == len(directions) or engine.is_done():
+            coil(engine, length, path)
+            state['tick'] = 0
+            renderer.invalidate()
+            renderer.render(engine)
+        engine.step(directions[state['tick']])
+        state['tick'] += 1
+
+    step()
+    sync_write, ack_read = sync
+    os.write(sync_write, b'.')
+    os.read(ack_read, 1)
+    result = latency(lambda: renderer.render(engine), calls, between=step)
+    os.write(sync_write, json.dumps(result).encode() + b'\n')
+    os.read(ack_read, 1)
+
+
+def bench_terminal(board_height, board_width, length, calls):
+    """
+    Measure the frames of the curses renderer on a pseudo-terminal of the board size, and the bytes they send to
+    it. Games restarting at the end of the path redraw a full frame, counted in the bytes.
+
+    :param board_height: board game height
+    :type board_height: int
+    :param board_width: board game width
+    :type board_width: int
+    :param length: snake length
+    :type length: int
+    :param calls: number of frames
+    :type calls: int
+    :return: result with the frame latency and the bytes per frame
+    """
+    sync_read, sync_write = os.pipe()
+    ack_read, ack_write = os.pipe()
+    pid, fd = pty.fork()
+    if pid == 0:
+        try:
+            os.environ['TERM'] = 'xterm'
+            fcntl.ioctl(0, termios.TIOCSWINSZ, struct.pack('HHHH', board_height, board_width, 0, 0))
+            curses.wrapper(_terminal_frames, board_height, board_width, length, calls, (sync_write, ack_read))
+        finally:
+            os._exit(0)
+    os.close(sync_write)
+    os.close(ack_read)
+
+    received = [0]
+    messages = bytearray()
+
+    def read_until(condition):
+        while not condition():
+            ready, _, _ = select.select([fd, sync_read], [], [])
+            if fd in ready:
+                received[0] += len(os.read(fd, 65536))
+            if sync_read in ready:
+                messages.extend(os.read(sync_read, 65536))
+        # Everything written before the message is already in the terminal.
+        while select.select([fd], [], [], 0.05)[0]:
+            received[0] += len(os.read(fd, 65536))
+
+    read_until(lambda: messages)
+    start = received[0]
+    os.write(ack_write, b'.')
+    read_until(lambda: messages.endswith(b'\n'))
+    frames = received[0] - start
+    os.write(ack_write, b'.')
+    try:
+        while os.read(fd, 65536):
+            pass
+    except OSError:
+        pass
+    os.waitpid(pid, 0)
+    for descriptor in [fd, sync_read, ack_write]:
+        os.close(descriptor)
+
+    result = json.loads(messages[1:].decode())
+    result['bytes_per_frame'] = frames / calls
+    return dict(name='render.curses.tty', board='{}x{}'.format(board_height, board_width), length=length, **result)
+
+
+def bench_memory(board_height, board_width, length, ticks):
+    """
+    Measure the peak memory allocated by creating a game with a snake of a given length and playing it.
+
+    :param board_height: board game height
+    :type board_height: int
+    :param board_width: board game width
+    :type board_width: int
+    :param length: snake length
+    :type length: int
+    :param ticks: number of ticks to play
+    :type ticks: int
+    :return: result with the peak memory in kilobytes
+    """
+    path = serpentine(board_height, board_width)
+    directions = path_directions(path, length - 1, length - 1 + ticks)
+    tracemalloc.start()
+    try:
+        engine = Engine(board_height=board_height, board_width=board_width)
+        coil(engine, length, path)
+        for direction in directions:
+            engine.step(direction)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {'name': 'memory', 'board': '{}x{}'.format(board_height, board_width), 'length': length,
+            'peak_kb': peak / 1024}
+
+
+def bench_footprint(num_games, board_height=20, board_width=40):
+    """
+    Measure the memory held per game by many live snakes and foods, each food with its own random number generator.
+
+    :param num_games: number of games
+    :type num_games: int
+    :param board_height: board game height
+    :type board_height: int
+    :param board_width: board game width
+    :type board_width: int
+    :return: result with the bytes per game
+    """
+    tracemalloc.start()
+    try:
+        games = [(Snake(board_height=board_height, board_width=board_width),
+                  Food(board_height, board_width, GameRandom(seed))) for seed in range(num_games)]
+        current, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {'name': 'footprint', 'board': '{}x{}'.format(board_height, board_width), 'length': games[0][0].size,
+            'games': num_games, 'bytes_per_game': current / num_games}
+
+
+def bench_arena(num_snakes, calls, board_height=200, board_width=200):
+    """
+    Measure the steps of an arena with many snakes turning at random. The arena restarts once half the snakes died.
+    The length column of the result holds the number of snakes.
+
+    :param num_snakes: number of snakes
+    :type num_snakes: int
+    :param calls: number of timed steps
+    :type calls: int
+    :param board_height: board game height
+    :type board_height: int
+    :param board_width: board game width
+    :type board_width: int
+    :return: result with the latency of a step
+    """
+    arena = Arena(board_height, board_width, num_snakes=num_snakes, num_food=num_snakes, seed=0)
+    rng = GameRandom(0)
+    directions = list(MOVES) + [None] * 12
+    state = {}
+
+    def next_tick():
+        if len(arena.alive) < num_snakes // 2:
+            arena.reset(arena.seed + 1)
+        state['actions'] = [rng.choice(directions) for _ in range(num_snakes)]
+
+    result = latency(lambda: arena.step(state['actions']), calls, between=next_tick)
+    return dict(name='arena.step', board='{}x{}'.format(board_height, board_width), length=num_snakes, **result)
+
+
+def bench_store(num_results):
+    """
+    Measure adding game results to a score store, and the rate at which the writer thread stores them.
+
+    :param num_results: number of results
+    :type num_results: int
+    :return: result with the latency of adding a result and the results written per second
+    """
+    results = [GameResult(seed, 'greedy', seed % 100, seed % 100 + 3, seed, 'LOST') for seed in range(num_results)]
+    with tempfile.TemporaryDirectory() as directory:
+        with ScoreStore(os.path.join(directory, 'scores.db')) as store:
+            state = {'i': 0}
+
+            def add():
+                store.add(results[state['i']])
+                state['i'] += 1
+
+            result = latency(add, num_results)
+            store.flush()
+            # The write rate, without timing each call.
+            start = time.perf_counter()
+            for game_result in results:
+                store.add(game_result)
+            store.flush()
+            result['written_per_s'] = num_results / (time.perf_counter() - start)
+    return dict(name='store.add', board='-', length=0, **result)
+
+
+def bench_export(board_height=12, board_width=16, seed=0):
+    """
+    Measure exporting a recorded autopilot game to asciicast and GIF, with the rate of frames and the peak memory.
+    The game is timed like the game loop, so the speedup is the game duration divided by the export time.
+
+    :param board_height: board game height
+    :type board_height: int
+    :param board_width: board game width
+    :type board_width: int
+    :param seed: game seed
+    :type seed: int
+    :return: result with the time per frame, the speedup over real time and the peak memory in kilobytes
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'game.snkr')
+        engine = Engine(board_height=board_height, board_width=board_width, seed=seed)
+        agent = AutopilotAgent()
+        agent.reset(board_height, board_width)
+        recorder = Recorder(path, engine)
+        state, done = engine.get_state(), False
+        while not done:
+            state, _, done = engine.step(agent.act(state))
+        recorder.close()
+
+        writers = [AsciicastWriter(os.path.join(directory, 'game.cast'), board_height, board_width),
+                   GifWriter(os.path.join(directory, 'game.gif'), board_height, board_width)]
+        tracemalloc.start()
+        try:
+            start = time.perf_counter()
+            frames = export(path, writers)
+            for writer in writers:
+                writer.close()
+            elapsed = time.perf_counter() - start
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        duration = writers[0].end
+    return {'name': 'export', 'board': '{}x{}'.format(board_height, board_width), 'length': engine.snake.size,
+            'frames': frames, 'us_per_frame': elapsed / frames * 1e6, 'speedup': duration / elapsed,
+            'peak_kb': peak / 1024}
+
+
+def bench_map(board_height, board_width, calls, seed=0):
+    """
+    Measure the wall lookups and moves of a map with random obstacles, open edges and portals, loaded from its
+    memory-mapped binary form, along with the time to compile and load it.
+
+    :param board_height: board game height
+    :type board_height: int
+    :param board_width: board game width
+    :type board_width: int
+    :param calls: number of timed calls of each function
+    :type calls: int
+    :param seed: seed of the obstacle and cell draws
+    :type seed: int
+    :return: list of results with the latency of a wall lookup and of a move from an edge cell
+    """
+    rng = GameRandom(seed)
+    rows = [[' ' if rng.random() < 0.9 else '#' for _ in range(board_width)] for _ in range(board_height)]
+    rows[1][1], rows[-2][-2] = 'a', 'a'
+    start = time.perf_counter()
+    game_map = parse_map('\n'.join(''.join(row) for row in rows))
+    compile_s = time.perf_counter() - start
+    board = '{}x{}'.format(board_height, board_width)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'map.snkm')
+        game_map.save(path)
+        start = time.perf_counter()
+        game_map = load_map(path)
+        load_s = time.perf_counter() - start
+        cells = [rng.randrange(board_height * board_width) for _ in range(calls)]
+        edges = [rng.randrange(board_height) * board_width for _ in range(calls)]
+        state = {'i': 0}
+
+        def next_cell():
+            state['i'] += 1
+
+        results = [
+            dict(name='map.is_wall', board=board, length=0, compile_s=compile_s, load_s=load_s,
+                 **latency(lambda: game_map.is_wall(cells[state['i'] - 1]), calls, between=next_cell)),
+        ]
+        state['i'] = 0
+        results.append(dict(name='map.move', board=board, length=0,
+                            **latency(lambda: game_map.move(edges[state['i'] - 1], 1), calls, between=next_cell)))
+        game_map.close()
+    return results
+
+
+def bench_events(calls, board_height=20, board_width=40):
+    """
+    Measure the headless steps of games observed by an event stream, at each level, against the steps alone. The
+    snake turns at random and the game restarts when it is over.
+
+    :param calls: number of timed steps of each level
+    :type calls: int
+    :param board_height: board game height
+    :type board_height: int
+    :param board_width: board game width
+    :type board_width: int
+    :return: list of results with the latency of a step and its observation, and the events written and dropped
+    """
+    results = []
+    for level in [None, 'info', 'debug']:
+        engine = Engine(board_height=board_height, board_width=board_width, seed=0)
+        stream = EventStream(NullOutput(), level=level) if level is not None else None
+        rng = GameRandom(0)
+        directions = list(MOVES) + [None] * 12
+
+        def step():
+            if engine.step(rng.choice(directions))[2]:
+                if stream is not None:
+                    stream.observe(engine)
+                engine.reset(engine.seed + 1)
+            if stream is not None:
+                stream.observe(engine)
+
+        result = latency(step, calls)
+        counters = {}
+        if stream is not None:
+            stream.close()
+            counters = stream.stats()
+        results.append(dict(name='events.{}'.format(level or 'off'), board='{}x{}'.format(board_height, board_width),
+                            length=0, **result, **counters))
+    return results
+
+
+def bench_vector(num_games, ticks, board_height=20, board_width=40, seed=0):
+    """
+    Measure the ticks per second of a batch of games advanced by a vector engine against a loop over as many engines,
+    both on the same board with the same policy: the snakes turn at random and games restart when they are over.
+    The length column of the result holds the number of games.
+
+    :param num_games: number of games
+    :type num_games: int
+    :param ticks: number of timed steps of the batch
+    :type ticks: int
+    :param board_height: board game height
+    :type board_height: int
+    :param board_width: board game width
+    :type board_width: int
+    :param seed: seed of the games and of the policy
+    :type seed: int
+    :return: result with the game ticks per second of both engines and their ratio, or None without NumPy
+    """
+    if VectorEngine is None:
+        return None
+    rng = np.random.default_rng(seed)
+    # Keep the direction on 12 out of 16 ticks, -1 for the vector engine and None for the engine.
+    actions = rng.integers(-12, 4, size=(ticks, num_games)).clip(-1, 3)
+    directions = [None] + VECTOR_DIRECTIONS
+
+    vector = VectorEngine(num_games, board_height=board_height, board_width=board_width, seed=seed)
+    start = time.perf_counter()
+    for tick_actions in actions:
+        vector.step(tick_actions)
+    vector_s = time.perf_counter() - start
+
+    engines = [Engine(board_height=board_height, board_width=board_width, seed=seed + game)
+               for game in range(num_games)]
+    engine_actions = [[directions[action + 1] for action in tick_actions] for tick_actions in actions.tolist()]
+    start = time.perf_counter()
+    for tick_actions in engine_actions:
+        for engine, action in zip(engines, tick_actions):
+            if engine.step(action)[2]:
+                engine.reset(engine.seed + num_games)
+    engine_s = time.perf_counter() - start
+
+    vector_ticks_per_s = num_games * ticks / vector_s
+    engine_ticks_per_s = num_games * ticks / engine_s
+    return {'name': 'vector.step', 'board': '{}x{}'.format(board_height, board_width), 'length': num_games,
+            'us_per_tick': 1e6 / vector_ticks_per_s, 'ticks_per_s': vector_ticks_per_s,
+            'engine_ticks_per_s': engine_ticks_per_s, 'speedup': vector_ticks_per_s / engine_ticks_per_s}
+
+
+def commit():
+    """
+    Getter for the current git commit, if any.
+
+    :return: commit hash or None
+    """
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                              check=True, universal_newlines=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(calls, board_sizes=BOARD_SIZES, lengths=LENGTHS):
+    """
+    Run the whole benchmark suite.
+
+    :param calls: number of timed calls of each function
+    :type calls: int
+    :param board_sizes: board heights and widths
+    :type board_sizes: list
+    :param lengths: snake lengths
+    :type lengths: list
+    :return: dictionary with the environment and the list of results
+    """
+    results = [bench_footprint(100000), bench_store(100000), bench_export()]
+    results.extend(bench_events(calls))
+    results.extend(bench_arena(num_snakes, calls) for num_snakes in [10, 100, 1000])
+    vector = bench_vector(1000, max(calls // 10, 10))
+    if vector is not None:
+        results.append(vector)
+    for board_height, board_width in board_sizes:
+        results.extend(bench_map(board_height, board_width, calls))
+        interior = (board_height - 2) * (board_width - 2)
+        for length in [length for length in lengths if 2 <= length <= interior // 2]:
+            print('{}x{}, length {}'.format(board_height, board_width, length), file=sys.stderr)
+            results.extend(bench_board(board_height, board_width, length, calls))
+            if board_height * board_width <= MAX_TERMINAL_CELLS:
+                results.append(bench_terminal(board_height, board_width, length, min(calls, 1000)))
+            results.append(bench_memory(board_height, board_width, length, 1000))
+    return {'commit': commit(), 'python': platform.python_version(), 'implementation': platform.python_implementation(),
+            'calls': calls, 'results': results}
+
+
+def compare(base, new, threshold=1.2):
+    """
+    Print the median latency change of every benchmark present in two result files.
+
+    :param base: base results, as returned by run
+    :type base: dict
+    :param new: new results, as returned by run
+    :type new: dict
+    :param threshold: ratio above which a benchmark is flagged as a regression
+    :type threshold: float
+    :return: number of regressions
+    """
+    base_results = {(r['name'], r['board'], r['length']): r for r in base['results']}
+    regressions = 0
+    print('{:<24} {:>10} {:>8} {:>12} {:>12} {:>7}'.format('benchmark', 'board', 'length', 'base', 'new', 'ratio'))
+    for result in new['results']:
+        key = (result['name'], result['board'], result['length'])
+        if key not in base_results:
+            continue
+        metrics = {'memory': 'peak_kb', 'footprint': 'bytes_per_game', 'export': 'us_per_frame',
+                   'vector.step': 'us_per_tick'}
+        metric = metrics.get(result['name'], 'p50_us')
+        ratio = result[metric] / max(base_results[key][metric], 1e-9)
+        flag = ' *' if ratio > threshold else ''
+        regressions += ratio > threshold
+        print('{:<24} {:>10} {:>8} {:>12.3f} {:>12.3f} {:>6.2f}x{}'.format(
+            key[0], key[1], key[2], base_results[key][metric], result[metric], ratio, flag))
+    return regressions
+
+
+def print_results(report):
+    """
+    Print a results table.
+
+    :param report: results, as returned by run
+    :type report: dict
+    """
+    print('{:<24} {:>10} {:>8} {:>12} {:>10} {:>10} {:>10} {:>10} {:>10}'.format(
+        'benchmark', 'board', 'length', 'calls/s', 'p50 us', 'p90 us', 'p99 us', 'peak kB', 'B/frame'))
+    for r in report['results']:
+        if r['name'] == 'footprint':
+            print('{:<24} {:>10} {:>8} {:>.0f} bytes per game, {} games'.format(
+                r['name'], r['board'], r['length'], r['bytes_per_game'], r['games']))
+        elif r['name'] == 'store.add':
+            print('{:<24} {:>10} {:>8} {:>.0f} results written per second, add p50 {:.3f} us, p99 {:.3f} us'.format(
+                r['name'], r['board'], r['length'], r['written_per_s'], r['p50_us'], r['p99_us']))
+        elif r['name'] == 'export':
+            print('{:<24} {:>10} {:>8} {:.1f} us per frame, {} frames, {:.0f}x real time, peak {:.0f} kB'.format(
+                r['name'], r['board'], r['length'], r['us_per_frame'], r['frames'], r['speedup'], r['peak_kb']))
+        elif r['name'] == 'vector.step':
+            print('{:<24} {:>10} {:>8} {:>.0f} game ticks/s, engine loop {:.0f} game ticks/s, {:.1f}x'.format(
+                r['name'], r['board'], r['length'], r['ticks_per_s'], r['engine_ticks_per_s'], r['speedup']))
+        elif r['name'] == 'memory':
+            print('{:<24} {:>10} {:>8} {:>12} {:>10} {:>10} {:>10} {:>10.0f}'.format(
+                r['name'], r['board'], r['length'], '', '', '', '', r['peak_kb']))
+        else:
+            frame_bytes = '{:.1f}'.format(r['bytes_per_frame']) if 'bytes_per_frame' in r else ''
+            print('{:<24} {:>10} {:>8} {:>12.0f} {:>10.3f} {:>10.3f} {:>10.3f} {:>10} {:>10}'.format(
+                r['name'], r['board'], r['length'], r['calls_per_s'], r['p50_us'], r['p90_us'], r['p99_us'], '',
+                frame_bytes))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the snake engine and renderer hot paths.')
+    parser.add_argument('--calls', type=int, default=10000, help='timed calls of each function')
+    parser.add_argument('--quick', action='store_true', help='only the smallest board, with fewer calls')
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    parser.add_argument('--compare', help='JSON results of a previous run to compare against')
+    args = parser.parse_args()
+
+    if args.quick:
+        report = run(min(args.calls, 1000), board_sizes=BOARD_SIZES[:1])
+    else:
+        report = run(args.calls)
+    print_results(report)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            print()
+            regressions = compare(json.load(f), report)
+        if regressions:
+            print('{} benchmarks slower than the base'.format(regressions), file=sys.stderr)
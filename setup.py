@@ -20,6 +20,7 @@ REQUIRED = [
 ]
 
 EXTRAS = {
+    'vector': ['numpy'],
 }
 
 here = os.path.abspath(os.path.dirname(__file__))
@@ -2,16 +2,66 @@
 Copyright 2019
 Author: Joao Carvalho <joao.ac.carvalho@gmail.com>
 """
+import argparse
 import curses
 # from snake.game import Game
 from snake.game import Game
+from snake import events, export, loadgen, maps, replay, server, store, tournament
+from snake.agents import AGENTS, load_agent
 
 
-def play_game(stdsrc):
-    snake_game = Game(stdsrc)
+def play_game(stdsrc, board_height=20, board_width=40, record=None, agent=None, renderer='curses', profile=None,
+              overlay=False, scores=None, game_map=None, event_stream=None):
+    snake_game = Game(stdsrc, board_height=board_height, board_width=board_width, record=record,
+                      agent=load_agent(agent) if agent is not None else None, renderer=renderer, profile=profile,
+                      overlay=overlay, scores=scores, game_map=game_map, events=event_stream)
     snake_game.play()
 
 
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='snake', description='Snake game in your terminal.')
+    parser.add_argument('--board-height', type=int, default=20, help='board height, it can exceed the terminal')
+    parser.add_argument('--board-width', type=int, default=40, help='board width, it can exceed the terminal')
+    parser.add_argument('--record', help='record the game to a replay file')
+    parser.add_argument('--agent', help='let an agent play the game: {} or module:Class'.format(', '.join(AGENTS)))
+    parser.add_argument('--renderer', choices=['curses', 'ansi'], default='curses',
+                        help='draw the game with curses or with buffered ANSI escape sequences')
+    parser.add_argument('--profile', help='write the time spent in each phase of the game loop to a JSON file')
+    parser.add_argument('--overlay', action='store_true', help='show the tick rate and phase times while playing')
+    parser.add_argument('--scores', help='add the result of the game to a score database')
+    parser.add_argument('--map', help='play on a map file, in text or binary form, its size replaces the board size')
+    events.add_arguments(parser)
+    subparsers = parser.add_subparsers(dest='command')
+    tournament.add_arguments(subparsers.add_parser('tournament', help='evaluate agents on headless games'))
+    replay.add_arguments(subparsers.add_parser('replay', help='verify or describe replay files'))
+    export.add_arguments(subparsers.add_parser('export', help='export a replay file to asciicast or GIF'))
+    server.add_arguments(subparsers.add_parser('serve', help='host game sessions over TCP'))
+    loadgen.add_arguments(subparsers.add_parser('loadgen', help='play many sessions on a game server'))
+    store.add_arguments(subparsers.add_parser('scores', help='show the high scores of a score database'))
+    maps.add_arguments(subparsers.add_parser('map', help='compile a map file to its binary form'))
+    args = parser.parse_args(argv)
+
+    if args.command == 'tournament':
+        tournament.main(args)
+    elif args.command == 'replay':
+        replay.main(args)
+    elif args.command == 'export':
+        export.main(args)
+    elif args.command == 'serve':
+        server.main(args)
+    elif args.command == 'loadgen':
+        loadgen.main(args)
+    elif args.command == 'scores':
+        store.main(args)
+    elif args.command == 'map':
+        maps.main(args)
+    else:
+        # Start game.
+        game_map = maps.load_map(args.map) if args.map is not None else None
+        curses.wrapper(play_game, board_height=args.board_height, board_width=args.board_width, record=args.record,
+                       agent=args.agent, renderer=args.renderer, profile=args.profile, overlay=args.overlay,
+                       scores=args.scores, game_map=game_map, event_stream=events.from_arguments(args))
+
+
 if __name__ == '__main__':
-    # Start game.
-    curses.wrapper(play_game)
+    main()
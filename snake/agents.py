@@ -0,0 +1,290 @@
+"""
+Copyright 2019
+Author: Joao Carvalho <joao.ac.carvalho@gmail.com>
+"""
+import importlib
+from array import array
+from .autopilot import DistanceField, cycle_positions
+from .components import OPPOSITE
+from .rng import GameRandom
+
+
+# Position offset of a move in each direction.
+MOVES = {'UP': (-1, 0), 'DOWN': (1, 0), 'LEFT': (0, -1), 'RIGHT': (0, 1)}
+
+
+class Agent:
+    """
+    Base class of the computer players. An agent receives the game state on every tick and returns the new head
+    direction of the snake.
+    """
+
+    def reset(self, board_height, board_width, seed=None):
+        """
+        Called at the start of every game.
+
+        :param board_height: board game height
+        :type board_height: int
+        :param board_width: board game width
+        :type board_width: int
+        :param seed: seed of the game, agents with random behaviour should seed from it
+        :type seed: int
+        """
+        self.board_height = board_height
+        self.board_width = board_width
+
+    def act(self, state):
+        """
+        Choose the next direction of the snake.
+
+        :param state: game state, as returned by Engine.step
+        :type state: State
+        :return: 'UP', 'DOWN', 'LEFT', 'RIGHT' or None to keep the current direction
+        """
+        raise NotImplementedError
+
+    def is_safe(self, state, y, x):
+        """
+        Checks if moving the head to a position does not immediately lose the game. The tail is considered free,
+        since it moves away in the same tick.
+
+        :param state: game state
+        :type state: State
+        :param y: y position
+        :type y: int
+        :param x: x position
+        :type x: int
+        :return: True if the position is neither a wall nor the snake body
+        """
+        if y <= 0 or y >= self.board_height - 1 or x <= 0 or x >= self.board_width - 1:
+            return False
+        return not state.snake.is_occupied(y, x) or (y, x) == state.snake.get_tail_position()
+
+
+class RandomAgent(Agent):
+    """
+    Agent that turns to a random safe direction.
+    """
+
+    def reset(self, board_height, board_width, seed=None):
+        super().reset(board_height, board_width, seed)
+        self.rng = GameRandom(seed)
+
+    def act(self, state):
+        h_y, h_x = state.snake.get_head_position()
+        directions = [d for d, (dy, dx) in MOVES.items() if self.is_safe(state, h_y + dy, h_x + dx)]
+        return self.rng.choice(directions) if directions else None
+
+
+class GreedyAgent(Agent):
+    """
+    Agent that moves to the safe neighbour position closest to the food.
+    """
+
+    def act(self, state):
+        h_y, h_x = state.snake.get_head_position()
+        f_y, f_x = state.food
+        best, best_distance = None, None
+        for direction, (dy, dx) in MOVES.items():
+            y, x = h_y + dy, h_x + dx
+            if direction == OPPOSITE[state.snake.head_direction] or not self.is_safe(state, y, x):
+                continue
+            distance = abs(f_y - y) + abs(f_x - x)
+            if best_distance is None or distance < best_distance:
+                best, best_distance = direction, distance
+        return best
+
+
+class AutopilotAgent(Agent):
+    """
+    Agent that reaches the food along shortcuts of a Hamiltonian cycle of the board.
+    While the snake body follows the cycle order from the tail to the head, every cell after the head and before the
+    tail in that order is free, and moving the head to any of them keeps the order. Among those moves, the agent
+    takes the one closest to the food in a distance field that goes around the snake. The field is cached for each
+    food position and built incrementally, a bounded number of cells per tick, the Manhattan distance is used for
+    cells it did not reach yet. If the body does not follow the cycle order, as at the start of a game, the agent
+    moves to the safe cell with the longest way to the tail along the cycle until it does.
+    The snake grows by extending its tail away from the part before it, so the agent avoids the moves after which
+    eating would put the new part on the head or leave no free cell ahead of it. Near the end of a game, a body that
+    follows the cycle can be left without such a move, and on boards with an odd number of interior rows and columns
+    the cycle skips a cell, so the agent wins most games but may still trap itself on a nearly full board.
+    """
+
+    def __init__(self, budget=100):
+        """
+        :param budget: maximum number of distance field cells computed per tick
+        :type budget: int
+        """
+        self.budget = budget
+        self.board_height = self.board_width = None
+
+    def reset(self, board_height, board_width, seed=None):
+        if (board_height, board_width) != (self.board_height, self.board_width):
+            self.positions, self.period = cycle_positions(board_height, board_width)
+            # Flattened cell at each step of the cycle.
+            self.order = array('l', [0]) * (self.period // 2)
+            for cell, position in enumerate(self.positions):
+                if position >= 0 and position % 2 == 0:
+                    self.order[position // 2] = cell
+            self.n_cells = sum(1 for position in self.positions if position >= 0)
+            self.field = DistanceField(board_height, board_width)
+            self.steps = [(direction, dy * board_width + dx) for direction, (dy, dx) in MOVES.items()]
+        super().reset(board_height, board_width, seed)
+        self.field.target = None
+        self.food = None
+        self.tail = None
+        self.score = 0
+
+    def act(self, state):
+        snake = state.snake
+        width = self.board_width
+        h_y, h_x = snake.get_head_position()
+        t_y, t_x = snake.get_tail_position()
+        head, tail = h_y * width + h_x, t_y * width + t_x
+        food = state.food[0] * width + state.food[1]
+
+        # Update the distance field with the new food or the cell vacated by the tail.
+        if food != self.food:
+            self.field.reset(food)
+        elif self.tail is not None and not snake.is_cell_occupied(self.tail):
+            self.field.free(self.tail)
+        self.field.expand(snake.is_cell_occupied, self.budget)
+        # After eating, the tail is a new part that leaves at the next move, the cycle order starts before it.
+        ordered_tail = tail
+        if state.score > self.score and snake.size > 2:
+            ordered_tail = snake.get_body_position(snake.size - 2)
+            ordered_tail = ordered_tail[0] * width + ordered_tail[1]
+        self.food, self.tail, self.score = food, tail, state.score
+
+        positions, period = self.positions, self.period
+        head_position = positions[head]
+        tail_gap = (positions[ordered_tail] - head_position) % period
+        food_gap = (positions[food] - head_position) % period
+        f_y, f_x = state.food
+        best, best_key, fallbacks = None, None, []
+        for direction, step in self.steps:
+            cell = head + step
+            position = positions[cell]
+            if position < 0 or (cell != tail and snake.is_cell_occupied(cell)):
+                continue
+            if cell == food and snake.size + 1 >= self.n_cells:
+                # Eating the last free cell wins the game.
+                return direction
+            gap = (position - head_position) % period
+            # Ticks until the food is eaten, following the cycle after this move.
+            moves = 1 + ((food_gap - gap) % period + 1) // 2
+            starves = not self.eats_safely(snake, cell, food, moves)
+            if cell == food and starves:
+                continue
+            # The tail can be followed into its cell, unless it is the new part that comes after the cycle order.
+            if 0 < gap < tail_gap or cell == tail == ordered_tail:
+                distance = self.field.get(cell)
+                if distance is None:
+                    y, x = divmod(cell, width)
+                    distance = abs(f_y - y) + abs(f_x - x)
+                # Moves after which the snake cannot eat safely by following the cycle are avoided while possible.
+                key = (starves, gap > food_gap, distance, -gap)
+                if best_key is None or key < best_key:
+                    best, best_key = direction, key
+            else:
+                fallbacks.append((direction, cell))
+        if best is not None or not fallbacks:
+            return best
+        # Out of the cycle order, move to the cell with more room around it.
+        limit = min(2 * snake.size, self.budget * 10)
+        return max(fallbacks, key=lambda fallback: self.free_space(snake, fallback[1], limit))[0]
+
+    def free_space(self, snake, cell, limit):
+        """
+        Count the free cells reachable from a cell, up to a limit.
+
+        :param snake: the snake
+        :type snake: Snake
+        :param cell: flattened start cell
+        :type cell: int
+        :param limit: maximum number of cells to count
+        :type limit: int
+        :return: number of reachable cells, including the start one
+        """
+        positions = self.positions
+        seen = {cell}
+        pending = [cell]
+        while pending and len(seen) < limit:
+            current = pending.pop()
+            for _, step in self.steps:
+                neighbour = current + step
+                if neighbour not in seen and positions[neighbour] >= 0 and not snake.is_cell_occupied(neighbour):
+                    seen.add(neighbour)
+                    pending.append(neighbour)
+        return len(seen)
+
+    def eats_safely(self, snake, cell, food, moves):
+        """
+        Checks if the snake can eat the food and keep following the cycle, moving to a cell and then along the cycle.
+        The snake grows by extending its tail away from the part before it, the new part must not be the head, and it
+        stays until the next move, so a free cell must be left between the head and the tail in the cycle order,
+        unless the board is full. After a number of moves, the tail is the body part, or the cell of the path, as many
+        parts after the current tail.
+
+        :param snake: the snake
+        :type snake: Snake
+        :param cell: flattened cell the head moves to
+        :type cell: int
+        :param food: flattened food cell
+        :type food: int
+        :param moves: number of moves until the head eats the food, the first one to cell
+        :type moves: int
+        :return: True if eating neither grows into the head nor leaves the head without a move in the cycle order
+        """
+        size = snake.size
+        index = self.positions[cell] // 2
+        parts = []
+        for i in (moves, moves + 1):
+            if i < size:
+                y, x = snake.get_body_position(size - 1 - i)
+                parts.append(y * self.board_width + x)
+            elif i == size:
+                parts.append(cell)
+            else:
+                parts.append(self.order[(index + i - size) % len(self.order)])
+        if 2 * parts[0] - parts[1] == food:
+            return False
+        return (self.positions[parts[0]] - self.positions[food]) % self.period > 2 or size + 1 >= len(self.order)
+
+
+# Agents that can be selected by name.
+AGENTS = {
+    'random': RandomAgent,
+    'greedy': GreedyAgent,
+    'autopilot': AutopilotAgent,
+}
+
+
+def load_agent(spec):
+    """
+    Create an agent from its name or from a 'module:Class' import path.
+
+    :param spec: agent name or import path
+    :type spec: str
+    :return: a new agent
+    """
+    if spec in AGENTS:
+        return AGENTS[spec]()
+    module_name, _, class_name = spec.partition(':')
+    if not class_name:
+        raise ValueError("Unknown agent '{}', use one of {} or 'module:Class'".format(spec, ', '.join(AGENTS)))
+    return getattr(importlib.import_module(module_name), class_name)()
+
+
+def agent_name(agent):
+    """
+    Name of an agent, as accepted by load_agent.
+
+    :param agent: agent
+    :type agent: Agent
+    :return: the agent name, or its 'module:Class' import path
+    """
+    for name, cls in AGENTS.items():
+        if type(agent) is cls:
+            return name
+    return '{}:{}'.format(type(agent).__module__, type(agent).__qualname__)
@@ -0,0 +1,228 @@
+"""
+Copyright 2019
+Author: Joao Carvalho <joao.ac.carvalho@gmail.com>
+"""
+import random
+from array import array
+from .components import Snake, FreeCells
+from .rng import GameRandom
+
+
+# Content of a grid cell that is not part of a snake, snake parts are the snake index plus one.
+EMPTY = 0
+WALL = -1
+FOOD = -2
+
+
+class Arena:
+
+    def __init__(self, board_height=40, board_width=80, num_snakes=2, num_food=1, initial_size=3, seed=None):
+        """
+        This class implements the rules of a board shared by many snakes and food items. All snakes move at once on
+        every step. A snake dies if its head hits a wall or the body of any snake, including its own, after the tails
+        moved away. If several heads enter the same cell, the longest snake survives and the others die, all of them
+        if there is no single longest. A snake that eats grows by keeping its tail in place, and a new food item is
+        placed for each one eaten. The bodies of dead snakes are removed from the board.
+        Every cell of the board is kept in a single grid, with its wall, food or snake owner, updated incrementally
+        as the snakes move: each head resolves its collisions and food with a single grid lookup, and head to head
+        collisions with a dictionary of the new heads. A step takes time proportional to the number of snakes alive,
+        plus the length of the snakes that die, never to the total length of the snakes or to their number squared.
+        Food is placed through an index of the free positions, in constant time. The snakes keep no occupancy of
+        their own, the grid resolves collisions with their own bodies too, so the memory of the arena does not grow
+        with the number of long snakes times the board size.
+
+        :param board_height: board game height
+        :type board_height: int
+        :param board_width: board game width
+        :type board_width: int
+        :param num_snakes: number of snakes
+        :type num_snakes: int
+        :param num_food: number of food items on the board
+        :type num_food: int
+        :param initial_size: initial size of the snakes
+        :type initial_size: int
+        :param seed: seed for the arena random number generator, None to draw one from the system
+        :type seed: int
+        """
+        self.board_height = board_height
+        self.board_width = board_width
+        self.num_snakes = num_snakes
+        self.num_food = num_food
+        self.initial_size = initial_size
+        self.steps = (1, -1, -board_width, board_width)
+
+        self.reset(seed)
+
+    def reset(self, seed=None):
+        """
+        Start a new game. Each snake is placed horizontally at a random free position, heading to the RIGHT.
+
+        :param seed: seed for the arena random number generator, None to draw one from the system
+        :type seed: int
+        """
+        if seed is None:
+            seed = random.SystemRandom().randrange(2 ** 63)
+        self.seed = seed
+        self.rng = GameRandom(seed)
+        self.ticks = 0
+        height, width = self.board_height, self.board_width
+
+        self.grid = array('i', [EMPTY]) * (height * width)
+        self.grid[:width] = array('i', [WALL]) * width
+        self.grid[-width:] = array('i', [WALL]) * width
+        for y in range(1, height - 1):
+            self.grid[y * width] = WALL
+            self.grid[y * width + width - 1] = WALL
+        self.free_cells = FreeCells(height, width)
+        self.food = set()
+
+        self.snakes = []
+        for i in range(self.num_snakes):
+            y, x = self._spawn_position()
+            snake = Snake(y, x, initial_size=self.initial_size, board_height=height, board_width=width,
+                          indexing=False)
+            for cell in snake.get_cells():
+                self.grid[cell] = i + 1
+                self.free_cells.remove(*divmod(cell, width))
+            self.snakes.append(snake)
+        self.alive = list(range(self.num_snakes))
+        self.scores = [0] * self.num_snakes
+        for _ in range(self.num_food):
+            self.place_food()
+
+    def _spawn_position(self, attempts=1000):
+        """
+        Random head position of a new snake, with free positions for its whole body on its left.
+
+        :param attempts: number of random positions tried
+        :type attempts: int
+        :return: y and x head position
+        """
+        for _ in range(attempts):
+            position = self.free_cells.sample(self.rng)
+            if position is None:
+                break
+            y, x = position
+            if all(self.free_cells.is_free(y, x - i) for i in range(self.initial_size)):
+                return y, x
+        raise ValueError('No room for {} snakes on a {}x{} board'.format(self.num_snakes, self.board_height,
+                                                                         self.board_width))
+
+    def place_food(self):
+        """
+        Place a food item in a random free position.
+
+        :return: True if the food was placed, False if there are no free positions left
+        """
+        position = self.free_cells.sample(self.rng)
+        if position is None:
+            return False
+        self.free_cells.remove(*position)
+        cell = position[0] * self.board_width + position[1]
+        self.grid[cell] = FOOD
+        self.food.add(cell)
+        return True
+
+    def owner(self, y, x):
+        """
+        Getter for the snake at a position.
+
+        :param y: y position
+        :type y: int
+        :param x: x position
+        :type x: int
+        :return: index of the snake with a body part at the position, None if there is none
+        """
+        value = self.grid[y * self.board_width + x]
+        return value - 1 if value > 0 else None
+
+    def food_positions(self):
+        """
+        Getter for the food positions.
+
+        :return: sorted list of y and x positions
+        """
+        return sorted(divmod(cell, self.board_width) for cell in self.food)
+
+    def is_done(self):
+        """
+        Checks if every snake died.
+
+        :return: True if there are no snakes alive, False otherwise
+        """
+        return not self.alive
+
+    def step(self, actions=None):
+        """
+        Advance the game by one tick: change the direction of the snakes, move them all and resolve the collisions.
+
+        :param actions: new head direction of each snake, by snake index, 'UP', 'DOWN', 'LEFT', 'RIGHT' or None to
+                        keep its direction. None keeps the direction of every snake
+        :type actions: list
+        :return: the score gained by each snake in this tick, the indexes of the snakes that died and whether every
+                 snake died
+        """
+        grid = self.grid
+        snakes = self.snakes
+        free_cells = self.free_cells
+        width = self.board_width
+        rewards = [0] * self.num_snakes
+
+        # Move every snake, vacating the tails of the ones that do not eat.
+        heads = {}
+        for i in self.alive:
+            snake = snakes[i]
+            if actions is not None and actions[i] is not None:
+                snake.change_direction(actions[i])
+            head = snake.cells[snake.head] + self.steps[snake.direction]
+            if grid[head] == FOOD:
+                # Growing appends a tail that the move removes right away, the tail stays in place.
+                snake.increase_body()
+            else:
+                tail = snake.cells[(snake.head + snake.size - 1) & snake.mask]
+                grid[tail] = EMPTY
+                free_cells.add(*divmod(tail, width))
+            snake.move()
+            if head in heads:
+                heads[head].append(i)
+            else:
+                heads[head] = [i]
+        self.ticks += 1
+
+        # Resolve the collisions of the new heads and the food eaten.
+        died = []
+        eaten = 0
+        for head, indexes in heads.items():
+            value = grid[head]
+            if value != EMPTY and value != FOOD:
+                died.extend(indexes)
+                continue
+            if len(indexes) > 1:
+                sizes = sorted((snakes[i].size, i) for i in indexes)
+                if sizes[-1][0] == sizes[-2][0]:
+                    died.extend(indexes)
+                    continue
+                died.extend(i for _, i in sizes[:-1])
+                winner = sizes[-1][1]
+            else:
+                winner = indexes[0]
+            grid[head] = winner + 1
+            free_cells.remove(*divmod(head, width))
+            if value == FOOD:
+                self.food.discard(head)
+                self.scores[winner] += 1
+                rewards[winner] = 1
+                eaten += 1
+
+        # Remove the dead snakes from the board, their head never entered the grid.
+        if died:
+            dead = set(died)
+            self.alive = [i for i in self.alive if i not in dead]
+            for i in died:
+                for cell in snakes[i].get_cells():
+                    if grid[cell] == i + 1:
+                        grid[cell] = EMPTY
+                        free_cells.add(*divmod(cell, width))
+        for _ in range(eaten):
+            self.place_food()
+        return rewards, died, not self.alive
@@ -0,0 +1,178 @@
+"""
+Copyright 2019
+Author: Joao Carvalho <joao.ac.carvalho@gmail.com>
+"""
+import heapq
+from array import array
+
+
+def hamiltonian_cycle(rows, cols):
+    """
+    Cycle through every cell of a grid, moving between adjacent cells. The first row is traversed from left to
+    right, the following ones back and forth over all but the first column, which is the way back to the start.
+    Grids with an odd number of rows are transposed. A grid with an odd number of rows and columns has no such cycle,
+    the cycle then skips its bottom left cell.
+
+    :param rows: number of grid rows, at least 2
+    :type rows: int
+    :param cols: number of grid columns, at least 2
+    :type cols: int
+    :return: list of row and column pairs, in cycle order
+    """
+    if rows % 2 == 1 and cols % 2 == 0:
+        return [(r, c) for c, r in hamiltonian_cycle(cols, rows)]
+    even_rows = rows - rows % 2
+    cycle = [(0, c) for c in range(cols)]
+    for r in range(1, even_rows):
+        columns = range(cols - 1, 0, -1) if r % 2 == 1 else range(1, cols)
+        cycle.extend((r, c) for c in columns)
+    cycle.extend((r, 0) for r in range(even_rows - 1, 0, -1))
+    if rows != even_rows:
+        # Detour through the last row, two cells at a time, from the row above it.
+        last = cycle.index((even_rows - 1, cols - 1))
+        detours = []
+        for i, cell in enumerate(cycle[last:last + cols - 1]):
+            detours.append(cell)
+            if i % 2 == 0:
+                detours.extend([(rows - 1, cell[1]), (rows - 1, cell[1] - 1)])
+        cycle[last:last + cols - 1] = detours
+    return cycle
+
+
+def cycle_positions(board_height, board_width):
+    """
+    Position of every board cell along a Hamiltonian cycle of the board interior. Positions are even numbers, so
+    that the cell skipped by the cycle of a board with an odd number of interior rows and columns can be given the
+    odd position between its neighbours in the cycle: the snake can only visit it on the way between them.
+
+    :param board_height: board game height
+    :type board_height: int
+    :param board_width: board game width
+    :type board_width: int
+    :return: array with the position of each flattened cell, -1 for walls, and the length of the cycle
+    """
+    rows, cols = board_height - 2, board_width - 2
+    positions = array('l', [-1]) * (board_height * board_width)
+    cycle = hamiltonian_cycle(rows, cols)
+    for i, (r, c) in enumerate(cycle):
+        positions[(r + 1) * board_width + c + 1] = 2 * i
+    if len(cycle) < rows * cols:
+        # The skipped bottom left cell goes between its neighbour in the last row and the cell after it.
+        positions[rows * board_width + 1] = positions[rows * board_width + 2] + 1
+    return positions, 2 * len(cycle)
+
+
+class DistanceField:
+
+    def __init__(self, board_height, board_width):
+        """
+        This class implements a field with the length of the shortest path from every board cell to a target cell,
+        going around the snake body. The field is computed incrementally: a call to expand settles a bounded number
+        of cells in order of distance, so building it is spread over several ticks, and cells not reached yet have
+        no distance. Moving the target starts a new field in constant time, the distances are tagged with a
+        generation number instead of being cleared. Cells vacated by the snake tail are inserted with the distance
+        through their neighbours, which is propagated by the next expansions. Cells entered by the snake head keep
+        their distance, so some distances may become optimistic until the target moves.
+
+        :param board_height: board game height
+        :type board_height: int
+        :param board_width: board game width
+        :type board_width: int
+        """
+        self.board_height = board_height
+        self.board_width = board_width
+        n_cells = board_height * board_width
+        self.distances = array('l', [0]) * n_cells
+        self.generations = array('l', [0]) * n_cells
+        self.generation = 0
+        self.target = None
+        self.frontier = []
+        self.steps = (1, -1, -board_width, board_width)
+
+    def is_interior(self, cell):
+        """
+        Checks if a flattened cell is inside the board walls.
+        """
+        y, x = divmod(cell, self.board_width)
+        return 0 < y < self.board_height - 1 and 0 < x < self.board_width - 1
+
+    def reset(self, target):
+        """
+        Start a new field towards a target cell.
+
+        :param target: flattened target cell
+        :type target: int
+        """
+        self.generation += 1
+        self.target = target
+        self.distances[target] = 0
+        self.generations[target] = self.generation
+        self.frontier = [(0, target)]
+
+    def get(self, cell):
+        """
+        Getter for the distance of a cell to the target.
+
+        :param cell: flattened cell
+        :type cell: int
+        :return: the distance, None if the cell was not reached yet
+        """
+        if self.generations[cell] != self.generation:
+            return None
+        return self.distances[cell]
+
+    def free(self, cell):
+        """
+        Insert a cell vacated by the snake.
+
+        :param cell: flattened cell
+        :type cell: int
+        """
+        if self.target is None or not self.is_interior(cell):
+            return
+        best = None
+        for step in self.steps:
+            distance = self.get(cell + step)
+            if distance is not None and (best is None or distance < best):
+                best = distance
+        if best is not None and (self.get(cell) is None or best + 1 < self.distances[cell]):
+            self.distances[cell] = best + 1
+            self.generations[cell] = self.generation
+            heapq.heappush(self.frontier, (best + 1, cell))
+
+    def expand(self, is_blocked, budget):
+        """
+        Settle the cells closest to the target that were not settled yet.
+
+        :param is_blocked: function that checks if a flattened cell is covered by the snake
+        :type is_blocked: function
+        :param budget: maximum number of cells to settle
+        :type budget: int
+        :return: number of cells settled
+        """
+        frontier = self.frontier
+        distances = self.distances
+        generations = self.generations
+        generation = self.generation
+        width = self.board_width
+        last_row = (self.board_height - 1) * width
+        settled = 0
+        while frontier and settled < budget:
+            distance, cell = heapq.heappop(frontier)
+            if distance > distances[cell]:
+                continue
+            settled += 1
+            distance += 1
+            for step in self.steps:
+                neighbour = cell + step
+                x = neighbour % width
+                if neighbour < width or neighbour >= last_row or x == 0 or x == width - 1:
+                    continue
+                if generations[neighbour] == generation and distances[neighbour] <= distance:
+                    continue
+                if is_blocked(neighbour):
+                    continue
+                distances[neighbour] = distance
+                generations[neighbour] = generation
+                heapq.heappush(frontier, (distance, neighbour))
+        return settled
@@ -0,0 +1,84 @@
+"""
+Copyright 2019
+Author: Joao Carvalho <joao.ac.carvalho@gmail.com>
+"""
+import select
+import time
+
+
+class TickScheduler:
+
+    def __init__(self, rate, max_rate=30, clock=time.monotonic, sleep=time.sleep):
+        """
+        This class implements a fixed timestep scheduler. Ticks are due at absolute deadlines of a monotonic clock,
+        one period apart, so the time spent rendering and updating the game does not slow the tick rate down.
+        While waiting for a deadline the scheduler can also wake up as soon as there is input on a file descriptor.
+        If a tick ends after the next deadline, the missed deadlines are counted and skipped instead of running a
+        burst of late ticks.
+
+        :param rate: ticks per second
+        :type rate: float
+        :param max_rate: maximum ticks per second, higher rates are capped
+        :type max_rate: float
+        :param clock: monotonic clock in seconds
+        :type clock: function
+        :param sleep: sleep function in seconds, used when there is no input to wait for
+        :type sleep: function
+        """
+        self.max_rate = max_rate
+        self.clock = clock
+        self.sleep = sleep
+        self.missed = 0
+        self.ticks = 0
+        self.set_rate(rate)
+        self.deadline = self.clock() + self.period
+
+    def set_rate(self, rate):
+        """
+        Change the tick rate. It takes effect from the next deadline on.
+
+        :param rate: ticks per second
+        :type rate: float
+        """
+        self.rate = min(rate, self.max_rate)
+        self.period = 1 / self.rate
+
+    def start(self):
+        """
+        Set the next deadline one period from now.
+        """
+        self.deadline = self.clock() + self.period
+
+    def wait(self, fd=None):
+        """
+        Wait until the next deadline or until there is input to read.
+
+        :param fd: file descriptor, or object with a fileno method, to watch for input
+        :type fd: int
+        :return: True if there is input to read before the deadline, False if the deadline was reached
+        """
+        timeout = self.deadline - self.clock()
+        if timeout <= 0:
+            return False
+        if fd is None:
+            self.sleep(timeout)
+            return False
+        ready, _, _ = select.select([fd], [], [], timeout)
+        return bool(ready)
+
+    def tick(self):
+        """
+        Move to the next deadline, after the work of a tick is done. Deadlines that already passed are skipped and
+        counted as missed.
+
+        :return: number of deadlines missed by this tick
+        """
+        self.ticks += 1
+        self.deadline += self.period
+        lag = self.clock() - self.deadline
+        if lag <= 0:
+            return 0
+        missed = int(lag // self.period) + 1
+        self.missed += missed
+        self.deadline += missed * self.period
+        return missed
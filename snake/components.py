@@ -2,47 +2,250 @@
 Copyright 2019
 Author: Joao Carvalho <joao.ac.carvalho@gmail.com>
 """
-from random import randint
-from collections import namedtuple
+from array import array
+from collections import deque, namedtuple
+from .rng import GameRandom
+from .zobrist import HEAD_LINK, body_hash, link_code, part_key
 
 
 # Datastructure to store Snake and Food parts.
 Point = namedtuple('Point', ['y', 'x'])
 
+# Largest value of each cell array typecode, never a board cell, used to mark unused array items.
+EMPTY_CELL = {'H': 0xFFFF, 'I': 0xFFFFFFFF}
+# Opposite of each snake direction, a snake cannot turn back onto its own body.
+OPPOSITE = {'UP': 'DOWN', 'DOWN': 'UP', 'LEFT': 'RIGHT', 'RIGHT': 'LEFT'}
+# Snakes up to this size look up their positions by scanning their cells, longer ones keep a bitmap of the board.
+SCAN_SIZE = 32
+
+
+def cell_typecode(n_cells):
+    """
+    Smallest array typecode able to hold the flattened cells of a board, plus one spare value.
+
+    :param n_cells: number of board cells
+    :type n_cells: int
+    :return: 'H' or 'I'
+    """
+    return 'H' if n_cells < 0xFFFF else 'I'
+
 
 class Snake:
 
-    def __init__(self, y=0, x=0, initial_size=3):
+    # Directions in the order of their integer codes, their opposites are in OPPOSITE.
+    directions = ['RIGHT', 'LEFT', 'UP', 'DOWN']
+    head_symbol = 'O'
+    body_symbol = 'o'
+
+    __slots__ = ['board_height', 'board_width', 'direction', 'size', 'cells', 'mask', 'head', 'occupancy', 'overlaps',
+                 'hash', 'shared', 'game_map', 'indexing']
+
+    def __init__(self, y=None, x=None, initial_size=3, board_height=None, board_width=None, hashing=False,
+                 game_map=None, indexing=True):
         """
         This class implements a snake, which consists of a body and head direction. By default, the snake is heading
         to the RIGHT.
         The positions x and y are the inverse of what is usually used in a matrix notation, but consistent with
         curses definitions. Considering a matrix, x is a column index and y is a row index.
         The top left corner is the point (0, 0).
+        The body is stored as flattened board cells, y * board_width + x, in a ring buffer array from the head to the
+        tail, with 16-bit items on boards of up to 65535 cells. Short snakes check if a position is occupied by
+        scanning their few cells. Once longer than SCAN_SIZE, the occupied cells are kept in a bitmap of the board,
+        plus a dictionary with the count of the cells covered more than once, which only exists after a collision.
+        The direction is stored as its index in directions. Moving, growing and checking if a position is occupied
+        take constant time, and a short snake takes about 200 bytes.
+        Optionally, the snake keeps the Zobrist hash of its body, updated in constant time by every move and growth.
+        A snake can be forked, the fork shares the body storage until either snake moves or grows.
+        On a map, the snake moves through the map links, across the edges and portals, and grows by keeping its tail
+        in place for a move, since the cell past the tail may be on the other side of an edge or a portal.
 
-        :param y: y position of snake head
+        :param y: y position of snake head, defaults to the center of the board
         :type y: int
-        :param x: x position of snake head
+        :param x: x position of snake head, defaults to the center of the board
         :type x: int
         :param initial_size: initial size for the snake
         :type initial_size: int
+        :param board_height: height of the board the snake moves in, every body part must be inside it, defaults to
+                             20 or the height needed by the head position if larger
+        :type board_height: int
+        :param board_width: width of the board the snake moves in, defaults to 40 or the width needed by the head
+                            position if larger
+        :type board_width: int
+        :param hashing: keep the hash of the body in the hash attribute, which is None otherwise
+        :type hashing: bool
+        :param game_map: map of the board, None for a board with walls on its border only
+        :type game_map: GameMap
+        :param indexing: keep the bitmap of the occupied positions of long snakes. Without it, checking if a position
+                         is occupied scans the body, for snakes whose collisions are checked against a shared grid
+        :type indexing: bool
         """
-        self.head_symbol = 'O'
-        self.body_symbol = 'o'
-        self.head_direction = 'RIGHT'
-        self.body = [Point(y, x)]
         assert initial_size >= 2, "Initially the snake must have size 2"
-        self.size = initial_size
-        self.directions = ['RIGHT', 'LEFT', 'UP', 'DOWN']
+        if board_height is None:
+            board_height = 20 if y is None else max(20, y + 1)
+        if board_width is None:
+            board_width = 40 if x is None else max(40, x + 1)
+        y = board_height // 2 if y is None else y
+        x = board_width // 2 if x is None else x
+        if not (0 <= y < board_height and initial_size - 1 <= x < board_width):
+            raise ValueError('A snake of size {} heading RIGHT from ({}, {}) does not fit in a {}x{} board'.format(
+                initial_size, y, x, board_height, board_width))
+        self.board_height = board_height
+        self.board_width = board_width
+        self.direction = 0
+        self.hash = 0 if hashing else None
+        self.shared = False
+        self.game_map = game_map
+        self.indexing = indexing
 
-        self.setup_snake()
+        self.setup_snake(y, x, initial_size)
 
-    def setup_snake(self):
+    def setup_snake(self, y, x, size):
         """
         Setup a snake body horizontally, moving to the RIGHT.
+
+        :param y: y position of snake head
+        :type y: int
+        :param x: x position of snake head
+        :type x: int
+        :param size: size of the snake
+        :type size: int
+        """
+        self.body = [Point(y, x - i) for i in range(size)]
+
+    @property
+    def head_direction(self):
+        """
+        Getter for the snake head direction, 'RIGHT', 'LEFT', 'UP' or 'DOWN'.
+        """
+        return self.directions[self.direction]
+
+    @head_direction.setter
+    def head_direction(self, direction):
+        """
+        Setter for the snake head direction.
+
+        :param direction: 'RIGHT', 'LEFT', 'UP' or 'DOWN'
+        :type direction: str
+        """
+        self.direction = self.directions.index(direction)
+
+    @property
+    def body(self):
+        """
+        Getter for the snake positions, from the head to the tail.
+        """
+        return self.get_body()
+
+    @body.setter
+    def body(self, body):
+        """
+        Setter for the snake positions. Rebuilds the occupancy of the board positions.
+
+        :param body: y and x positions, from the head to the tail
+        :type body: list
+        """
+        width = self.board_width
+        for y, x in body:
+            assert 0 <= y < self.board_height and 0 <= x < width, "The snake must be inside the board"
+        self.set_cells([y * width + x for y, x in body])
+
+    def set_cells(self, cells):
+        """
+        Setter for the snake positions as flattened board cells. Rebuilds the occupancy of the board positions.
+
+        :param cells: flattened cells, from the head to the tail
+        :type cells: list
+        """
+        n_cells = self.board_height * self.board_width
+        capacity = 4
+        while capacity <= len(cells):
+            capacity *= 2
+        typecode = cell_typecode(n_cells)
+        self.cells = array(typecode, cells)
+        self.cells.extend(array(typecode, [EMPTY_CELL[typecode]]) * (capacity - len(cells)))
+        self.mask = capacity - 1
+        self.head = 0
+        self.size = len(cells)
+        self.occupancy = None
+        self.overlaps = None
+        self.shared = False
+        if self.indexing and self.size > SCAN_SIZE:
+            self._index()
+        if self.hash is not None:
+            self.hash = body_hash(cells, self.board_width)
+
+    def fork(self):
+        """
+        Copy of the snake that shares its body storage with this one, in constant time. The first of the two snakes
+        to move or grow afterwards copies the storage, which takes time proportional to the snake length, and to the
+        board size for snakes longer than SCAN_SIZE.
+
+        :return: the new snake
         """
-        for i in range(0, self.size-1):
-            self.body.append(Point(self.body[i].y, self.body[i].x - 1))
+        child = Snake.__new__(Snake)
+        for name in Snake.__slots__:
+            setattr(child, name, getattr(self, name))
+        self.shared = child.shared = True
+        return child
+
+    def _own(self):
+        """
+        Copy the body storage shared with forks.
+        """
+        self.cells = self.cells[:]
+        if self.occupancy is not None:
+            self.occupancy = bytearray(self.occupancy)
+        if self.overlaps is not None:
+            self.overlaps = dict(self.overlaps)
+        self.shared = False
+
+    def _index(self):
+        """
+        Builds the bitmap of the occupied board positions.
+        """
+        self.occupancy = bytearray((self.board_height * self.board_width + 7) // 8)
+        for cell in self.get_cells():
+            self._add(cell)
+
+    def get_cells(self):
+        """
+        Getter for the snake positions as flattened board cells.
+
+        :return: array with the cells, from the head to the tail
+        """
+        end = self.head + self.size
+        if end <= len(self.cells):
+            return self.cells[self.head:end]
+        return self.cells[self.head:] + self.cells[:end & self.mask]
+
+    def _add(self, cell):
+        """
+        Adds a body part to the occupancy of the board positions.
+        """
+        if self.occupancy is None:
+            return
+        bit = 1 << (cell & 7)
+        if self.occupancy[cell >> 3] & bit:
+            if self.overlaps is None:
+                self.overlaps = {}
+            self.overlaps[cell] = self.overlaps.get(cell, 0) + 1
+        else:
+            self.occupancy[cell >> 3] |= bit
+
+    def _remove(self, cell):
+        """
+        Removes a body part from the occupancy of the board positions.
+        """
+        if self.occupancy is None:
+            return
+        if self.overlaps is not None and cell in self.overlaps:
+            count = self.overlaps.pop(cell) - 1
+            if count:
+                self.overlaps[cell] = count
+            elif not self.overlaps:
+                self.overlaps = None
+        else:
+            self.occupancy[cell >> 3] &= ~(1 << (cell & 7))
 
     def get_head_position(self):
         """
@@ -50,7 +253,7 @@ class Snake:
 
         :return: y and x head position
         """
-        return self.body[0].y, self.body[0].x
+        return divmod(self.cells[self.head], self.board_width)
 
     def get_tail_position(self):
         """
@@ -58,7 +261,7 @@ class Snake:
 
         :return: y and x tail position
         """
-        return self.body[-1].y, self.body[-1].x
+        return divmod(self.cells[(self.head + self.size - 1) & self.mask], self.board_width)
 
     def get_body_position(self, ind):
         """
@@ -68,9 +271,9 @@ class Snake:
         :type ind: int
         :return: y and x position at index ind
         """
-        if ind < 0 or ind > self.size:
-            ind = -1
-        return self.body[ind].y, self.body[ind].x
+        if ind < 0 or ind >= self.size:
+            ind = self.size - 1
+        return divmod(self.cells[(self.head + ind) & self.mask], self.board_width)
 
     def get_body(self):
         """
@@ -78,7 +281,48 @@ class Snake:
 
         :return: list with the snake x and y positions
         """
-        return self.body
+        width = self.board_width
+        return [Point(*divmod(cell, width)) for cell in self.get_cells()]
+
+    def is_cell_occupied(self, cell):
+        """
+        Checks if any part of the snake is at a flattened board cell.
+
+        :param cell: flattened cell, y * board_width + x, inside the board
+        :type cell: int
+        :return: True if the snake occupies the cell, False otherwise
+        """
+        if self.occupancy is None:
+            return cell in self.cells
+        return bool(self.occupancy[cell >> 3] & (1 << (cell & 7)))
+
+    def is_occupied(self, y, x):
+        """
+        Checks if any part of the snake is at a position.
+
+        :param y: y position
+        :type y: int
+        :param x: x position
+        :type x: int
+        :return: True if the snake occupies the position, False otherwise
+        """
+        if not (0 <= y < self.board_height and 0 <= x < self.board_width):
+            return False
+        cell = y * self.board_width + x
+        if self.occupancy is None:
+            # Unused items of a short snake are empty cells.
+            return cell in self.cells
+        return bool(self.occupancy[cell >> 3] & (1 << (cell & 7)))
+
+    def check_head_collision(self):
+        """
+        Checks if the snake head is at the same position as another body part.
+
+        :return: True if the head hits the body, False otherwise
+        """
+        if self.occupancy is None:
+            return self.cells.count(self.cells[self.head]) > 1
+        return self.overlaps is not None and self.cells[self.head] in self.overlaps
 
     def change_direction(self, direction):
         """
@@ -88,7 +332,7 @@ class Snake:
         :type direction: str
         """
         if direction in self.directions:
-            self.head_direction = direction
+            self.direction = self.directions.index(direction)
         else:
             pass
 
@@ -98,57 +342,81 @@ class Snake:
         To append the body part in the right position, this checks the current direction of the tail, by comparing
         the last two positions of the snake body.
         """
-        y, x = self.get_tail_position()
-        if self.size == 1:
-            if self.head_direction == 'UP':
-                y += 1
-            elif self.head_direction == 'DOWN':
-                y -= 1
-            elif self.head_direction == 'LEFT':
-                x += 1
-            elif self.head_direction == 'RIGHT':
-                x -= 1
+        if self.shared:
+            self._own()
+        tail = self.cells[(self.head + self.size - 1) & self.mask]
+        if self.game_map is not None:
+            # The new part covers the tail until the next move.
+            pass
+        elif self.size == 1:
+            # Opposite of the head direction.
+            tail -= (1, -1, -self.board_width, self.board_width)[self.direction]
         else:
             # Get tail and penultimate positions to determine the direction of body increase.
-            t_y, t_x = self.get_tail_position()
-            t_y_p, t_x_p = self.get_body_position(self.size - 2)
-            if t_y > t_y_p:
-                y += 1
-            elif t_y < t_y_p:
-                y -= 1
-            elif t_x > t_x_p:
-                x += 1
-            elif t_x < t_x_p:
-                x -= 1
-
-        self.body.append(Point(y, x))
+            tail += tail - self.cells[(self.head + self.size - 2) & self.mask]
+
+        if self.size > self.mask:
+            # Double the ring buffer, with the head at the start.
+            cells = self.get_cells()
+            cells.extend(array(cells.typecode, [EMPTY_CELL[cells.typecode]]) * len(cells))
+            self.cells = cells
+            self.mask = 2 * self.mask + 1
+            self.head = 0
+        if self.hash is not None:
+            self.hash ^= part_key(tail, link_code(tail, self.cells[(self.head + self.size - 1) & self.mask],
+                                                  self.board_width))
+        self.cells[(self.head + self.size) & self.mask] = tail
+        self._add(tail)
         self.size += 1
+        if self.occupancy is None and self.indexing and self.size > SCAN_SIZE:
+            self._index()
 
     def move(self):
         """
-        Moves the snake one step.
+        Moves the snake one step. A move off the board raises a ValueError and leaves the snake unchanged.
         """
+        head = self.cells[self.head]
+        if self.game_map is None:
+            width = self.board_width
+            new_head = head + (1, -1, -width, width)[self.direction]
+            # The new head is checked before any change, moves to the LEFT or RIGHT must stay in the same row.
+            if (not 0 <= new_head < self.board_height * width or
+                    (self.direction < 2 and new_head // width != head // width)):
+                raise ValueError('The snake cannot move {} off the board from {}'.format(self.head_direction,
+                                                                                         divmod(head, width)))
+            link = self.direction
+        else:
+            new_head = self.game_map.move(head, self.direction)
+            link = link_code(head, new_head, self.board_width)
+        if self.shared:
+            self._own()
+        cells = self.cells
         # Delete the tail.
         if self.size > 1:
-            del self.body[-1]
+            tail = (self.head + self.size - 1) & self.mask
+            if self.hash is not None:
+                # The old head gets linked to the new one.
+                self.hash ^= (part_key(cells[tail], link_code(cells[tail], cells[(tail - 1) & self.mask],
+                                                              self.board_width)) ^
+                              part_key(head, HEAD_LINK) ^ part_key(head, link))
+            self._remove(cells[tail])
+            cells[tail] = EMPTY_CELL[cells.typecode]
+        elif self.hash is not None:
+            self.hash ^= part_key(head, HEAD_LINK)
 
         # Move the snake tail to the front.
-        h_y, h_x = self.get_head_position()
-        y, x = 0, 0
-        if self.head_direction == 'UP':
-            y -= 1
-        elif self.head_direction == 'DOWN':
-            y += 1
-        elif self.head_direction == 'LEFT':
-            x -= 1
-        elif self.head_direction == 'RIGHT':
-            x += 1
-        self.body.insert(0, Point(h_y + y, h_x + x))
+        self.head = (self.head - 1) & self.mask
+        cells[self.head] = new_head
+        self._add(new_head)
+        if self.hash is not None:
+            self.hash ^= part_key(new_head, HEAD_LINK)
 
 
 class Food:
 
-    def __init__(self, max_y=3, max_x=3):
+    __slots__ = ['max_y', 'max_x', 'rng', 'position']
+
+    def __init__(self, max_y=3, max_x=3, rng=None):
         """
         This class implements the food. It places food in random positions, delimited by the board width and height.
         The positions x and y are the inverse of what is usually used in a matrix notation, but consistent with
@@ -159,9 +427,13 @@ class Food:
         :type max_y: int
         :param max_x: maximum value for x
         :type max_x: int
+        :param rng: random number generator used to place the food, defaults to a new generator seeded from the
+                    system
+        :type rng: GameRandom
         """
         self.max_y = max_y
         self.max_x = max_x
+        self.rng = rng if rng is not None else GameRandom()
         self.position = Point(None, None)
         self.random_position()
 
@@ -177,4 +449,288 @@ class Food:
         """
         Place the food in a random position.
         """
-        self.position = Point(randint(1, self.max_y - 2), randint(1, self.max_x - 2))
+        self.position = Point(self.rng.randint(1, self.max_y - 2), self.rng.randint(1, self.max_x - 2))
+
+    def set_position(self, y, x):
+        """
+        Place the food at a given position.
+
+        :param y: y food position
+        :type y: int
+        :param x: x food position
+        :type x: int
+        """
+        self.position = Point(y, x)
+
+    def fork(self, rng):
+        """
+        Copy of the food, at the same position, that draws its next positions from another random number generator.
+
+        :param rng: random number generator of the copy
+        :type rng: GameRandom
+        :return: the new food
+        """
+        child = Food.__new__(Food)
+        child.max_y = self.max_y
+        child.max_x = self.max_x
+        child.rng = rng
+        child.position = self.position
+        return child
+
+
+class FreeCells:
+
+    def __init__(self, height, width, walls=None, state=None):
+        """
+        This class implements an index of the free interior positions of a board, the ones that are neither walls
+        nor covered by the snake. Positions are stored as flattened cells, y * width + x, in a dense array, and each
+        cell knows its slot in that array. Adding and removing a cell swaps it with the last slot, so every operation,
+        including sampling a uniformly random free position, takes constant time regardless of how full the board is.
+        Initially all interior positions are free. On a map, the walls are given as a bitmask and every other
+        position of the board is interior.
+        Both arrays use 16-bit items on boards of up to 65535 cells and 32-bit items otherwise. The largest item
+        value marks the slot of a cell that is not free.
+        An index can be forked, see fork, after which it keeps its changes in dictionaries on top of arrays shared with
+        its forks.
+
+        :param height: board height
+        :type height: int
+        :param width: board width
+        :type width: int
+        :param walls: bitmask of the wall cells of a map, one bit per cell, None for walls on the board border only
+        :type walls: bytearray
+        :param state: free cells and slot of each cell to start from, as returned by getstate, instead of every
+                      interior position
+        :type state: tuple
+        """
+        self.height = height
+        self.width = width
+        self.walls = walls
+        self.typecode = cell_typecode(height * width)
+        self.none = EMPTY_CELL[self.typecode]
+        # Changed cells by slot and slots by cell on top of the shared arrays of a forked index, None otherwise.
+        self.cell_changes = None
+        self.slot_changes = None
+        self.length = None
+        if state is not None:
+            self.cells, self.slots = state
+            return
+        self.slots = array(self.typecode, [self.none]) * (height * width)
+        if walls is not None:
+            self.cells = array(self.typecode, (cell for cell in range(height * width)
+                                               if not walls[cell >> 3] & (1 << (cell & 7))))
+            for slot, cell in enumerate(self.cells):
+                self.slots[cell] = slot
+            return
+        self.cells = array(self.typecode)
+        for y in range(1, height - 1):
+            self.cells.extend(range(y * width + 1, (y + 1) * width - 1))
+        # Fill the slots one row at a time, the interior cells of a row are consecutive.
+        inner = width - 2
+        for y in range(1, height - 1):
+            slot = (y - 1) * inner
+            self.slots[y * width + 1:(y + 1) * width - 1] = array(self.typecode, range(slot, slot + inner))
+
+    def setstate(self, cells, slots=None):
+        """
+        Replace the index, for instance with arrays copied from another index of a board with the same size.
+
+        :param cells: free cells, in slot order
+        :type cells: array.array
+        :param slots: slot of each board cell, the none attribute if the cell is not free, rebuilt from cells by
+                      default, in time proportional to the number of free cells
+        :type slots: array.array
+        """
+        if slots is None:
+            slots = array(self.typecode, [self.none]) * (self.height * self.width)
+            for slot, cell in enumerate(cells):
+                slots[cell] = slot
+        self.cells = cells
+        self.slots = slots
+        self.cell_changes = None
+        self.slot_changes = None
+        self.length = None
+
+    def getstate(self):
+        """
+        Getter for the index arrays, for instance to copy them to another index. A forked index first copies the
+        shared arrays and its changes into arrays of its own.
+
+        :return: the free cells, in slot order, and the slot of each board cell
+        """
+        if self.cell_changes is not None:
+            self._own()
+        return self.cells, self.slots
+
+    def fork(self):
+        """
+        Copy of the index that shares its arrays with this one. The arrays are frozen on the first fork: from then on,
+        this index and its forks keep their changes in dictionaries on top of them, so a fork takes constant time
+        whatever the board size, plus the time to copy the changes made since the arrays were frozen. Once the
+        changes of an index outnumber a sixteenth of the board cells, it copies the arrays and its changes into
+        arrays of its own.
+
+        :return: the new index
+        """
+        if self.cell_changes is None:
+            self.cell_changes = {}
+            self.slot_changes = {}
+            self.length = len(self.cells)
+        child = FreeCells.__new__(FreeCells)
+        child.height = self.height
+        child.width = self.width
+        child.walls = self.walls
+        child.typecode = self.typecode
+        child.none = self.none
+        child.cells = self.cells
+        child.slots = self.slots
+        child.cell_changes = dict(self.cell_changes)
+        child.slot_changes = dict(self.slot_changes)
+        child.length = self.length
+        return child
+
+    def _own(self):
+        """
+        Copy the shared arrays and the changes of a forked index into arrays of its own.
+        """
+        cells = self.cells[:self.length]
+        cells.extend(array(self.typecode, [self.none]) * (self.length - len(cells)))
+        for slot, cell in self.cell_changes.items():
+            cells[slot] = cell
+        slots = self.slots[:]
+        for cell, slot in self.slot_changes.items():
+            slots[cell] = slot
+        self.setstate(cells, slots)
+
+    def _slot(self, cell):
+        """
+        Slot of a board cell of a forked index.
+        """
+        slot = self.slot_changes.get(cell)
+        return self.slots[cell] if slot is None else slot
+
+    def _cell(self, slot):
+        """
+        Cell in a slot of a forked index.
+        """
+        cell = self.cell_changes.get(slot)
+        return self.cells[slot] if cell is None else cell
+
+    def __len__(self):
+        """
+        Number of free positions.
+        """
+        if self.cell_changes is not None:
+            return self.length
+        return len(self.cells)
+
+    def is_interior(self, y, x):
+        """
+        Checks if a position is inside the board walls, or on a map, inside the board and not a wall.
+
+        :param y: y position
+        :type y: int
+        :param x: x position
+        :type x: int
+        :return: True if the position is an interior position, False otherwise
+        """
+        if self.walls is None:
+            return 0 < y < self.height - 1 and 0 < x < self.width - 1
+        if not (0 <= y < self.height and 0 <= x < self.width):
+            return False
+        cell = y * self.width + x
+        return not self.walls[cell >> 3] & (1 << (cell & 7))
+
+    def is_free(self, y, x):
+        """
+        Checks if a position is free.
+
+        :param y: y position
+        :type y: int
+        :param x: x position
+        :type x: int
+        :return: True if the position is free, False otherwise
+        """
+        if not self.is_interior(y, x):
+            return False
+        if self.cell_changes is not None:
+            return self._slot(y * self.width + x) != self.none
+        return self.slots[y * self.width + x] != self.none
+
+    def add(self, y, x):
+        """
+        Marks an interior position as free. Wall positions and positions already free are ignored.
+
+        :param y: y position
+        :type y: int
+        :param x: x position
+        :type x: int
+        """
+        if not self.is_interior(y, x):
+            return
+        cell = y * self.width + x
+        if self.cell_changes is not None:
+            if self._slot(cell) == self.none:
+                self.slot_changes[cell] = self.length
+                self.cell_changes[self.length] = cell
+                self.length += 1
+                self._check_changes()
+        elif self.slots[cell] == self.none:
+            self.slots[cell] = len(self.cells)
+            self.cells.append(cell)
+
+    def remove(self, y, x):
+        """
+        Marks a position as not free. Wall positions and positions already taken are ignored.
+
+        :param y: y position
+        :type y: int
+        :param x: x position
+        :type x: int
+        """
+        if not self.is_interior(y, x):
+            return
+        cell = y * self.width + x
+        if self.cell_changes is not None:
+            slot = self._slot(cell)
+            if slot != self.none:
+                self.length -= 1
+                last = self._cell(self.length)
+                self.cell_changes.pop(self.length, None)
+                if last != cell:
+                    self.cell_changes[slot] = last
+                    self.slot_changes[last] = slot
+                self.slot_changes[cell] = self.none
+                self._check_changes()
+            return
+        slot = self.slots[cell]
+        if slot != self.none:
+            # Move the last cell into the slot of the removed one.
+            last = self.cells.pop()
+            if last != cell:
+                self.cells[slot] = last
+                self.slots[last] = slot
+            self.slots[cell] = self.none
+
+    def _check_changes(self):
+        """
+        Stop sharing the arrays of a forked index once its changes outnumber a sixteenth of the board cells.
+        """
+        if len(self.slot_changes) > max(64, len(self.slots) >> 4):
+            self._own()
+
+    def sample(self, rng):
+        """
+        Samples a uniformly random free position.
+
+        :param rng: random number generator
+        :type rng: GameRandom
+        :return: y and x of a free position, None if there are no free positions
+        """
+        if self.cell_changes is not None:
+            if not self.length:
+                return None
+            return divmod(self._cell(rng.randrange(self.length)), self.width)
+        if not self.cells:
+            return None
+        return divmod(self.cells[rng.randrange(len(self.cells))], self.width)
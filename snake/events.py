@@ -0,0 +1,284 @@
+"""
+Copyright 2019
+Author: Joao Carvalho <joao.ac.carvalho@gmail.com>
+"""
+import json
+import queue
+import socket
+import sys
+import threading
+import time
+from .engine import PLAYING
+
+
+# Event levels, a stream only emits the events at or above its level.
+LEVELS = {'debug': 10, 'info': 20}
+EVENT_LEVELS = {'start': 20, 'turn': 20, 'move': 10, 'food': 20, 'speed': 20, 'game_over': 20}
+POLICIES = ('drop', 'block')
+# Prefix of the targets that are Unix socket paths.
+UNIX_PREFIX = 'unix:'
+
+
+def open_target(target):
+    """
+    Open the output of an event stream: '-' for the standard output, 'unix:' followed by the path of a listening Unix
+    socket, or the path of a file or named pipe, appended to.
+
+    :param target: output target
+    :type target: str
+    :return: binary output and whether it must be closed with the stream
+    """
+    if target == '-':
+        return sys.stdout.buffer, False
+    if target.startswith(UNIX_PREFIX):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(target[len(UNIX_PREFIX):])
+            return sock.makefile('wb'), True
+        finally:
+            # The socket stays open until its file is closed.
+            sock.close()
+    return open(target, 'ab'), True
+
+
+class EventStream:
+
+    def __init__(self, target, level='info', sample=1, policy='drop', capacity=4096, batch_size=1024):
+        """
+        This class streams the events of games as newline-delimited JSON: the start of a game, direction changes,
+        moves, food eaten, speed changes and the end of the game with its score. Events are derived by observe, which
+        compares the engine with its previous observation once per tick, and each one is a JSON object with the event
+        name, the engine tick and the wall-clock time, see the README for their fields.
+        Emitting an event only puts it in a bounded buffer. A background thread opens the output, so a named pipe
+        without a reader or a slow socket never holds up the game, and writes whatever is buffered when it wakes up,
+        serialized and sent with a single write per batch. Once the buffer is full, the drop policy discards new
+        events and counts them, the writer then reports the count in a 'dropped' event, while the block policy makes
+        the game wait for the writer.
+        Moves are the only events of every tick, they are debug events, not emitted at the default info level, and
+        can be sampled to one tick out of sample, so the cost of a tick without other events is a few comparisons.
+        If the output fails, the error is kept and raised by close, and the following events are discarded.
+
+        :param target: output, see open_target, or a binary output with a write and optionally a flush method, which
+                       is not closed with the stream
+        :type target: str
+        :param level: lowest level of the events emitted, 'debug' or 'info'
+        :type level: str
+        :param sample: emit the moves of one tick out of this many
+        :type sample: int
+        :param policy: 'drop' to discard the events emitted while the buffer is full, 'block' to wait for room
+        :type policy: str
+        :param capacity: maximum number of buffered events
+        :type capacity: int
+        :param batch_size: maximum number of events per write
+        :type batch_size: int
+        """
+        if level not in LEVELS:
+            raise ValueError("Unknown event level '{}'".format(level))
+        if policy not in POLICIES:
+            raise ValueError("Unknown buffer policy '{}'".format(policy))
+        assert sample >= 1, "The sample rate must be at least 1"
+        self.target = target
+        self.level = LEVELS[level]
+        self.sample = sample
+        self.moves = self.level <= EVENT_LEVELS['move']
+        self.block = policy == 'block'
+        self.batch_size = batch_size
+        self.buffer = queue.Queue(maxsize=capacity)
+        self.emitted = 0
+        self.dropped = 0
+        self.written = 0
+        self.error = None
+        # Seed, ticks, direction, score, speed and status of the last observed engine, None before the first one.
+        self.last = None
+        self.writer = threading.Thread(target=self._write, name='event-stream', daemon=True)
+        self.writer.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def emit(self, event, tick, **fields):
+        """
+        Buffer an event to be written, unless its level is filtered out.
+
+        :param event: event name, one of EVENT_LEVELS
+        :type event: str
+        :param tick: engine tick of the event
+        :type tick: int
+        :param fields: event fields
+        :type fields: dict
+        :return: True if the event was buffered, False if it was filtered out or dropped
+        """
+        if EVENT_LEVELS[event] < self.level:
+            return False
+        fields['event'] = event
+        fields['tick'] = tick
+        fields['time'] = time.time()
+        if self.block:
+            self.buffer.put(fields)
+        else:
+            try:
+                self.buffer.put_nowait(fields)
+            except queue.Full:
+                self.dropped += 1
+                return False
+        self.emitted += 1
+        return True
+
+    def observe(self, engine):
+        """
+        Emit the events of the ticks since the last observation, called after each engine step. A new game, after a
+        reset or on another engine, starts with a 'start' event.
+
+        :param engine: game engine
+        :type engine: Engine
+        """
+        snake = engine.snake
+        ticks = engine.ticks
+        last = self.last
+        new_game = last is None or engine.seed != last[0] or ticks < last[1]
+        if new_game:
+            self.emit('start', ticks, seed=engine.seed, height=engine.board_height, width=engine.board_width,
+                      speed=engine.speed, direction=snake.head_direction)
+        else:
+            if snake.direction != last[2]:
+                self.emit('turn', ticks, direction=snake.head_direction)
+            if self.moves and ticks != last[1] and ticks % self.sample == 0:
+                self.emit('move', ticks, head=snake.get_head_position(), length=snake.size)
+            if engine.score != last[3]:
+                self.emit('food', ticks, score=engine.score, length=snake.size, food=engine.food.get_position())
+            if engine.speed != last[4]:
+                self.emit('speed', ticks, speed=engine.speed)
+        if engine.status != PLAYING and (new_game or last[5] == PLAYING):
+            self.game_over(engine)
+        self.last = (engine.seed, ticks, snake.direction, engine.score, engine.speed, engine.status)
+
+    def game_over(self, engine, status=None):
+        """
+        Emit the end of a game.
+
+        :param engine: game engine
+        :type engine: Engine
+        :param status: game status, defaults to the engine status, e.g. 'END' for a game quit before it was over
+        :type status: str
+        """
+        self.emit('game_over', engine.ticks, status=status or engine.status, score=engine.score,
+                  length=engine.snake.size)
+
+    def _write(self):
+        """
+        Writer thread loop, writes the buffered events until it gets None.
+        """
+        output, owned = None, False
+        reported = 0
+        try:
+            if isinstance(self.target, str):
+                output, owned = open_target(self.target)
+            else:
+                output = self.target
+        except OSError as e:
+            self.error = e
+        try:
+            stop = False
+            while not stop:
+                item = self.buffer.get()
+                batch = []
+                events = []
+                while True:
+                    if item is None:
+                        stop = True
+                        break
+                    if isinstance(item, threading.Event):
+                        # Flush request, set once the events buffered before it are written.
+                        events.append(item)
+                    else:
+                        batch.append(item)
+                        if len(batch) >= self.batch_size:
+                            break
+                    try:
+                        item = self.buffer.get_nowait()
+                    except queue.Empty:
+                        break
+                dropped = self.dropped
+                if dropped != reported and self.error is None:
+                    batch.append({'event': 'dropped', 'count': dropped - reported, 'total': dropped,
+                                  'time': time.time()})
+                    reported = dropped
+                if batch and self.error is None:
+                    try:
+                        output.write(''.join(json.dumps(event, separators=(',', ':')) + '\n'
+                                             for event in batch).encode())
+                        if hasattr(output, 'flush'):
+                            output.flush()
+                        self.written += len(batch)
+                    except OSError as e:
+                        self.error = e
+                for event in events:
+                    event.set()
+        finally:
+            if owned:
+                try:
+                    output.close()
+                except OSError as e:
+                    self.error = self.error or e
+
+    def flush(self):
+        """
+        Wait until every event emitted so far is written.
+        """
+        if self.writer.is_alive():
+            event = threading.Event()
+            self.buffer.put(event)
+            event.wait()
+        if self.error is not None:
+            raise self.error
+
+    def close(self):
+        """
+        Write the buffered events and close the stream.
+        """
+        if self.writer.is_alive():
+            self.buffer.put(None)
+            self.writer.join()
+        if self.error is not None:
+            raise self.error
+
+    def stats(self):
+        """
+        Getter for the stream counters.
+
+        :return: dictionary with the number of events emitted, dropped and written
+        """
+        return {'emitted': self.emitted, 'dropped': self.dropped, 'written': self.written}
+
+
+def add_arguments(parser):
+    """
+    Add the event stream command line arguments.
+
+    :param parser: argument parser
+    :type parser: argparse.ArgumentParser
+    """
+    parser.add_argument('--events', metavar='TARGET',
+                        help="stream the game events as JSON lines to a file, a named pipe, '-' for the standard "
+                             "output or 'unix:PATH' for a Unix socket")
+    parser.add_argument('--events-level', choices=list(LEVELS), default='info',
+                        help='lowest level of the events streamed, debug adds the moves')
+    parser.add_argument('--events-sample', type=int, default=1, help='stream the moves of one tick out of this many')
+    parser.add_argument('--events-policy', choices=POLICIES, default='drop',
+                        help='drop the events or make the game wait when the writer falls behind')
+
+
+def from_arguments(args):
+    """
+    Open the event stream of the command line arguments.
+
+    :param args: parsed command line arguments
+    :type args: argparse.Namespace
+    :return: the event stream, None if no target was given
+    """
+    if args.events is None:
+        return None
+    return EventStream(args.events, level=args.events_level, sample=args.events_sample, policy=args.events_policy)
@@ -0,0 +1,392 @@
+"""
+Copyright 2019
+Author: Joao Carvalho <joao.ac.carvalho@gmail.com>
+"""
+import json
+import struct
+import sys
+import time
+from .render import AnsiScreen, CursesRenderer, EMPTY_SYMBOL, FOOD_SYMBOL
+from .replay import ReplayReader
+
+
+# Time the last frame stays on screen, in seconds, the same pause as the game after its last step.
+END_HOLD = 1.5
+
+# GIF colors, by palette index. Index 0 is transparent in every frame after the first one, for the cells that did not
+# change since the previous frame.
+TRANSPARENT = 0
+PALETTE = [(0, 0, 0), (0, 0, 0), (128, 128, 128), (0, 170, 0), (140, 255, 140), (230, 40, 40), (255, 255, 255),
+           (0, 0, 0)]
+# Palette index of the symbols drawn by CursesRenderer, any other character is score or status text.
+SYMBOL_COLORS = {EMPTY_SYMBOL: 1, '+': 2, '-': 2, '|': 2, 'o': 3, 'O': 4, FOOD_SYMBOL: 5}
+COLORS = bytes(SYMBOL_COLORS.get(chr(c), 6) for c in range(256))
+# Bits per pixel of the palette.
+COLOR_BITS = 3
+# Largest LZW code, the code table is cleared before reaching it.
+MAX_CODE = 4095
+
+SCREEN_DESCRIPTOR = struct.Struct('<6sHHBBB')
+IMAGE_DESCRIPTOR = struct.Struct('<BHHHHB')
+# Graphic control extension: introducer, label, size, packed fields, delay, transparent index and terminator.
+GRAPHIC_CONTROL = struct.Struct('<BBBBHBB')
+# Application extension that makes the animation loop forever.
+LOOP_EXTENSION = b'\x21\xff\x0bNETSCAPE2.0\x03\x01\x00\x00\x00'
+TRAILER = b'\x3b'
+
+
+def lzw_encode(pixels, min_code_size):
+    """
+    Compress pixels with the variable length LZW code of GIF images.
+
+    :param pixels: palette index of each pixel, below 2 ** min_code_size
+    :type pixels: bytes
+    :param min_code_size: number of bits of the palette indexes, at least 2
+    :type min_code_size: int
+    :return: the code stream as bytes, without sub-blocks
+    """
+    clear = 1 << min_code_size
+    end = clear + 1
+    out = bytearray()
+    code_size = min_code_size + 1
+    next_code = end + 1
+    table = {}
+    # Codes are packed from the least significant bit on.
+    buffer = clear
+    bits = code_size
+    prefix = pixels[0]
+    for i in range(1, len(pixels)):
+        pixel = pixels[i]
+        key = (prefix << 8) | pixel
+        code = table.get(key)
+        if code is not None:
+            prefix = code
+            continue
+        buffer |= prefix << bits
+        bits += code_size
+        if next_code < MAX_CODE:
+            table[key] = next_code
+            next_code += 1
+            if next_code > 1 << code_size:
+                code_size += 1
+        else:
+            buffer |= clear << bits
+            bits += code_size
+            table = {}
+            next_code = end + 1
+            code_size = min_code_size + 1
+        while bits >= 8:
+            out.append(buffer & 0xFF)
+            buffer >>= 8
+            bits -= 8
+        prefix = pixel
+    buffer |= prefix << bits
+    bits += code_size
+    # The code size may grow after the last code, the end code is read with the grown size.
+    if next_code < MAX_CODE and next_code + 1 > 1 << code_size:
+        code_size += 1
+    buffer |= end << bits
+    bits += code_size
+    while bits > 0:
+        out.append(buffer & 0xFF)
+        buffer >>= 8
+        bits -= 8
+    return bytes(out)
+
+
+def sub_blocks(data):
+    """
+    Split data in GIF sub-blocks of up to 255 bytes, each one after its size, followed by the block terminator.
+
+    :param data: block data
+    :type data: bytes
+    :return: the sub-blocks as bytes
+    """
+    chunks = []
+    for i in range(0, len(data), 255):
+        chunk = data[i:i + 255]
+        chunks.append(bytes((len(chunk),)))
+        chunks.append(chunk)
+    chunks.append(b'\x00')
+    return b''.join(chunks)
+
+
+def changed_region(screen):
+    """
+    Bounding box of the characters of an AnsiScreen that differ between its back and front buffers, among the
+    columns marked as changed. To be called before the screen update, which brings the front buffer up to date.
+
+    :param screen: screen
+    :type screen: AnsiScreen
+    :return: top, left, bottom and right positions, bottom and right excluded, or None if nothing changed
+    """
+    if screen.front is None:
+        return 0, 0, screen.height, screen.width
+    top = left = bottom = right = None
+    for y, (start, stop) in screen.dirty.items():
+        back, front = screen.back[y], screen.front[y]
+        first = next((x for x in range(start, stop) if back[x] != front[x]), None)
+        if first is None:
+            continue
+        last = next(x for x in range(stop - 1, first - 1, -1) if back[x] != front[x]) + 1
+        if top is None:
+            top, left, bottom, right = y, first, y + 1, last
+        else:
+            top, left, bottom, right = min(top, y), min(left, first), max(bottom, y + 1), max(right, last)
+    return None if top is None else (top, left, bottom, right)
+
+
+class AsciicastWriter:
+
+    def __init__(self, path, height, width, title=None):
+        """
+        This class writes frames to an asciicast v2 file, the recording format of asciinema: a JSON header line
+        followed by one JSON line per frame, with its time and the output that draws it on a terminal. The output of
+        each frame is the AnsiScreen update, so it only redraws the characters that changed. Lines are written as the
+        frames come.
+
+        :param path: asciicast file path
+        :type path: str
+        :param height: terminal height
+        :type height: int
+        :param width: terminal width
+        :type width: int
+        :param title: recording title
+        :type title: str
+        """
+        self.file = open(path, 'w')
+        self.end = 0.0
+        header = {'version': 2, 'width': width, 'height': height, 'env': {'TERM': 'xterm-256color'}}
+        if title is not None:
+            header['title'] = title
+        self.file.write(json.dumps(header) + '\n')
+
+    def frame(self, rows, region, data, timestamp, duration):
+        """
+        Write a frame.
+
+        :param rows: characters of each screen row
+        :type rows: list
+        :param region: top, left, bottom and right positions of the changed characters, None if nothing changed
+        :type region: tuple
+        :param data: output that draws the frame over the previous one
+        :type data: bytes
+        :param timestamp: time of the frame since the start of the recording, in seconds
+        :type timestamp: float
+        :param duration: time the frame is shown, in seconds
+        :type duration: float
+        """
+        if data:
+            self.file.write(json.dumps([round(timestamp, 6), 'o', data.decode()]) + '\n')
+        self.end = timestamp + duration
+
+    def close(self):
+        """
+        Write an empty output at the end of the last frame, so that players show it for its whole duration, and close
+        the file.
+        """
+        if self.file.closed:
+            return
+        self.file.write(json.dumps([round(self.end, 6), 'o', '']) + '\n')
+        self.file.close()
+
+
+class GifWriter:
+
+    def __init__(self, path, height, width, scale=4, loop=True):
+        """
+        This class writes frames to an animated GIF file, each character cell drawn as a square block of color: the
+        snake head and body, the food, the walls, the empty cells, and any other character, the score and status
+        text, in a single text color. The first frame is a full image, every following one only covers the bounding
+        box of the cells that changed, with the unchanged cells inside the box left transparent, so most frames are
+        a few cells wide and the transparent runs compress to almost nothing.
+        Each frame is compressed and written as soon as the next one arrives, when its delay is known: only the last
+        frame and the cells currently shown are kept in memory. Delays are in hundredths of a second, rounded on the
+        total elapsed time, so rounding errors do not accumulate.
+
+        :param path: GIF file path
+        :type path: str
+        :param height: screen height, in cells
+        :type height: int
+        :param width: screen width, in cells
+        :type width: int
+        :param scale: size of a cell, in pixels
+        :type scale: int
+        :param loop: play the animation in a loop
+        :type loop: bool
+        """
+        self.scale = scale
+        self.file = open(path, 'wb')
+        self.shown = None
+        # Image descriptor and compressed data of the frame waiting for its delay, and its time.
+        self.pending = None
+        self.pending_time = 0.0
+        self.end = 0.0
+        self.frames = 0
+        self.file.write(SCREEN_DESCRIPTOR.pack(b'GIF89a', width * scale, height * scale, 0x80 | (COLOR_BITS - 1), 0,
+                                               0))
+        self.file.write(b''.join(bytes(color) for color in PALETTE))
+        if loop:
+            self.file.write(LOOP_EXTENSION)
+        # Pixels of each palette index on a scaled row.
+        self.blocks = [bytes((i,)) * scale for i in range(256)]
+
+    def frame(self, rows, region, data, timestamp, duration):
+        """
+        Write a frame.
+
+        :param rows: characters of each screen row
+        :type rows: list
+        :param region: top, left, bottom and right positions of the changed characters, None if nothing changed
+        :type region: tuple
+        :param data: output that draws the frame over the previous one
+        :type data: bytes
+        :param timestamp: time of the frame since the start of the recording, in seconds
+        :type timestamp: float
+        :param duration: time the frame is shown, in seconds
+        :type duration: float
+        """
+        self.end = timestamp + duration
+        if region is None:
+            # The previous frame stays on screen longer.
+            return
+        top, left, bottom, right = region
+        blocks = self.blocks
+        lines = []
+        for y in range(top, bottom):
+            colors = rows[y][left:right].translate(COLORS)
+            if self.shown is not None:
+                shown = self.shown[y][left:right]
+                colors = bytes(TRANSPARENT if c == s else p for c, s, p in zip(rows[y][left:right], shown, colors))
+            line = b''.join(blocks[p] for p in colors)
+            lines.append(line * self.scale)
+        if self.shown is None:
+            self.shown = [bytearray(row) for row in rows]
+        else:
+            for y in range(top, bottom):
+                self.shown[y][left:right] = rows[y][left:right]
+        scale = self.scale
+        image = IMAGE_DESCRIPTOR.pack(0x2c, left * scale, top * scale, (right - left) * scale, (bottom - top) * scale,
+                                      0)
+        image += bytes((COLOR_BITS,)) + sub_blocks(lzw_encode(b''.join(lines), COLOR_BITS))
+        self._write_pending(timestamp)
+        self.pending = image
+        self.pending_time = timestamp
+
+    def _write_pending(self, timestamp):
+        """
+        Write the pending frame, shown until a given time.
+        """
+        if self.pending is None:
+            return
+        delay = round(timestamp * 100) - round(self.pending_time * 100)
+        # Frames are drawn over the previous ones, the first one is opaque.
+        flags = (1 << 2) | (1 if self.frames > 0 else 0)
+        self.file.write(GRAPHIC_CONTROL.pack(0x21, 0xf9, 4, flags, min(delay, 0xffff), TRANSPARENT, 0))
+        self.file.write(self.pending)
+        self.pending = None
+        self.frames += 1
+
+    def close(self):
+        """
+        Write the last frame and the trailer and close the file.
+        """
+        if self.file.closed:
+            return
+        self._write_pending(self.end)
+        self.file.write(TRAILER)
+        self.file.close()
+
+
+def export(path, writers, max_speed=30, start=0, stop=None):
+    """
+    Replay a recorded game and send each frame to writers. The game is stepped with the recorded directions, read
+    one block at a time, and drawn by a CursesRenderer on an AnsiScreen, so frames show the same cells as the game
+    and only the cells that changed are redrawn. Frames are timed like the game: each one is shown for one tick at
+    the game speed, capped at max_speed, and the last one for END_HOLD seconds. Memory does not depend on the length
+    of the game.
+
+    :param path: replay file path
+    :type path: str
+    :param writers: frame writers, with the frame method of AsciicastWriter and GifWriter
+    :type writers: list
+    :param max_speed: maximum ticks per second
+    :type max_speed: float
+    :param start: first tick exported
+    :type start: int
+    :param stop: tick after the last one exported, defaults to the end of the game
+    :type stop: int
+    :return: number of frames
+    """
+    with ReplayReader(path) as reader:
+        stop = reader.ticks if stop is None else min(stop, reader.ticks)
+        engine = reader.seek(start)
+        height, width = reader.board_height, reader.board_width
+        screen = AnsiScreen(None, height, width)
+        renderer = CursesRenderer(screen, height, width, doupdate=lambda: None)
+        timestamp = 0.0
+
+        def draw(duration):
+            renderer.render(engine)
+            region = changed_region(screen)
+            data = screen.diff()
+            for writer in writers:
+                writer.frame(screen.back, region, data, timestamp, duration)
+
+        interval = reader.keyframe_interval
+        for block_start in range(start, stop, interval):
+            block_stop = min(block_start + interval, stop)
+            # The food is placed as recorded, the engine restored from a keyframe may place it elsewhere.
+            foods = reader.foods(block_start + 1, block_stop)
+            for direction in reader.actions(block_start, block_stop):
+                period = 1 / min(engine.speed, max_speed)
+                draw(period)
+                engine.step(direction)
+                food = foods.get(engine.ticks)
+                if food is not None:
+                    engine.food.set_position(*food)
+                timestamp += period
+        draw(END_HOLD)
+    return stop - start + 1
+
+
+def add_arguments(parser):
+    """
+    Add the export command line arguments.
+
+    :param parser: argument parser
+    :type parser: argparse.ArgumentParser
+    """
+    parser.add_argument('path', help='replay file')
+    parser.add_argument('--cast', help='asciicast v2 output file')
+    parser.add_argument('--gif', help='animated GIF output file')
+    parser.add_argument('--scale', type=int, default=4, help='GIF pixels per board cell')
+    parser.add_argument('--max-speed', type=float, default=30, help='maximum ticks per second')
+    parser.add_argument('--start', type=int, default=0, help='first tick')
+    parser.add_argument('--stop', type=int, default=None, help='tick after the last one')
+
+
+def main(args):
+    """
+    Export a replay file from the command line arguments.
+
+    :param args: parsed command line arguments
+    :type args: argparse.Namespace
+    """
+    if args.cast is None and args.gif is None:
+        sys.exit('Nothing to export, give --cast and/or --gif')
+    with ReplayReader(args.path) as reader:
+        height, width = reader.board_height, reader.board_width
+    writers = []
+    if args.cast is not None:
+        writers.append(AsciicastWriter(args.cast, height, width, title=args.path))
+    if args.gif is not None:
+        writers.append(GifWriter(args.gif, height, width, scale=args.scale))
+    start = time.monotonic()
+    try:
+        frames = export(args.path, writers, max_speed=args.max_speed, start=args.start, stop=args.stop)
+    finally:
+        for writer in writers:
+            writer.close()
+    elapsed = time.monotonic() - start
+    print('{} frames exported in {:.2f}s'.format(frames, elapsed), file=sys.stderr)
@@ -3,15 +3,27 @@ Copyright 2019
 Author: Joao Carvalho <joao.ac.carvalho@gmail.com>
 """
 import curses
+import sys
 import time
-from .components import Snake, Food
+from .agents import agent_name
+from .engine import Engine, PLAYING
+from .render import AnsiScreen, CursesRenderer, ViewportRenderer, draw_border
+from .clock import TickScheduler
+from .input import InputQueue
+from .replay import Recorder
+from .profiling import NullProfiler, PhaseProfiler
+from .store import ScoreStore
+from .tournament import GameResult
 
 
 class Game:
 
-    def __init__(self, stdscr, board_height=20, board_width=40, initial_speed=2, speed_increase=0.5):
+    def __init__(self, stdscr, board_height=20, board_width=40, initial_speed=2, speed_increase=0.5, max_speed=30,
+                 record=None, agent=None, renderer='curses', profile=None, overlay=False, viewport=None,
+                 scores=None, game_map=None, events=None):
         """
-        This class implements the game logic and manages the gameplay.
+        This class implements the curses front-end and manages the gameplay. The game rules live in the headless
+        Engine, this class only reads the keyboard, paces the game and renders the engine state.
         A snake moves around a board game, changing its direction when the player presses one of the keyboard
         arrow keys. The goal is to collect as many food as possible. If the snake eats the food the score
         increases by one. The game ends if the snake hits itself or the board walls.
@@ -26,21 +38,101 @@ class Game:
         :int initial_speed: int
         :param speed_increase: game speed incremental increase after eating a food element
         :type speed_increase: int
+        :param max_speed: maximum ticks per second, the game speed keeps increasing but the tick rate is capped
+        :type max_speed: float
+        :param record: path of a replay file to record the game to
+        :type record: str
+        :param agent: agent that steers the snake instead of the arrow keys, the q key still quits the game
+        :type agent: Agent
+        :param renderer: 'curses' to draw the game with curses, 'ansi' to write each frame to the standard output as
+                         a single write of ANSI escape sequences. The keyboard is always read with curses
+        :type renderer: str
+        :param profile: path of a JSON file the time spent in each phase of the game loop is written to on exit
+        :type profile: str
+        :param overlay: show the actual and target tick rates and the phase times on the bottom border
+        :type overlay: bool
+        :param viewport: show the board through a viewport that follows the snake head, with the curses renderer.
+                         None to do it only if the board is larger than the terminal
+        :type viewport: bool
+        :param scores: path of a score database the result of the game is added to, see ScoreStore
+        :type scores: str
+        :param game_map: map of the board, see GameMap, its size replaces board_height and board_width
+        :type game_map: GameMap
+        :param events: stream the game events are emitted to, once per tick, closed with the game
+        :type events: EventStream
         """
         self.stdscr = stdscr
-        self.board_height = max(10, board_height)
-        self.board_width = max(10, board_width)
-        self.speed = initial_speed
-        self.speed_increase = speed_increase
-        self.score = 0
+        self.engine = Engine(board_height=board_height, board_width=board_width, initial_speed=initial_speed,
+                             speed_increase=speed_increase, game_map=game_map)
+        self.board_height = self.engine.board_height
+        self.board_width = self.engine.board_width
+        self.recorder = Recorder(record, self.engine) if record is not None else None
+        self.scores = scores
+        self.events = events
+        self.agent = agent
+        if self.agent is not None:
+            self.agent.reset(self.board_height, self.board_width, self.engine.seed)
 
         self.direction_map = {curses.KEY_UP: 'UP', curses.KEY_DOWN: 'DOWN',
                               curses.KEY_RIGHT: 'RIGHT', curses.KEY_LEFT: 'LEFT'}
-
-        # Setup board, snake and food.
+        # Turns pressed by the player, applied one per tick.
+        self.input = InputQueue()
+
+        # Boards larger than the terminal are shown through a viewport.
+        screen_height, screen_width = self.stdscr.getmaxyx()
+        if viewport is None:
+            viewport = self.board_height > screen_height or self.board_width > screen_width
+        self.viewport = viewport
+        # Height of the screen area the welcome and exit messages are centered in.
+        self.text_height = min(self.board_height, screen_height)
+
+        # Setup board.
         self.setup_game()
-        self.snake = Snake(y=self.board_height//2, x=self.board_width//2, initial_size=3)
-        self.food = Food(max_y=self.board_height, max_x=self.board_width)
+        if self.viewport:
+            if renderer != 'curses':
+                raise ValueError('Boards larger than the terminal can only be drawn with the curses renderer')
+            self.renderer = ViewportRenderer(self.stdscr, self.board_height, self.board_width)
+        elif renderer == 'ansi':
+            screen = AnsiScreen(sys.stdout.buffer, self.board_height, self.board_width)
+            self.renderer = CursesRenderer(screen, self.board_height, self.board_width, doupdate=screen.flush)
+        else:
+            self.renderer = CursesRenderer(self.stdscr, self.board_height, self.board_width)
+        self.scheduler = TickScheduler(self.speed, max_rate=max_speed)
+
+        # Time the game loop phases, only if asked to.
+        self.profile = profile
+        self.overlay = overlay
+        self.profiler = PhaseProfiler() if profile is not None or overlay else NullProfiler()
+        self.profiler.instrument(self.engine, 'check_collisions', 'collisions')
+        self.profiler.instrument(self.engine, 'place_food', 'place_food')
+
+    @property
+    def snake(self):
+        """
+        Getter for the engine snake.
+        """
+        return self.engine.snake
+
+    @property
+    def food(self):
+        """
+        Getter for the engine food.
+        """
+        return self.engine.food
+
+    @property
+    def score(self):
+        """
+        Getter for the current score.
+        """
+        return self.engine.score
+
+    @property
+    def speed(self):
+        """
+        Getter for the current game speed.
+        """
+        return self.engine.speed
 
     def setup_game(self):
         """
@@ -48,8 +140,9 @@ class Game:
         """
         # Hide cursor.
         curses.curs_set(0)
-        # Resize screen.
-        self.stdscr.resize(self.board_height, self.board_width)
+        # Resize screen, unless the board is shown through a viewport.
+        if not self.viewport:
+            self.stdscr.resize(self.board_height, self.board_width)
         # Clear the screen.
         self.stdscr.clear()
         # Do not wait for a key press.
@@ -62,6 +155,19 @@ class Game:
         :param exit_code: 'LOST', 'WIN', 'END'
         :type exit_code: str
         """
+        if self.recorder is not None:
+            self.recorder.close()
+        if self.events is not None:
+            if self.engine.status == PLAYING:
+                self.events.game_over(self.engine, exit_code)
+            self.events.close()
+        if self.profile is not None:
+            self.profiler.dump(self.profile, extra={'input': self.input.stats()})
+        if self.scores is not None:
+            with ScoreStore(self.scores) as store:
+                store.add(GameResult(self.engine.seed, agent_name(self.agent) if self.agent is not None else 'human',
+                                     self.score, self.snake.size, self.engine.ticks, exit_code))
+
         exit_msg = ""
         if exit_code == 'LOST':
             exit_msg = "You LOST!\nScore: {}".format(self.score)
@@ -71,13 +177,13 @@ class Game:
             exit_msg = "You ended the game!\nScore: {}".format(self.score)
 
         self.stdscr.clear()
-        self.draw_board()
+        draw_border(self.stdscr)
         self.stdscr.nodelay(False)
 
         exit_msg += '\n\nPress any key to quit the game.'
         offset = 3
         for i, msg in enumerate(exit_msg.split('\n')):
-            self.stdscr.addstr(self.board_height // 2 - 5 + i, offset, msg)
+            self.stdscr.addstr(self.text_height // 2 - 5 + i, offset, msg)
         self.stdscr.getch()
         exit(0)
 
@@ -87,10 +193,7 @@ class Game:
 
         :return: True if the snake hits the board wall, False otherwise
         """
-        s_y, s_x = self.snake.get_head_position()
-        if s_y == 0 or s_y == self.board_height - 1 or s_x == 0 or s_x == self.board_width - 1:
-            return True
-        return False
+        return self.engine.check_board_collision()
 
     def check_food_colision(self):
         """
@@ -98,9 +201,7 @@ class Game:
 
         :return: True if the head of the snake is at the same position as the food, False otherwise
         """
-        s_y, s_x = self.snake.get_head_position()
-        f_y, f_x = self.food.get_position()
-        return True if (s_y == f_y and s_x == f_x) else False
+        return self.engine.check_food_colision()
 
     def check_snake_collision(self):
         """
@@ -108,94 +209,38 @@ class Game:
 
         :return: True if collision with any body part, False otherwise
         """
-        if self.snake.size == 1:
-            return False
-        h_y, h_x = self.snake.get_head_position()
-        for i in range(1, self.snake.size):
-            b_y, b_x = self.snake.get_body_position(i)
-            if h_y == b_y and h_x == b_x:
-                return True
-        return False
+        return self.engine.check_snake_collision()
 
     def place_food(self):
         """
         Place the food in a random position, where it doesn't hit the snake.
         """
-        collision = True
-        while collision:
-            collision = False
-            self.food.random_position()
-            f_y, f_x = self.food.get_position()
-            for snake_body in self.snake.get_body():
-                s_y = snake_body.y
-                s_x = snake_body.x
-                if s_y == f_y and s_x == f_x:
-                    collision = True
-                    break
+        self.engine.place_food()
 
     def draw_board(self):
         """
         Renders the board game on screen.
         """
-        self.stdscr.border('|', '|', '-', '-', '+', '+', '+', '+')
+        self.renderer.draw_board()
 
     def draw_snake(self):
         """
         Render the snake on screen.
         """
-        # Draw head.
-        h_y, h_x = self.snake.get_head_position()
-        self.stdscr.addch(h_y, h_x, self.snake.head_symbol)
-        # Draw body.
-        if self.snake.size > 1:
-            snake_symbol = self.snake.body_symbol
-            for i in range(1, self.snake.size):
-                s_y, s_x = self.snake.get_body_position(i)
-                self.stdscr.addch(s_y, s_x, snake_symbol)
+        self.renderer.draw_snake(self.snake)
 
     def draw_food(self):
         """
         Render the food on screen.
         """
-        f_y, f_x = self.food.get_position()
-        self.stdscr.addch(f_y, f_x, 'X')
+        self.renderer.draw_food(self.food)
 
     def render(self):
         """
-        Renders the board game, snake and food.
-        """
-        # Render board.
-        self.draw_board()
-
-        # Display the score.
-        self.stdscr.addstr(0, self.board_width // 2 - 5, "Score: {}".format(self.score))
-
-        # Render Snake.
-        self.draw_snake()
-
-        # Render Food.
-        self.draw_food()
-
-        # Update the screen.
-        self.stdscr.refresh()
-
-    def check_collisions(self):
-        """
-        Check for food, snake and board collisions.
-        If there's a food colision, enlarge the snake body. If the snake hits itself or the board, quit the game.
+        Renders the board game, snake and food. Only the positions that changed since the previous frame are
+        redrawn.
         """
-        # Check for food collisions.
-        if self.check_food_colision():
-            self.place_food()
-            # Increase the score, snake body and game speed.
-            self.score += 1
-            self.snake.increase_body()
-            self.speed += self.speed_increase
-
-        # Check for body and board collisions.
-        if self.check_snake_collision() or self.check_board_collision():
-            time.sleep(1.5)  # Display the last state of the game.
-            self.exit_game('LOST')
+        self.renderer.render(self.engine)
 
     def welcome_screen(self):
         """
@@ -203,14 +248,17 @@ class Game:
         """
         # Wait for a key press.
         self.stdscr.nodelay(False)
-        self.draw_board()
+        draw_border(self.stdscr)
         msg = "Welcome to the SNAKE game!\n\nCollect as much as food as \nyou can by moving the snake \n"
         msg += "with the ARROW keys.\n\nPress any key to start playing.\nPress q to quit at anytime."
         offset = 3
         for i, line in enumerate(msg.split('\n')):
-            self.stdscr.addstr(self.board_height // 2 - 6 + i, offset, line)
+            self.stdscr.addstr(self.text_height // 2 - 6 + i, offset, line)
         self.stdscr.getch()
+        # Clear the screen now, the game may not be drawn with curses.
         self.stdscr.clear()
+        self.stdscr.refresh()
+        self.renderer.invalidate()
         # Do not wait for a key press.
         self.stdscr.nodelay(True)
 
@@ -219,22 +267,50 @@ class Game:
         Implement the game logic.
         """
         self.welcome_screen()
+        profiler = self.profiler
+        if self.events is not None:
+            self.events.observe(self.engine)
+        self.scheduler.start()
         while True:
             # Render objects on screen.
+            if self.overlay and profiler.ticks % 10 == 0:
+                self.renderer.set_status(profiler.overlay())
+            profiler.start('render')
             self.render()
-
-            # Read key press.
-            c = self.stdscr.getch()
-            self.stdscr.clear()
-
-            if c == ord('q'):
-                self.exit_game('END')
-            elif c in self.direction_map:
-                self.snake.change_direction(self.direction_map[c])
-
-            self.snake.move()
-
-            # Check for food, snake or board collisions.
-            self.check_collisions()
-
-            time.sleep(1 / self.speed)
+            profiler.stop()
+
+            # Read key presses as soon as they arrive, until the next tick is due, and queue the turns.
+            profiler.start('idle')
+            while self.scheduler.wait(sys.stdin):
+                profiler.start('input')
+                c = self.stdscr.getch()
+                while c != -1:
+                    if c == ord('q'):
+                        self.exit_game('END')
+                    elif c in self.direction_map and self.agent is None:
+                        self.input.push(self.direction_map[c], self.snake.head_direction)
+                    c = self.stdscr.getch()
+                profiler.stop()
+            profiler.stop()
+            direction = self.input.pop(self.snake.head_direction)
+            if self.agent is not None:
+                profiler.start('agent')
+                direction = self.agent.act(self.engine.get_state())
+                profiler.stop()
+
+            # Move the snake and check for food, snake or board collisions. The move phase is the rest of the step.
+            profiler.start('move')
+            _, _, done = self.engine.step(direction)
+            profiler.stop()
+            if self.events is not None:
+                profiler.start('events')
+                self.events.observe(self.engine)
+                profiler.stop()
+            if done:
+                profiler.tick()
+                time.sleep(1.5)  # Display the last state of the game.
+                self.exit_game(self.engine.status)
+
+            self.scheduler.set_rate(self.speed)
+            missed = self.scheduler.tick()
+            profiler.tick(self.scheduler.rate, missed)
@@ -0,0 +1,116 @@
+"""
+Copyright 2019
+Author: Joao Carvalho <joao.ac.carvalho@gmail.com>
+"""
+import time
+from collections import deque
+from .components import OPPOSITE
+from .stats import percentile
+
+
+class InputQueue:
+
+    def __init__(self, capacity=3, window=1000, clock=time.monotonic):
+        """
+        This class buffers the turns pressed by the player between ticks, so that quick sequences of key presses,
+        such as UP then LEFT to make a U-turn, are applied one per tick instead of only keeping the last one.
+        Each press is checked against the direction the snake will have when the press is applied, the last queued
+        turn or the current heading: a press of that same direction is redundant and coalesced, a press of the
+        opposite direction would make the snake run into its own neck and is dropped. Presses beyond the capacity
+        are dropped too, so the queue never lags more than capacity ticks behind the keyboard.
+        The time between each key press and the tick that applies it is kept for the last window turns.
+
+        :param capacity: maximum number of queued turns
+        :type capacity: int
+        :param window: number of latencies kept
+        :type window: int
+        :param clock: monotonic clock in seconds
+        :type clock: function
+        """
+        self.capacity = capacity
+        self.clock = clock
+        # Queued directions and the time they were pressed.
+        self.turns = deque()
+        self.latencies = deque(maxlen=window)
+        self.presses = 0
+        self.applied = 0
+        self.coalesced = 0
+        self.reversals = 0
+        self.dropped = 0
+
+    def __len__(self):
+        """
+        Number of queued turns.
+        """
+        return len(self.turns)
+
+    def push(self, direction, heading):
+        """
+        Queue a key press.
+
+        :param direction: pressed direction, 'UP', 'DOWN', 'LEFT' or 'RIGHT'
+        :type direction: str
+        :param heading: current snake head direction
+        :type heading: str
+        :return: True if the turn was queued, False if it was coalesced or dropped
+        """
+        self.presses += 1
+        last = self.turns[-1][0] if self.turns else heading
+        if direction == last:
+            self.coalesced += 1
+            return False
+        if direction == OPPOSITE[last]:
+            self.reversals += 1
+            return False
+        if len(self.turns) >= self.capacity:
+            self.dropped += 1
+            return False
+        self.turns.append((direction, self.clock()))
+        return True
+
+    def pop(self, heading):
+        """
+        Take the next turn, to apply in the current tick. The other turns stay queued for the next ticks.
+
+        :param heading: current snake head direction
+        :type heading: str
+        :return: the direction, None if there are no turns queued
+        """
+        while self.turns:
+            direction, pressed = self.turns.popleft()
+            # The heading may have changed since the turn was queued, e.g. after a new game.
+            if direction == heading:
+                self.coalesced += 1
+            elif direction == OPPOSITE[heading]:
+                self.reversals += 1
+            else:
+                self.applied += 1
+                self.latencies.append(self.clock() - pressed)
+                return direction
+        return None
+
+    def clear(self):
+        """
+        Drop every queued turn.
+        """
+        self.dropped += len(self.turns)
+        self.turns.clear()
+
+    def stats(self):
+        """
+        Statistics of the key presses.
+
+        :return: dictionary with the number of presses, of applied, coalesced, reversed and dropped turns, and the
+                 median, 99th percentile and maximum latency between a press and the tick that applied it, in
+                 milliseconds
+        """
+        latencies = sorted(self.latencies) or [0.0]
+        return {
+            'presses': self.presses,
+            'applied': self.applied,
+            'coalesced': self.coalesced,
+            'reversals': self.reversals,
+            'dropped': self.dropped,
+            'latency_ms': {'p50': percentile(latencies, 50) * 1e3, 'p99': percentile(latencies, 99) * 1e3,
+                           'max': latencies[-1] * 1e3},
+        }
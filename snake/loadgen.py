@@ -0,0 +1,208 @@
+"""
+Copyright 2019
+Author: Joao Carvalho <joao.ac.carvalho@gmail.com>
+"""
+import asyncio
+import json
+import sys
+import time
+from .components import Snake
+from .server import (FrameDecoder, SessionView, encode_frame, JOIN_PAYLOAD, TURN_PAYLOAD, JOIN, TURN, START,
+                     DELTA, ERROR)
+from .stats import percentile
+
+
+class LoadStats:
+
+    def __init__(self):
+        """
+        This class gathers the counters of a load run, across all client connections.
+        """
+        self.started = 0
+        self.finished = 0
+        self.deltas = 0
+        self.errors = 0
+        self.bytes = 0
+        # Seconds between the deltas of consecutive ticks of the first session of each connection.
+        self.gaps = []
+
+
+class LoadClient(asyncio.Protocol):
+
+    def __init__(self, session_ids, stats, board_height=20, board_width=40):
+        """
+        This class plays many sessions over a single connection. Each session turns towards the food, avoiding
+        the walls and reversals but not its body, and joins a new game as soon as its game ends, so the number of
+        sessions stays constant. A direction is only sent when it changes.
+
+        :param session_ids: ids of the sessions of this connection
+        :type session_ids: list
+        :param stats: counters shared by all the connections
+        :type stats: LoadStats
+        :param board_height: board game height
+        :type board_height: int
+        :param board_width: board game width
+        :type board_width: int
+        """
+        self.session_ids = session_ids
+        self.stats = stats
+        self.join_payload = JOIN_PAYLOAD.pack(board_height, board_width, -1)
+        self.decoder = FrameDecoder()
+        self.views = {}
+        self.transport = None
+        self.last_delta = None
+        self.closed = asyncio.get_running_loop().create_future()
+
+    def connection_made(self, transport):
+        self.transport = transport
+        transport.write(b''.join(encode_frame(JOIN, session_id, self.join_payload)
+                                 for session_id in self.session_ids))
+
+    def connection_lost(self, exc):
+        if not self.closed.done():
+            self.closed.set_result(exc)
+
+    def data_received(self, data):
+        stats = self.stats
+        stats.bytes += len(data)
+        frames = []
+        for kind, session_id, payload in self.decoder.feed(data):
+            if kind == DELTA:
+                view = self.views[session_id]
+                view.apply(payload)
+                stats.deltas += 1
+                if session_id == self.session_ids[0]:
+                    now = time.monotonic()
+                    if self.last_delta is not None:
+                        stats.gaps.append(now - self.last_delta)
+                    self.last_delta = now
+                if view.status != 'PLAYING':
+                    stats.finished += 1
+                    frames.append(encode_frame(JOIN, session_id, self.join_payload))
+                    continue
+                direction = self.steer(view)
+                if direction != view.direction:
+                    view.direction = direction
+                    frames.append(encode_frame(TURN, session_id,
+                                               TURN_PAYLOAD.pack(Snake.directions.index(direction))))
+            elif kind == START:
+                self.views[session_id] = SessionView(payload)
+                stats.started += 1
+                if session_id == self.session_ids[0]:
+                    self.last_delta = None
+            elif kind == ERROR:
+                stats.errors += 1
+        if frames:
+            self.transport.write(b''.join(frames))
+
+    @staticmethod
+    def steer(view):
+        """
+        Direction towards the food, without going into a wall or back into the neck of the snake.
+
+        :param view: session view
+        :type view: SessionView
+        :return: the new direction
+        """
+        h_y, h_x = view.get_head_position()
+        f_y, f_x = view.get_food_position()
+        opposite = {'RIGHT': 'LEFT', 'LEFT': 'RIGHT', 'UP': 'DOWN', 'DOWN': 'UP'}[view.direction]
+        candidates = []
+        if f_x != h_x:
+            candidates.append('RIGHT' if f_x > h_x else 'LEFT')
+        if f_y != h_y:
+            candidates.append('DOWN' if f_y > h_y else 'UP')
+        candidates.extend([view.direction, 'UP', 'DOWN', 'RIGHT', 'LEFT'])
+        for direction in candidates:
+            y = h_y + (direction == 'DOWN') - (direction == 'UP')
+            x = h_x + (direction == 'RIGHT') - (direction == 'LEFT')
+            if direction != opposite and 0 < y < view.board_height - 1 and 0 < x < view.board_width - 1:
+                return direction
+        return view.direction
+
+
+async def run_load(host, port, sessions=5000, connections=50, duration=30, board_height=20, board_width=40):
+    """
+    Play sessions on a game server for a while and measure the delivered tick rate.
+
+    :param host: server address
+    :type host: str
+    :param port: server port
+    :type port: int
+    :param sessions: number of simultaneous sessions
+    :type sessions: int
+    :param connections: number of connections the sessions are spread over
+    :type connections: int
+    :param duration: seconds to measure for, after every session started
+    :type duration: float
+    :param board_height: board game height
+    :type board_height: int
+    :param board_width: board game width
+    :type board_width: int
+    :return: dictionary with the load statistics
+    """
+    loop = asyncio.get_running_loop()
+    stats = LoadStats()
+    clients = []
+    for i in range(connections):
+        session_ids = list(range(i, sessions, connections))
+        if session_ids:
+            _, client = await loop.create_connection(
+                lambda: LoadClient(session_ids, stats, board_height, board_width), host, port)
+            clients.append(client)
+    while stats.started < sessions and stats.errors == 0:
+        await asyncio.sleep(0.1)
+
+    deltas, finished, received = stats.deltas, stats.finished, stats.bytes
+    stats.gaps = []
+    start = time.monotonic()
+    await asyncio.sleep(duration)
+    elapsed = time.monotonic() - start
+    for client in clients:
+        client.transport.close()
+    await asyncio.gather(*(client.closed for client in clients))
+
+    gaps = sorted(stats.gaps) or [0.0]
+    return {
+        'sessions': sessions,
+        'connections': len(clients),
+        'seconds': elapsed,
+        'errors': stats.errors,
+        'games_finished': stats.finished - finished,
+        'ticks_per_session_per_second': (stats.deltas - deltas) / sessions / elapsed,
+        'deltas_per_second': (stats.deltas - deltas) / elapsed,
+        'bytes_per_second': (stats.bytes - received) / elapsed,
+        'tick_gap_ms': {'p50': percentile(gaps, 50) * 1e3, 'p99': percentile(gaps, 99) * 1e3,
+                        'max': gaps[-1] * 1e3},
+    }
+
+
+def add_arguments(parser):
+    """
+    Add the load generator command line arguments.
+
+    :param parser: argument parser
+    :type parser: argparse.ArgumentParser
+    """
+    parser.add_argument('--host', default='127.0.0.1', help='server address')
+    parser.add_argument('--port', type=int, default=8765, help='server port')
+    parser.add_argument('--sessions', type=int, default=5000, help='simultaneous sessions')
+    parser.add_argument('--connections', type=int, default=50, help='connections the sessions are spread over')
+    parser.add_argument('--duration', type=float, default=30, help='seconds to measure for')
+    parser.add_argument('--board-height', type=int, default=20)
+    parser.add_argument('--board-width', type=int, default=40)
+
+
+def main(args):
+    """
+    Run the load generator from the command line arguments and print its statistics.
+
+    :param args: parsed command line arguments
+    :type args: argparse.Namespace
+    """
+    stats = asyncio.run(run_load(args.host, args.port, sessions=args.sessions, connections=args.connections,
+                                 duration=args.duration, board_height=args.board_height,
+                                 board_width=args.board_width))
+    print(json.dumps(stats, indent=2))
+    if stats['errors']:
+        print('{} sessions could not be started'.format(stats['errors']), file=sys.stderr)
@@ -0,0 +1,347 @@
+"""
+Copyright 2019
+Author: Joao Carvalho <joao.ac.carvalho@gmail.com>
+"""
+import mmap
+import struct
+import sys
+from array import array
+from .components import FreeCells, cell_typecode
+
+
+MAGIC = b'SNKM'
+VERSION = 2
+# Header: magic, version, height, width, start y and x, -1 without a start position, number of links, of portal cells
+# and of free cells. The free cells index arrays that end the file start at a multiple of 4 bytes.
+HEADER = struct.Struct('<4sBxxxIIiiIII')
+
+# Map file symbols. Portals are lower case letters, each one on exactly two cells.
+WALL_SYMBOL = '#'
+START_SYMBOL = 'S'
+OPEN_SYMBOLS = ' .'
+PORTAL_SYMBOLS = 'abcdefghijklmnopqrstuvwxyz'
+# Position offset of each direction, in the order of Snake.directions.
+OFFSETS = [(0, 1), (0, -1), (-1, 0), (1, 0)]
+
+
+def _bit(mask, cell):
+    """
+    Value of the bit of a cell in a bitmask.
+    """
+    return mask[cell >> 3] >> (cell & 7) & 1
+
+
+def _copy(typecode, values):
+    """
+    Copy of an array, or of a memory-mapped view of one, in a single pass over its bytes.
+    """
+    copy = array(typecode)
+    copy.frombytes(memoryview(values).cast('B'))
+    return copy
+
+
+class GameMap:
+
+    def __init__(self, height, width, walls, exits, links, portals, start=None, free_state=None):
+        """
+        This class implements a board map compiled to lookup tables: walls and obstacles anywhere on the board,
+        portals and edges that wrap around. The walls are a bitmask with one bit per cell, so checking a cell takes a
+        single lookup however complex the map is. Moves are the usual step to the next cell except from the few cells
+        marked in a second bitmask, the open cells on the board edges and next to portals, whose moves are looked up
+        in a table of links, by cell and direction. An open cell on an edge wraps around to the opposite edge. A move
+        into a portal comes out of the other portal with the same letter, on its next cell in the move direction.
+        Portal cells themselves are never occupied, they count as walls.
+        The free cells index of a new game, which food is placed from, is computed once with the map. Maps are
+        parsed from text, see parse_map, and can be saved in a binary form that load_map memory-maps, so the
+        bitmasks and the free cells index of a large map are not read until used, and each game copies the index
+        straight from the mapped file.
+
+        :param height: board height
+        :type height: int
+        :param width: board width
+        :type width: int
+        :param walls: bitmask of the wall and portal cells
+        :type walls: bytearray
+        :param exits: bitmask of the cells with links
+        :type exits: bytearray
+        :param links: destination cell of the moves of linked cells, by cell * 4 + direction code
+        :type links: dict
+        :param portals: portal letter of each portal cell
+        :type portals: dict
+        :param start: y and x snake head start position, None for the center of the board
+        :type start: tuple
+        :param free_state: free cells and slot of each cell of a new game, see FreeCells.getstate, as arrays or
+                           memory views of the cell typecode, computed from the walls by default
+        :type free_state: tuple
+        """
+        self.height = height
+        self.width = width
+        self.walls = walls
+        self.exits = exits
+        self.links = links
+        self.portals = portals
+        self.start = start
+        if free_state is None:
+            free_state = FreeCells(height, width, walls=walls).getstate()
+        self.free_state = free_state
+        # Memory-mapped file of a loaded map.
+        self.mm = None
+
+    def close(self):
+        """
+        Unmap the file of a loaded map.
+        """
+        if self.mm is not None:
+            for view in (self.walls, self.exits) + self.free_state:
+                view.release()
+            self.mm.close()
+            self.mm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def is_wall(self, cell):
+        """
+        Checks if a cell is a wall, an obstacle or a portal.
+
+        :param cell: flattened cell, y * width + x
+        :type cell: int
+        :return: True if the snake dies entering the cell
+        """
+        return self.walls[cell >> 3] >> (cell & 7) & 1 == 1
+
+    def move(self, cell, direction):
+        """
+        Cell reached by moving from a cell.
+
+        :param cell: flattened cell
+        :type cell: int
+        :param direction: direction code, the index of the direction in Snake.directions
+        :type direction: int
+        :return: flattened destination cell
+        """
+        if self.exits[cell >> 3] >> (cell & 7) & 1:
+            destination = self.links.get((cell << 2) | direction)
+            if destination is not None:
+                return destination
+        return cell + (1, -1, -self.width, self.width)[direction]
+
+    def free_cells(self):
+        """
+        Index of the free cells of a new game on the map, without a snake.
+
+        :return: free cells index
+        """
+        typecode = cell_typecode(self.height * self.width)
+        cells, slots = self.free_state
+        state = (_copy(typecode, cells), _copy(typecode, slots))
+        return FreeCells(self.height, self.width, walls=self.walls, state=state)
+
+    def symbol(self, y, x):
+        """
+        Symbol of a map position: a wall, a portal letter or an empty cell.
+
+        :param y: y position
+        :type y: int
+        :param x: x position
+        :type x: int
+        :return: the symbol
+        """
+        cell = y * self.width + x
+        if not _bit(self.walls, cell):
+            return ' '
+        return self.portals.get(cell, WALL_SYMBOL)
+
+    def row(self, y, start=0, stop=None):
+        """
+        Symbols of a range of positions of a map row, the same as symbol for each position.
+
+        :param y: y position
+        :type y: int
+        :param start: first x position
+        :type start: int
+        :param stop: x position after the last one, defaults to the map width
+        :type stop: int
+        :return: the symbols as a string
+        """
+        stop = self.width if stop is None else stop
+        return ''.join(self.symbol(y, x) for x in range(start, stop))
+
+    def save(self, path):
+        """
+        Write the map in its binary form.
+
+        :param path: map file path
+        :type path: str
+        """
+        cells, slots = self.free_state
+        keys = array('Q', sorted(self.links))
+        portal_cells = array('I', sorted(self.portals))
+        start_y, start_x = self.start if self.start is not None else (-1, -1)
+        with open(path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, VERSION, self.height, self.width, start_y, start_x, len(keys),
+                                len(portal_cells), len(cells)))
+            f.write(self.walls)
+            f.write(self.exits)
+            f.write(keys.tobytes())
+            f.write(array('I', (self.links[key] for key in keys)).tobytes())
+            f.write(portal_cells.tobytes())
+            f.write(''.join(self.portals[cell] for cell in portal_cells).encode())
+            f.write(bytes(-f.tell() % 4))
+            f.write(memoryview(cells).cast('B'))
+            f.write(memoryview(slots).cast('B'))
+
+
+def _resolve(y, x, direction, height, width, partners):
+    """
+    Cell reached by a move, wrapping around the edges and through portals.
+    """
+    dy, dx = OFFSETS[direction]
+    cell = None
+    # A chain of portals that loops back ends on a portal cell, a wall.
+    for _ in range(len(partners) + 1):
+        y, x = (y + dy) % height, (x + dx) % width
+        cell = y * width + x
+        if cell not in partners:
+            return cell
+        y, x = divmod(partners[cell], width)
+    return cell
+
+
+def parse_map(text):
+    """
+    Compile a map from its text form: one line per board row, with '#' for walls and obstacles, ' ' or '.' for open
+    cells, 'S' for the open cell of the snake head at the start, the body extending to its left, and a lower case
+    letter on each of the two cells of a portal. Open cells on the edges of the board wrap around.
+
+    :param text: map text
+    :type text: str
+    :return: the compiled map
+    """
+    rows = text.splitlines()
+    while rows and not rows[-1]:
+        rows.pop()
+    height = len(rows)
+    width = len(rows[0]) if rows else 0
+    if height < 3 or width < 3 or any(len(row) != width for row in rows):
+        raise ValueError('A map must be a rectangle of at least 3x3 cells')
+    walls = bytearray((height * width + 7) // 8)
+    portal_cells = {}
+    start = None
+    for y, row in enumerate(rows):
+        for x, symbol in enumerate(row):
+            cell = y * width + x
+            if symbol == WALL_SYMBOL or symbol in PORTAL_SYMBOLS:
+                walls[cell >> 3] |= 1 << (cell & 7)
+                if symbol in PORTAL_SYMBOLS:
+                    portal_cells.setdefault(symbol, []).append(cell)
+            elif symbol == START_SYMBOL:
+                start = (y, x)
+            elif symbol not in OPEN_SYMBOLS:
+                raise ValueError("Unknown map symbol '{}' at ({}, {})".format(symbol, y, x))
+    partners = {}
+    for letter, cells in portal_cells.items():
+        if len(cells) != 2:
+            raise ValueError("Portal '{}' must be on exactly two cells".format(letter))
+        partners[cells[0]], partners[cells[1]] = cells[1], cells[0]
+
+    # Only moves from the edges and next to portals can lead elsewhere than the next cell.
+    candidates = set()
+    for y in range(height):
+        candidates.update([y * width, y * width + width - 1])
+    for x in range(width):
+        candidates.update([x, (height - 1) * width + x])
+    for cell in partners:
+        y, x = divmod(cell, width)
+        candidates.update(((y + dy) % height) * width + (x + dx) % width for dy, dx in OFFSETS)
+    exits = bytearray(len(walls))
+    links = {}
+    for cell in candidates:
+        if _bit(walls, cell):
+            continue
+        y, x = divmod(cell, width)
+        for direction, (dy, dx) in enumerate(OFFSETS):
+            destination = _resolve(y, x, direction, height, width, partners)
+            inside = 0 <= y + dy < height and 0 <= x + dx < width
+            if not inside or destination != (y + dy) * width + x + dx:
+                links[(cell << 2) | direction] = destination
+                exits[cell >> 3] |= 1 << (cell & 7)
+    portals = {cell: letter for letter, cells in portal_cells.items() for cell in cells}
+    return GameMap(height, width, walls, exits, links, portals, start)
+
+
+def load_map(path):
+    """
+    Load a map file, in text or binary form. The bitmasks and the free cells index of a binary map are
+    memory-mapped.
+
+    :param path: map file path
+    :type path: str
+    :return: the map
+    """
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            f.seek(0)
+            return parse_map(f.read().decode())
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, version, height, width, start_y, start_x, n_links, n_portals, n_free = HEADER.unpack_from(mm)
+    if version != VERSION:
+        mm.close()
+        raise ValueError("'{}' is a map file of an unknown version".format(path))
+    offset = HEADER.size
+    mask_size = (height * width + 7) // 8
+    offset += 2 * mask_size
+
+    def read(typecode, n):
+        nonlocal offset
+        values = array(typecode)
+        values.frombytes(mm[offset:offset + n * values.itemsize])
+        offset += n * values.itemsize
+        return values
+
+    keys = read('Q', n_links)
+    links = dict(zip(keys, read('I', n_links)))
+    portal_cells = read('I', n_portals)
+    letters = mm[offset:offset + n_portals].decode()
+    offset += n_portals
+    offset += -offset % 4
+    typecode = cell_typecode(height * width)
+    itemsize = array(typecode).itemsize
+    view = memoryview(mm)
+    walls = view[HEADER.size:HEADER.size + mask_size]
+    exits = view[HEADER.size + mask_size:HEADER.size + 2 * mask_size]
+    free_state = (view[offset:offset + n_free * itemsize].cast(typecode),
+                  view[offset + n_free * itemsize:offset + (n_free + height * width) * itemsize].cast(typecode))
+    view.release()
+    game_map = GameMap(height, width, walls, exits, links, dict(zip(portal_cells, letters)),
+                       (start_y, start_x) if start_y >= 0 else None, free_state)
+    game_map.mm = mm
+    return game_map
+
+
+def add_arguments(parser):
+    """
+    Add the map command line arguments.
+
+    :param parser: argument parser
+    :type parser: argparse.ArgumentParser
+    """
+    parser.add_argument('source', help='map file, in text or binary form')
+    parser.add_argument('output', help='binary map file written')
+
+
+def main(args):
+    """
+    Compile a map file to its binary form from the command line arguments.
+
+    :param args: parsed command line arguments
+    :type args: argparse.Namespace
+    """
+    with load_map(args.source) as game_map:
+        game_map.save(args.output)
+        print('{}: {}x{} map, {} links, {} portal cells, {} free cells'.format(
+            args.output, game_map.height, game_map.width, len(game_map.links), len(game_map.portals),
+            len(game_map.free_state[0])), file=sys.stderr)
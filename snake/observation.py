@@ -0,0 +1,299 @@
+"""
+Copyright 2019
+Author: Joao Carvalho <joao.ac.carvalho@gmail.com>
+"""
+import numpy as np
+
+
+# Channels of every observation, in order.
+BODY, HEAD, FOOD, WALLS = 0, 1, 2, 3
+CHANNELS = ['body', 'head', 'food', 'walls']
+# Optional channels: the direction each body part moved in when the head entered its cell, as its index in
+# Snake.directions plus one, unknown for the tail, and the tick the head entered the cell.
+EXTRA_CHANNELS = ['direction', 'entered']
+
+
+class Observation:
+
+    def __init__(self, engine, extra=(), padding=0, dtype=np.float32):
+        """
+        This class keeps the board of a game as a stack of NumPy planes, one per channel: body occupancy, head, food
+        and walls, and optionally the direction and entering tick of the body parts. The planes are allocated once.
+        After each engine step, update only writes the cells changed by the step: the new head, the old head, the
+        vacated tail, the tail added by growing and the food, so it takes constant time whatever the board size.
+        If the engine jumped more than one tick, or was reset or restored, the planes are rebuilt from scratch.
+        The planes are handed out as read-only views of the live arrays, without copying: they change with the next
+        update, copy them to keep them.
+        The planes can be surrounded by padding cells, all walls, so that windows around the head never leave the
+        arrays and can be handed out as views as well.
+
+        :param engine: game engine
+        :type engine: Engine
+        :param extra: names of the optional channels, from EXTRA_CHANNELS
+        :type extra: list
+        :param padding: number of wall cells around the board
+        :type padding: int
+        :param dtype: NumPy type of the planes
+        :type dtype: numpy.dtype
+        """
+        for channel in extra:
+            if channel not in EXTRA_CHANNELS:
+                raise ValueError("Unknown channel '{}', use one of {}".format(channel, ', '.join(EXTRA_CHANNELS)))
+        self.engine = engine
+        self.channels = CHANNELS + [channel for channel in EXTRA_CHANNELS if channel in extra]
+        self.direction_channel = self.channels.index('direction') if 'direction' in extra else None
+        self.entered_channel = self.channels.index('entered') if 'entered' in extra else None
+        self.padding = padding
+        self.board_height = engine.board_height
+        self.board_width = engine.board_width
+        self.padded_width = self.board_width + 2 * padding
+        # Cell offset of each direction, in the order of Snake.directions.
+        self.steps = [1, -1, -self.board_width, self.board_width]
+
+        self.data = np.zeros((len(self.channels), self.board_height + 2 * padding, self.padded_width), dtype=dtype)
+        self.flat = self.data.reshape(len(self.channels), -1)
+        self.padded = self.data.view()
+        self.padded.flags.writeable = False
+        self.planes = self.padded[:, padding:padding + self.board_height, padding:padding + self.board_width]
+        # Channel, padded cell and value of every write of the last update.
+        self.changes = []
+        # Number of rebuilds.
+        self.generation = 0
+        self.rebuild()
+
+    def index(self, cell):
+        """
+        Index in the padded planes of a flattened board cell.
+
+        :param cell: flattened cell, y * board_width + x
+        :type cell: int
+        :return: flattened padded cell
+        """
+        y, x = divmod(cell, self.board_width)
+        return (y + self.padding) * self.padded_width + x + self.padding
+
+    def rebuild(self):
+        """
+        Rebuild every plane from the engine state.
+
+        :return: the planes, a read-only view of shape channels x board height x board width
+        """
+        engine = self.engine
+        snake = engine.snake
+        if (engine.board_height, engine.board_width) != (self.board_height, self.board_width):
+            raise ValueError('The board size changed, create a new observation')
+        p = self.padding
+        self.data.fill(0)
+        walls = self.data[WALLS]
+        walls.fill(1)
+        if engine.game_map is not None:
+            # The walls, obstacles and portals of the map, unpacked from its bitmask.
+            n_cells = self.board_height * self.board_width
+            bits = np.unpackbits(np.frombuffer(engine.game_map.walls, dtype=np.uint8), bitorder='little')[:n_cells]
+            walls[p:p + self.board_height, p:p + self.board_width] = bits.reshape(self.board_height, self.board_width)
+        else:
+            walls[p + 1:p + self.board_height - 1, p + 1:p + self.board_width - 1] = 0
+
+        cells = snake.get_cells().tolist()
+        indices = [self.index(cell) for cell in cells]
+        self.flat[BODY, indices] = 1
+        self.flat[HEAD, indices[0]] = 1
+        if self.entered_channel is not None:
+            # Without history, every body part is assumed to have entered its cell one tick after the next one.
+            self.flat[self.entered_channel, indices[::-1]] = np.arange(engine.ticks - len(cells) + 1, engine.ticks + 1)
+        if self.direction_channel is not None:
+            # Direction from the next body part, unknown for the tail.
+            steps = self.steps
+            codes = [steps.index(cells[i] - cells[i + 1]) + 1 if cells[i] - cells[i + 1] in steps else 0
+                     for i in range(len(cells) - 1)]
+            self.flat[self.direction_channel, indices[:len(codes)]] = codes
+        f_y, f_x = engine.food.get_position()
+        self.food = f_y * self.board_width + f_x
+        self.flat[FOOD, self.index(self.food)] = 1
+
+        self.snake = snake
+        self.head = cells[0]
+        self.tail = cells[-1]
+        self.size = snake.size
+        self.ticks = engine.ticks
+        self.changes = []
+        self.generation += 1
+        return self.planes
+
+    def update(self):
+        """
+        Update the planes after an engine step.
+
+        :return: the planes, a read-only view of shape channels x board height x board width
+        """
+        engine = self.engine
+        snake = engine.snake
+        if snake is self.snake and engine.ticks == self.ticks:
+            return self.planes
+        if snake is not self.snake or engine.ticks != self.ticks + 1:
+            return self.rebuild()
+
+        flat = self.flat
+        changes = []
+
+        def write(channel, cell, value):
+            index = self.index(cell)
+            flat[channel, index] = value
+            changes.append((channel, index, value))
+
+        cells = snake.cells
+        head = cells[snake.head]
+        tail = cells[(snake.head + snake.size - 1) & snake.mask]
+        write(HEAD, self.head, 0)
+        if not snake.is_cell_occupied(self.tail):
+            write(BODY, self.tail, 0)
+            for channel in [self.direction_channel, self.entered_channel]:
+                if channel is not None:
+                    write(channel, self.tail, 0)
+        write(BODY, head, 1)
+        write(HEAD, head, 1)
+        if self.direction_channel is not None:
+            write(self.direction_channel, head, snake.direction + 1)
+        if self.entered_channel is not None:
+            write(self.entered_channel, head, engine.ticks)
+        if snake.size != self.size:
+            # A growing snake appends a tail cell behind the part that was the tail after the move, which entered its
+            # cell one tick before that part, unless the cell is already covered by another part.
+            before = cells[(snake.head + snake.size - 2) & snake.mask]
+            if tail == self.tail or not flat[BODY, self.index(tail)]:
+                if self.direction_channel is not None:
+                    write(self.direction_channel, tail, 0)
+                if self.entered_channel is not None:
+                    write(self.entered_channel, tail, flat[self.entered_channel, self.index(before)] - 1)
+            write(BODY, tail, 1)
+            if self.direction_channel is not None:
+                # The part before the new tail now has a direction.
+                step = before - tail
+                write(self.direction_channel, before, self.steps.index(step) + 1 if step in self.steps else 0)
+        elif self.direction_channel is not None and tail != head:
+            # The direction of the new tail is unknown.
+            write(self.direction_channel, tail, 0)
+
+        f_y, f_x = engine.food.get_position()
+        food = f_y * self.board_width + f_x
+        if food != self.food:
+            write(FOOD, self.food, 0)
+            write(FOOD, food, 1)
+            self.food = food
+
+        self.head = head
+        self.tail = tail
+        self.size = snake.size
+        self.ticks = engine.ticks
+        self.changes = changes
+        return self.planes
+
+    def egocentric(self, radius):
+        """
+        Window of the planes centered on the snake head, as a read-only view. Cells outside the board are walls.
+
+        :param radius: number of cells on each side of the head, at most the padding
+        :type radius: int
+        :return: view of shape channels x (2 * radius + 1) x (2 * radius + 1)
+        """
+        if radius > self.padding:
+            raise ValueError('The radius {} is larger than the padding {}'.format(radius, self.padding))
+        h_y, h_x = divmod(self.head, self.board_width)
+        y = h_y + self.padding - radius
+        x = h_x + self.padding - radius
+        return self.padded[:, y:y + 2 * radius + 1, x:x + 2 * radius + 1]
+
+
+class FrameStack:
+
+    def __init__(self, observation, num_frames=4, radius=None):
+        """
+        This class stacks the planes of the last num_frames ticks of an observation, from the oldest to the newest.
+        The frames are kept twice in a ring of 2 * num_frames slots, so that the last num_frames are always
+        contiguous and handed out as a read-only view. Each update turns the oldest slot into the newest frame by
+        replaying the changes of the last num_frames updates of the observation, instead of copying the planes.
+        After an observation rebuild, or if the stack missed an update of the observation, every frame is a copy of
+        the current planes. Several stacks can share an observation.
+        With a radius, the frames are the egocentric windows of the observation instead, copied at each update.
+
+        :param observation: observation to stack
+        :type observation: Observation
+        :param num_frames: number of frames
+        :type num_frames: int
+        :param radius: radius of the egocentric windows, None to stack the whole planes
+        :type radius: int
+        """
+        self.observation = observation
+        self.num_frames = num_frames
+        self.radius = radius
+        frame = observation.padded if radius is None else observation.egocentric(radius)
+        self.data = np.zeros((2 * num_frames,) + frame.shape, dtype=frame.dtype)
+        self.flat = self.data.reshape(2 * num_frames, frame.shape[0], -1)
+        self.history = []
+        self.position = 0
+        self.fill()
+
+    def fill(self):
+        """
+        Set every frame to the current planes.
+        """
+        self.data[:] = self.current()
+        self.history = []
+        self.generation = self.observation.generation
+        self.ticks = self.observation.ticks
+
+    def current(self):
+        """
+        Current frame of the observation.
+        """
+        if self.radius is None:
+            return self.observation.padded
+        return self.observation.egocentric(self.radius)
+
+    def frames(self):
+        """
+        Getter for the stacked frames.
+
+        :return: read-only view of shape frames x channels x height x width
+        """
+        n = self.num_frames
+        frames = self.data[self.position + 1:self.position + 1 + n]
+        if self.radius is None:
+            p = self.observation.padding
+            frames = frames[:, :, p:p + self.observation.board_height, p:p + self.observation.board_width]
+        frames = frames.view()
+        frames.flags.writeable = False
+        return frames
+
+    def update(self):
+        """
+        Update the observation after an engine step and push its planes as the newest frame.
+
+        :return: the stacked frames, as returned by frames
+        """
+        observation = self.observation
+        observation.update()
+        if observation.ticks == self.ticks and observation.generation == self.generation:
+            return self.frames()
+        if observation.ticks != self.ticks + 1 or observation.generation != self.generation:
+            # The observation was rebuilt, or updated by someone else without this stack.
+            self.fill()
+            return self.frames()
+
+        n = self.num_frames
+        self.position = (self.position + 1) % n
+        slots = [self.position, self.position + n]
+        if self.radius is None:
+            self.history.append(observation.changes)
+            del self.history[:-n]
+            flat = self.flat
+            for changes in self.history:
+                for channel, index, value in changes:
+                    for slot in slots:
+                        flat[slot, channel, index] = value
+        else:
+            window = self.current()
+            for slot in slots:
+                self.data[slot] = window
+        self.ticks = observation.ticks
+        return self.frames()
@@ -0,0 +1,189 @@
+"""
+Copyright 2019
+Author: Joao Carvalho <joao.ac.carvalho@gmail.com>
+"""
+import json
+import time
+from collections import deque
+from functools import wraps
+from .stats import percentile
+
+
+class NullProfiler:
+    """
+    Profiler that does nothing, used when profiling is disabled. Its hooks are empty methods, so the instrumented
+    game loop costs a few function calls per tick.
+    """
+
+    enabled = False
+    ticks = 0
+
+    def start(self, phase):
+        pass
+
+    def stop(self):
+        pass
+
+    def tick(self, target_rate=None, missed=0):
+        pass
+
+    def instrument(self, obj, name, phase):
+        pass
+
+    def stats(self):
+        return {}
+
+
+class PhaseProfiler:
+
+    enabled = True
+
+    def __init__(self, window=1000, clock=time.perf_counter):
+        """
+        This class times the phases of a game loop. A phase is timed between start and stop, phases can be nested
+        and the time of a phase excludes the time of the phases nested in it. The time of each phase is summed over
+        a tick, and the sums of the last window ticks are kept, along with the time of each tick, to compute the
+        phase percentiles and the actual tick rate. The tick deadlines missed by the game loop are counted over
+        the whole game.
+
+        :param window: number of ticks kept
+        :type window: int
+        :param clock: monotonic clock in seconds
+        :type clock: function
+        """
+        self.window = window
+        self.clock = clock
+        self.samples = {}
+        self.current = {}
+        # Phase, start time and time of the nested phases, of each running phase.
+        self.stack = []
+        self.tick_times = deque(maxlen=window)
+        self.target_rate = None
+        self.ticks = 0
+        self.missed = 0
+
+    def start(self, phase):
+        """
+        Start timing a phase.
+
+        :param phase: phase name
+        :type phase: str
+        """
+        self.stack.append([phase, self.clock(), 0.0])
+
+    def stop(self):
+        """
+        Stop timing the last phase started.
+        """
+        phase, start, nested = self.stack.pop()
+        elapsed = self.clock() - start
+        self.current[phase] = self.current.get(phase, 0.0) + elapsed - nested
+        if self.stack:
+            self.stack[-1][2] += elapsed
+
+    def tick(self, target_rate=None, missed=0):
+        """
+        End a tick, keeping the time of each phase during the tick.
+
+        :param target_rate: ticks per second the loop aims at
+        :type target_rate: float
+        :param missed: number of tick deadlines missed by the tick, as returned by TickScheduler.tick
+        :type missed: int
+        """
+        self.ticks += 1
+        self.missed += missed
+        self.tick_times.append(self.clock())
+        for phase, elapsed in self.current.items():
+            if phase not in self.samples:
+                self.samples[phase] = deque(maxlen=self.window)
+            self.samples[phase].append(elapsed)
+        self.current.clear()
+        if target_rate is not None:
+            self.target_rate = target_rate
+
+    def instrument(self, obj, name, phase):
+        """
+        Time every call of a method of an object as a phase, by replacing the method of the instance.
+
+        :param obj: object
+        :type obj: object
+        :param name: method name
+        :type name: str
+        :param phase: phase name
+        :type phase: str
+        """
+        method = getattr(obj, name)
+
+        @wraps(method)
+        def timed(*args, **kwargs):
+            self.start(phase)
+            try:
+                return method(*args, **kwargs)
+            finally:
+                self.stop()
+
+        setattr(obj, name, timed)
+
+    def rate(self):
+        """
+        Actual tick rate over the kept ticks.
+
+        :return: ticks per second, None before two ticks
+        """
+        if len(self.tick_times) < 2 or self.tick_times[-1] == self.tick_times[0]:
+            return None
+        return (len(self.tick_times) - 1) / (self.tick_times[-1] - self.tick_times[0])
+
+    def stats(self):
+        """
+        Statistics of the kept ticks.
+
+        :return: dictionary with the tick rates, the number of missed deadlines and the mean, median, 99th
+                 percentile and maximum time of each phase per tick, in milliseconds
+        """
+        phases = {}
+        for phase, samples in self.samples.items():
+            values = sorted(samples)
+            phases[phase] = {
+                'ticks': len(values),
+                'mean_ms': sum(values) / len(values) * 1e3,
+                'p50_ms': percentile(values, 50) * 1e3,
+                'p99_ms': percentile(values, 99) * 1e3,
+                'max_ms': values[-1] * 1e3,
+            }
+        return {'ticks': self.ticks, 'rate': self.rate(), 'target_rate': self.target_rate, 'missed': self.missed,
+                'phases': phases}
+
+    def overlay(self, max_phases=2):
+        """
+        Short summary of the statistics, to show on screen: the actual and target tick rates, the number of missed
+        deadlines if any, and the slowest phases with their 99th percentile time per tick, leaving out the time spent
+        waiting for the next tick.
+
+        :param max_phases: number of phases shown
+        :type max_phases: int
+        :return: the summary text
+        """
+        stats = self.stats()
+        text = '{:.1f}/{:.1f} tps'.format(stats['rate'] or 0, stats['target_rate'] or 0)
+        if stats['missed']:
+            text += ' {} missed'.format(stats['missed'])
+        phases = sorted(((phase_stats['p99_ms'], phase) for phase, phase_stats in stats['phases'].items()
+                         if phase != 'idle'), reverse=True)
+        for p99, phase in phases[:max_phases]:
+            text += ' {} {:.2f}ms'.format(phase, p99)
+        return text
+
+    def dump(self, path, extra=None):
+        """
+        Write the statistics to a JSON file.
+
+        :param path: file path
+        :type path: str
+        :param extra: other statistics to write along, by name
+        :type extra: dict
+        """
+        stats = self.stats()
+        stats.update(extra or {})
+        with open(path, 'w') as f:
+            json.dump(stats, f, indent=2)
@@ -0,0 +1,560 @@
+"""
+Copyright 2019
+Author: Joao Carvalho <joao.ac.carvalho@gmail.com>
+"""
+import curses
+from itertools import islice
+
+
+FOOD_SYMBOL = 'X'
+EMPTY_SYMBOL = ' '
+
+
+def wall_symbol(board_height, board_width, y, x):
+    """
+    Symbol of the board border at a wall position, the same used by the curses border.
+
+    :param board_height: board game height
+    :type board_height: int
+    :param board_width: board game width
+    :type board_width: int
+    :param y: y position
+    :type y: int
+    :param x: x position
+    :type x: int
+    :return: the border symbol, None if the position is not a wall
+    """
+    vertical = y == 0 or y == board_height - 1
+    horizontal = x == 0 or x == board_width - 1
+    if vertical and horizontal:
+        return '+'
+    elif vertical:
+        return '-'
+    elif horizontal:
+        return '|'
+    return None
+
+
+def draw_border(window):
+    """
+    Draw the board border around a window.
+
+    :param window: a curses window or an AnsiScreen
+    :type window: window
+    """
+    window.border('|', '|', '-', '-', '+', '+', '+', '+')
+
+
+def cell_symbol(engine, y, x):
+    """
+    Symbol drawn at a board position: the snake head or body, the food, the border, a map wall or portal or an empty
+    cell.
+
+    :param engine: game engine
+    :type engine: Engine
+    :param y: y position
+    :type y: int
+    :param x: x position
+    :type x: int
+    :return: the symbol at the position
+    """
+    snake = engine.snake
+    if (y, x) == snake.get_head_position():
+        return snake.head_symbol
+    if snake.is_occupied(y, x):
+        return snake.body_symbol
+    if (y, x) == engine.food.get_position():
+        return FOOD_SYMBOL
+    if engine.game_map is not None:
+        return engine.game_map.symbol(y, x)
+    symbol = wall_symbol(engine.board_height, engine.board_width, y, x)
+    return symbol if symbol is not None else EMPTY_SYMBOL
+
+
+def row_symbols(engine, y, start, stop):
+    """
+    Symbols of a range of positions of a board row, the same as cell_symbol for each position.
+
+    :param engine: game engine
+    :type engine: Engine
+    :param y: y position
+    :type y: int
+    :param start: first x position
+    :type start: int
+    :param stop: x position after the last one
+    :type stop: int
+    :return: the symbols as a string
+    """
+    snake = engine.snake
+    board_height, board_width = engine.board_height, engine.board_width
+    if engine.game_map is not None:
+        symbols = list(engine.game_map.row(y, start, stop))
+    else:
+        symbols = [wall_symbol(board_height, board_width, y, x) or EMPTY_SYMBOL for x in range(start, stop)]
+    f_y, f_x = engine.food.get_position()
+    if f_y == y and start <= f_x < stop:
+        symbols[f_x - start] = FOOD_SYMBOL
+    row = y * board_width
+    is_cell_occupied = snake.is_cell_occupied
+    for x in range(start, stop):
+        if is_cell_occupied(row + x):
+            symbols[x - start] = snake.body_symbol
+    h_y, h_x = snake.get_head_position()
+    if h_y == y and start <= h_x < stop:
+        symbols[h_x - start] = snake.head_symbol
+    return ''.join(symbols)
+
+
+def cursor_move(y, x):
+    """
+    ANSI escape sequence that moves the cursor to a screen position.
+
+    :param y: y position, from 0
+    :type y: int
+    :param x: x position, from 0
+    :type x: int
+    :return: the escape sequence as bytes
+    """
+    return b'\x1b[%d;%dH' % (y + 1, x + 1)
+
+
+class AnsiScreen:
+
+    # Hide the cursor and clear the screen.
+    CLEAR = b'\x1b[?25l\x1b[2J'
+
+    def __init__(self, output, height, width, origin=(0, 0)):
+        """
+        This class implements the subset of a curses window used by CursesRenderer on top of any binary output, a
+        terminal, a file or a socket, with ANSI escape sequences. Drawing only writes to a back buffer of
+        characters. Each update compares the changed rows of the back buffer with a front buffer holding what the
+        output shows, and sends the differences as runs of characters, each one after a cursor move. Unchanged
+        characters between two differences are sent again when that is shorter than another cursor move. The whole
+        update is sent with a single write.
+        The cursor position is not trusted between updates, so other programs can write to the same terminal.
+
+        :param output: binary output, with a write and optionally a flush method
+        :type output: file
+        :param height: window height
+        :type height: int
+        :param width: window width
+        :type width: int
+        :param origin: y and x screen position of the top left corner of the window
+        :type origin: tuple
+        """
+        self.output = output
+        self.height = height
+        self.width = width
+        self.origin = origin
+        self.back = [bytearray(b' ' * width) for _ in range(height)]
+        # Rows shown by the output, None until the first update clears the screen.
+        self.front = None
+        # Range of changed columns of each row changed since the last update.
+        self.dirty = {}
+        self.updates = 0
+        self.bytes_written = 0
+        self.last_update_bytes = 0
+
+    def touch(self, y, start, stop):
+        """
+        Mark a range of columns of a row as changed.
+        """
+        if y in self.dirty:
+            first, last = self.dirty[y]
+            self.dirty[y] = (min(first, start), max(last, stop))
+        else:
+            self.dirty[y] = (start, stop)
+
+    def erase(self):
+        for y, row in enumerate(self.back):
+            row[:] = b' ' * self.width
+            self.touch(y, 0, self.width)
+
+    def border(self, ls, rs, ts, bs, tl, tr, bl, br):
+        self.addstr(0, 0, tl + ts * (self.width - 2) + tr)
+        self.addstr(self.height - 1, 0, bl + bs * (self.width - 2) + br)
+        for y in range(1, self.height - 1):
+            self.addch(y, 0, ls)
+            self.addch(y, self.width - 1, rs)
+
+    def addch(self, y, x, ch):
+        self.back[y][x] = ord(ch) if isinstance(ch, str) else ch
+        self.touch(y, x, x + 1)
+
+    def addstr(self, y, x, string):
+        string = string[:self.width - x]
+        self.back[y][x:x + len(string)] = string.encode()
+        self.touch(y, x, x + len(string))
+
+    def inch(self, y, x):
+        return self.back[y][x]
+
+    def noutrefresh(self):
+        pass
+
+    def invalidate(self):
+        """
+        Forces the next update to clear the screen and send the whole window.
+        """
+        self.front = None
+
+    def diff(self):
+        """
+        Build the output that brings the front buffer to the back buffer, and update the front buffer.
+
+        :return: the output as bytes
+        """
+        o_y, o_x = self.origin
+        chunks = []
+        if self.front is None:
+            chunks.append(self.CLEAR)
+            self.front = [bytearray(b' ' * self.width) for _ in range(self.height)]
+            self.dirty = {y: (0, self.width) for y in range(self.height)}
+        for y in sorted(self.dirty):
+            start, stop = self.dirty[y]
+            back = self.back[y]
+            front = self.front[y]
+            # Longest cursor move of the row, gaps up to this size are sent instead.
+            max_gap = len(cursor_move(o_y + y, o_x + stop))
+            run_start = run_stop = None
+            for x in range(start, stop):
+                if back[x] == front[x]:
+                    continue
+                if run_start is None:
+                    run_start = x
+                elif x - run_stop > max_gap:
+                    chunks.append(cursor_move(o_y + y, o_x + run_start))
+                    chunks.append(back[run_start:run_stop])
+                    run_start = x
+                run_stop = x + 1
+            if run_start is not None:
+                chunks.append(cursor_move(o_y + y, o_x + run_start))
+                chunks.append(back[run_start:run_stop])
+                front[start:stop] = back[start:stop]
+        self.dirty = {}
+        return b''.join(chunks)
+
+    def flush(self):
+        """
+        Send the changes since the last update to the output, with a single write. Used as the doupdate function of
+        CursesRenderer.
+        """
+        data = self.diff()
+        self.updates += 1
+        self.last_update_bytes = len(data)
+        if data:
+            self.output.write(data)
+            self.bytes_written += len(data)
+            if hasattr(self.output, 'flush'):
+                self.output.flush()
+
+
+class CursesRenderer:
+
+    def __init__(self, stdscr, board_height, board_width, doupdate=curses.doupdate):
+        """
+        This class renders the game on a curses window. The first frame draws the whole board, the following ones
+        only redraw the positions that changed since the previous frame: the new and the previous head, the new and
+        the previous tail, the new and the previous food and the score. The number of draw calls per frame is
+        therefore constant, however long the snake is. Frames are drawn once per engine step, if steps are skipped
+        or the screen is cleared the renderer must be invalidated.
+        The screen is updated with noutrefresh and doupdate, so only the changed characters are sent to the terminal.
+        Instead of a curses window, the game can be drawn on an AnsiScreen, with its flush method as doupdate.
+
+        :param stdscr: a curses window or an AnsiScreen
+        :type stdscr: window
+        :param board_height: board game height
+        :type board_height: int
+        :param board_width: board game width
+        :type board_width: int
+        :param doupdate: function that sends the pending window updates to the terminal
+        :type doupdate: function
+        """
+        self.stdscr = stdscr
+        self.board_height = board_height
+        self.board_width = board_width
+        self.doupdate = doupdate
+        # Number of addch, addstr and border calls.
+        self.draw_calls = 0
+        self.last_frame = None
+        # Text shown on the bottom border, and the text drawn there.
+        self.status = None
+        self.last_status = None
+
+    def invalidate(self):
+        """
+        Forces the next frame to redraw the whole board.
+        """
+        self.last_frame = None
+        if isinstance(self.stdscr, AnsiScreen):
+            # The terminal may have been cleared by someone else.
+            self.stdscr.invalidate()
+
+    def draw_board(self):
+        """
+        Renders the board game on screen.
+        """
+        draw_border(self.stdscr)
+        self.draw_calls += 1
+
+    def draw_map(self, game_map):
+        """
+        Renders the walls and portals of a map on screen, one row at a time.
+
+        :param game_map: map of the board
+        :type game_map: GameMap
+        """
+        for y in range(game_map.height):
+            try:
+                self.stdscr.addstr(y, 0, game_map.row(y))
+            except curses.error:
+                # Writing the bottom right corner moves the cursor outside the window, the row is still drawn.
+                pass
+        self.draw_calls += game_map.height
+
+    def draw_score(self, score):
+        """
+        Renders the score on the top border.
+
+        :param score: game score
+        :type score: int
+        """
+        self.stdscr.addstr(0, self.board_width // 2 - 5, "Score: {}".format(score))
+        self.draw_calls += 1
+
+    def set_status(self, text):
+        """
+        Set the text shown on the bottom border, from the next frame on.
+
+        :param text: status text, None to show nothing
+        :type text: str
+        """
+        self.status = text
+
+    def draw_status(self):
+        """
+        Renders the status text on the bottom border, over the previous one.
+        """
+        width = self.board_width - 4
+        previous = len(self.last_status or '')
+        text = (self.status or '')[:width]
+        self.stdscr.addstr(self.board_height - 1, 2, text + '-' * max(0, min(previous, width) - len(text)))
+        self.last_status = text
+        self.draw_calls += 1
+
+    def draw_snake(self, snake):
+        """
+        Render the snake on screen.
+
+        :param snake: snake to render
+        :type snake: Snake
+        """
+        # Draw head.
+        h_y, h_x = snake.get_head_position()
+        self.stdscr.addch(h_y, h_x, snake.head_symbol)
+        # Draw body.
+        snake_symbol = snake.body_symbol
+        for s_y, s_x in islice(snake.body, 1, None):
+            self.stdscr.addch(s_y, s_x, snake_symbol)
+        self.draw_calls += snake.size
+
+    def draw_food(self, food):
+        """
+        Render the food on screen.
+
+        :param food: food to render
+        :type food: Food
+        """
+        f_y, f_x = food.get_position()
+        self.stdscr.addch(f_y, f_x, FOOD_SYMBOL)
+        self.draw_calls += 1
+
+    def draw_cell(self, engine, y, x):
+        """
+        Redraw a single board position with its current content.
+
+        :param engine: game engine
+        :type engine: Engine
+        :param y: y position
+        :type y: int
+        :param x: x position
+        :type x: int
+        """
+        try:
+            self.stdscr.addch(y, x, cell_symbol(engine, y, x))
+        except curses.error:
+            # Writing the bottom right corner moves the cursor outside the window, the character is still drawn.
+            pass
+        self.draw_calls += 1
+
+    def render(self, engine):
+        """
+        Renders the board game, snake and food, redrawing only what changed since the last frame.
+
+        :param engine: game engine
+        :type engine: Engine
+        """
+        frame = (engine.snake.get_head_position(), engine.snake.get_tail_position(), engine.food.get_position(),
+                 engine.score)
+        if self.last_frame is None:
+            self.stdscr.erase()
+            if engine.game_map is not None:
+                self.draw_map(engine.game_map)
+            else:
+                self.draw_board()
+            self.draw_score(engine.score)
+            self.draw_snake(engine.snake)
+            self.draw_food(engine.food)
+            self.last_status = None
+        else:
+            changed = set(frame[:3]) | set(self.last_frame[:3])
+            for y, x in changed:
+                self.draw_cell(engine, y, x)
+            if engine.score != self.last_frame[3]:
+                self.draw_score(engine.score)
+        if self.status != self.last_status and (self.status or self.last_status):
+            self.draw_status()
+        self.last_frame = frame
+
+        # Update the screen.
+        self.stdscr.noutrefresh()
+        self.doupdate()
+
+
+class ViewportRenderer(CursesRenderer):
+
+    def __init__(self, stdscr, board_height, board_width, newpad=curses.newpad, doupdate=curses.doupdate):
+        """
+        This class renders boards larger than the terminal. The first screen row shows the score, the rest is a
+        viewport on the board, a camera that follows the snake head: it is moved to center the head once the head
+        gets closer to its edges than a quarter of its size.
+        The board around the camera is drawn on a curses pad twice the size of the viewport, shown through the
+        viewport with pad.noutrefresh. Moving the camera inside the pad does not draw anything, the pad is only
+        redrawn, around the new camera, when the camera leaves it. Otherwise frames only redraw the changed positions
+        inside the pad, like CursesRenderer. The cost of a frame depends on the terminal size, not on the board size
+        or the snake length.
+
+        :param stdscr: a curses window, the whole terminal
+        :type stdscr: window
+        :param board_height: board game height
+        :type board_height: int
+        :param board_width: board game width
+        :type board_width: int
+        :param newpad: function that creates a curses pad from its height and width
+        :type newpad: function
+        :param doupdate: function that sends the pending window updates to the terminal
+        :type doupdate: function
+        """
+        super().__init__(stdscr, board_height, board_width, doupdate=doupdate)
+        screen_height, screen_width = stdscr.getmaxyx()
+        self.view_height = min(board_height, screen_height - 1)
+        self.view_width = min(board_width, screen_width)
+        self.pad_height = min(board_height, 2 * self.view_height)
+        self.pad_width = min(board_width, 2 * self.view_width)
+        # One spare row, writing the bottom right corner of a pad moves the cursor outside of it.
+        self.pad = newpad(self.pad_height + 1, self.pad_width)
+        # Board positions of the top left corners of the viewport and of the pad.
+        self.camera = (0, 0)
+        self.origin = None
+
+    def follow(self, y, x):
+        """
+        Move the camera if the head is too close to the viewport edges, and the pad if the camera left it.
+
+        :param y: y head position
+        :type y: int
+        :param x: x head position
+        :type x: int
+        :return: True if the pad moved and must be redrawn, False otherwise
+        """
+        camera = []
+        for position, start, view, board in [(y, self.camera[0], self.view_height, self.board_height),
+                                             (x, self.camera[1], self.view_width, self.board_width)]:
+            margin = view // 4
+            if not start + margin <= position < start + view - margin:
+                start = max(0, min(board - view, position - view // 2))
+            camera.append(start)
+        self.camera = tuple(camera)
+
+        if self.origin is not None:
+            (c_y, c_x), (o_y, o_x) = self.camera, self.origin
+            if (o_y <= c_y and c_y + self.view_height <= o_y + self.pad_height and
+                    o_x <= c_x and c_x + self.view_width <= o_x + self.pad_width):
+                return False
+        origin = []
+        for start, view, pad, board in [(self.camera[0], self.view_height, self.pad_height, self.board_height),
+                                        (self.camera[1], self.view_width, self.pad_width, self.board_width)]:
+            origin.append(max(0, min(board - pad, start - (pad - view) // 2)))
+        self.origin = tuple(origin)
+        return True
+
+    def draw_pad(self, engine):
+        """
+        Draw the whole pad, one row at a time.
+
+        :param engine: game engine
+        :type engine: Engine
+        """
+        o_y, o_x = self.origin
+        for y in range(self.pad_height):
+            self.pad.addstr(y, 0, row_symbols(engine, o_y + y, o_x, o_x + self.pad_width))
+        self.draw_calls += self.pad_height
+
+    def draw_cell(self, engine, y, x):
+        """
+        Redraw a single board position with its current content, if it is inside the pad.
+
+        :param engine: game engine
+        :type engine: Engine
+        :param y: y position
+        :type y: int
+        :param x: x position
+        :type x: int
+        """
+        o_y, o_x = self.origin
+        if o_y <= y < o_y + self.pad_height and o_x <= x < o_x + self.pad_width:
+            self.pad.addch(y - o_y, x - o_x, cell_symbol(engine, y, x))
+            self.draw_calls += 1
+
+    def draw_score(self, score):
+        """
+        Renders the score, the camera position and the status text on the first screen row.
+
+        :param score: game score
+        :type score: int
+        """
+        text = ' Score: {}  ({}, {})  {}'.format(score, self.camera[0], self.camera[1], self.status or '')
+        self.stdscr.addstr(0, 0, text[:self.view_width - 1].ljust(self.view_width - 1))
+        self.draw_calls += 1
+
+    def render(self, engine):
+        """
+        Renders the viewport, redrawing only what changed since the last frame, or the whole pad if it moved.
+
+        :param engine: game engine
+        :type engine: Engine
+        """
+        snake = engine.snake
+        head = snake.get_head_position()
+        moved = self.follow(*head)
+        frame = (head, snake.get_tail_position(), engine.food.get_position(), engine.score, self.camera,
+                 self.status)
+        if self.last_frame is None:
+            # Clear the screen outside of the viewport too.
+            self.stdscr.erase()
+        if self.last_frame is None or moved:
+            self.pad.erase()
+            self.draw_pad(engine)
+        else:
+            for y, x in set(frame[:3]) | set(self.last_frame[:3]):
+                self.draw_cell(engine, y, x)
+        if self.last_frame is None or frame[3:] != self.last_frame[3:]:
+            self.draw_score(engine.score)
+        self.last_frame = frame
+
+        # Update the screen.
+        self.stdscr.noutrefresh()
+        c_y, c_x = self.camera
+        o_y, o_x = self.origin
+        self.pad.noutrefresh(c_y - o_y, c_x - o_x, 1, 0, self.view_height, self.view_width - 1)
+        self.doupdate()
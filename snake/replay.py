@@ -0,0 +1,468 @@
+"""
+Copyright 2019
+Author: Joao Carvalho <joao.ac.carvalho@gmail.com>
+"""
+import mmap
+import multiprocessing
+import os
+import struct
+import sys
+import time
+from array import array
+from .components import cell_typecode
+from .engine import Engine, PLAYING, STATUSES
+
+
+# Directions in the order of their 2-bit codes, the same order as Snake.directions.
+DIRECTIONS = ['RIGHT', 'LEFT', 'UP', 'DOWN']
+CODES = {direction: code for code, direction in enumerate(DIRECTIONS)}
+# Directions of the 4 ticks packed in each byte value.
+UNPACKED = [tuple(DIRECTIONS[(byte >> (2 * i)) & 3] for i in range(4)) for byte in range(256)]
+
+MAGIC = b'SNKR'
+END_MAGIC = b'SNKE'
+VERSION = 2
+# Header: magic, version, board height, board width, initial speed, speed increase, initial size, seed and keyframe
+# interval.
+HEADER = struct.Struct('<4sBxxxIIddIqI')
+# Trailer: offset of the block index, offset of the final state, number of ticks and end magic.
+TRAILER = struct.Struct('<QQQ4s')
+# Final state: score, status and snake size, followed by the flattened body cells.
+FINAL = struct.Struct('<IBI')
+# Keyframe: random number generator state, ticks, score, head direction, food cell and snake size, followed by the
+# flattened body cells, with the item size of the cell arrays of the board.
+KEYFRAME = struct.Struct('<QQIBII')
+BLOCK_OFFSET = struct.Struct('<Q')
+LENGTH = struct.Struct('<I')
+
+
+class Recorder:
+
+    def __init__(self, path, engine, keyframe_interval=1024):
+        """
+        This class records a game to a compact binary replay file. The file starts with a header with the engine
+        settings and seed. The game is then stored in blocks of keyframe_interval ticks, each one holding a keyframe
+        with the state of the first tick of the block, the food placed during the block, as tick and cell pairs, and
+        the direction of the snake on each tick, packed with 2 bits per tick. The first block has an empty keyframe,
+        its state is given by the seed. A keyframe only holds the snake body and direction, the food, the score, the
+        ticks and the random number generator state, so its size depends on the snake length and not on the board
+        size: the free positions index is rebuilt from the body on a seek. The rebuilt index has the same positions
+        in another order, which would place the next food elsewhere, so the replay keeps the food placements. When
+        the recorder is closed an index with the offset of every block and the final score, status and snake body
+        are appended, so that a reader can jump to any block without decoding the previous ones.
+        The recorder is attached to the engine, which calls record on every step. It must be attached before the
+        first step of a game.
+
+        :param path: replay file path
+        :type path: str
+        :param engine: game engine to record
+        :type engine: Engine
+        :param keyframe_interval: number of ticks between keyframes, a multiple of 4
+        :type keyframe_interval: int
+        """
+        assert engine.ticks == 0, "The recorder must be attached before the first step"
+        if engine.game_map is not None:
+            raise ValueError('Games on a map cannot be recorded')
+        assert keyframe_interval > 0 and keyframe_interval % 4 == 0, "The keyframe interval must be a multiple of 4"
+        self.engine = engine
+        self.keyframe_interval = keyframe_interval
+        self.block_offsets = []
+        self.keyframe = None
+        self.foods = array('I')
+        self.actions = bytearray()
+        f_y, f_x = engine.food.get_position()
+        self.food = f_y * engine.board_width + f_x
+        # Direction of the last move, the snake may already be turned for the next one when a keyframe is written.
+        self.direction = engine.snake.direction
+        self.file = open(path, 'wb')
+        self.file.write(HEADER.pack(MAGIC, VERSION, engine.board_height, engine.board_width, engine.initial_speed,
+                                    engine.speed_increase, engine.initial_size, engine.seed, keyframe_interval))
+        engine.recorder = self
+
+    def record(self, engine):
+        """
+        Record the direction of the snake for the current tick, after the player or agent changed it, and the food
+        placed by the previous tick. Starts a new block with a keyframe every keyframe_interval ticks.
+
+        :param engine: recorded engine
+        :type engine: Engine
+        """
+        tick = engine.ticks
+        self._record_food(engine)
+        if tick % self.keyframe_interval == 0:
+            self._write_block()
+            self.keyframe = keyframe(engine, self.direction) if tick > 0 else b''
+        self.direction = engine.snake.direction
+        shift = 2 * (tick % 4)
+        if shift == 0:
+            self.actions.append(CODES[engine.snake.head_direction])
+        else:
+            self.actions[-1] |= CODES[engine.snake.head_direction] << shift
+
+    def _record_food(self, engine):
+        """
+        Add the food placed by the last tick, if any, to the current block.
+        """
+        f_y, f_x = engine.food.get_position()
+        food = f_y * engine.board_width + f_x
+        if food != self.food:
+            self.foods.extend((engine.ticks, food))
+            self.food = food
+
+    def _write_block(self):
+        """
+        Write the keyframe, food placements and actions of the current block, if any.
+        """
+        if self.keyframe is None:
+            return
+        self.block_offsets.append(self.file.tell())
+        self.file.write(LENGTH.pack(len(self.keyframe)))
+        self.file.write(self.keyframe)
+        self.file.write(LENGTH.pack(len(self.foods) // 2))
+        self.file.write(self.foods.tobytes())
+        self.file.write(self.actions)
+        self.keyframe = None
+        self.foods = array('I')
+        self.actions = bytearray()
+
+    def close(self):
+        """
+        Write the block index and the final state and close the file. The engine is detached from the recorder.
+        Closing a closed recorder does nothing.
+        """
+        if self.file.closed:
+            return
+        self._record_food(self.engine)
+        self._write_block()
+        index_offset = self.file.tell()
+        for offset in self.block_offsets:
+            self.file.write(BLOCK_OFFSET.pack(offset))
+        final_offset = self.file.tell()
+        self.file.write(final_state(self.engine))
+        self.file.write(TRAILER.pack(index_offset, final_offset, self.engine.ticks, END_MAGIC))
+        self.file.close()
+        if self.engine.recorder is self:
+            self.engine.recorder = None
+
+
+class ReplayReader:
+
+    def __init__(self, path):
+        """
+        This class reads a replay file written by Recorder. The file is memory-mapped, so opening it and jumping
+        to any tick only touch the header, the block index, one keyframe and the packed directions of at most one
+        block.
+
+        :param path: replay file path
+        :type path: str
+        """
+        with open(path, 'rb') as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, self.board_height, self.board_width, self.initial_speed, self.speed_increase,
+         self.initial_size, self.seed, self.keyframe_interval) = HEADER.unpack_from(self.mm)
+        index_offset, final_offset, self.ticks, end_magic = TRAILER.unpack_from(self.mm, len(self.mm) - TRAILER.size)
+        if magic != MAGIC or end_magic != END_MAGIC or version != VERSION:
+            raise ValueError("'{}' is not a complete replay file".format(path))
+        self.index_offset = index_offset
+        self.final_offset = final_offset
+        self.num_blocks = (final_offset - index_offset) // BLOCK_OFFSET.size
+
+    def close(self):
+        """
+        Unmap the file.
+        """
+        self.mm.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def new_engine(self):
+        """
+        Create an engine with the recorded settings, at the start of the recorded game.
+
+        :return: game engine
+        """
+        return Engine(board_height=self.board_height, board_width=self.board_width,
+                      initial_speed=self.initial_speed, speed_increase=self.speed_increase,
+                      initial_size=self.initial_size, seed=self.seed)
+
+    def _read_record(self, offset):
+        """
+        Read a length prefixed record.
+        """
+        length, = LENGTH.unpack_from(self.mm, offset)
+        start = offset + LENGTH.size
+        return self.mm[start:start + length]
+
+    def _block_offsets(self, block):
+        """
+        Offsets of the keyframe, food placements and actions of a block.
+        """
+        offset, = BLOCK_OFFSET.unpack_from(self.mm, self.index_offset + block * BLOCK_OFFSET.size)
+        length, = LENGTH.unpack_from(self.mm, offset)
+        foods_offset = offset + LENGTH.size + length
+        n_foods, = LENGTH.unpack_from(self.mm, foods_offset)
+        return offset, foods_offset, foods_offset + LENGTH.size + 8 * n_foods
+
+    def keyframe(self, block):
+        """
+        Getter for the keyframe at the start of a block.
+
+        :param block: block index
+        :type block: int
+        :return: keyframe, as returned by the keyframe function, empty for the first block
+        """
+        offset, = BLOCK_OFFSET.unpack_from(self.mm, self.index_offset + block * BLOCK_OFFSET.size)
+        return self._read_record(offset)
+
+    def foods(self, start=0, stop=None):
+        """
+        Getter for the recorded food placements of a range of ticks.
+
+        :param start: first tick
+        :type start: int
+        :param stop: last tick, defaults to the number of recorded ticks
+        :type stop: int
+        :return: dictionary with the food y and x position placed by each tick
+        """
+        stop = self.ticks if stop is None else min(stop, self.ticks)
+        foods = {}
+        # The placements of a block are the ones after its first tick, up to the first tick of the next block.
+        first = max(start - 1, 0) // self.keyframe_interval
+        for block in range(first, min(stop // self.keyframe_interval, self.num_blocks - 1) + 1):
+            _, offset, _ = self._block_offsets(block)
+            n_foods, = LENGTH.unpack_from(self.mm, offset)
+            values = array('I')
+            values.frombytes(self.mm[offset + LENGTH.size:offset + LENGTH.size + 8 * n_foods])
+            for tick, cell in zip(values[::2], values[1::2]):
+                if start <= tick <= stop:
+                    foods[tick] = divmod(cell, self.board_width)
+        return foods
+
+    def final_state(self):
+        """
+        Getter for the recorded final score, status and snake body.
+
+        :return: the final state, encoded as by the final_state function
+        """
+        return self.mm[self.final_offset:len(self.mm) - TRAILER.size]
+
+    def actions(self, start=0, stop=None):
+        """
+        Getter for the recorded directions of a range of ticks.
+
+        :param start: first tick
+        :type start: int
+        :param stop: tick after the last one, defaults to the number of recorded ticks
+        :type stop: int
+        :return: list of directions
+        """
+        stop = self.ticks if stop is None else min(stop, self.ticks)
+        directions = []
+        tick = start
+        while tick < stop:
+            block, first = divmod(tick, self.keyframe_interval)
+            _, _, actions_offset = self._block_offsets(block)
+            last = min(stop - block * self.keyframe_interval, self.keyframe_interval)
+            packed = self.mm[actions_offset + first // 4:actions_offset + (last + 3) // 4]
+            block_directions = [d for byte in packed for d in UNPACKED[byte]]
+            skip = first % 4
+            directions.extend(block_directions[skip:skip + last - first])
+            tick = block * self.keyframe_interval + last
+        return directions
+
+    def seek(self, tick, engine=None):
+        """
+        Restore the game state after a number of ticks, from the closest previous keyframe. The free positions index
+        is rebuilt from the snake body, so it holds the same positions as in the recorded game, in another order,
+        and the food placed from it may differ once the game goes past the recorded ticks.
+
+        :param tick: number of ticks
+        :type tick: int
+        :param engine: engine with the recorded settings to restore the state into, a new one is created by default
+        :type engine: Engine
+        :return: the engine
+        """
+        if not 0 <= tick <= self.ticks:
+            raise IndexError('tick {} out of range [0, {}]'.format(tick, self.ticks))
+        if engine is None:
+            engine = self.new_engine()
+        block = min(tick // self.keyframe_interval, self.num_blocks - 1)
+        engine.reset(self.seed)
+        if block > 0:
+            restore_keyframe(engine, self.keyframe(block))
+        start = block * self.keyframe_interval
+        fast_forward(engine, self.actions(start, tick), self.foods(start + 1, tick))
+        return engine
+
+
+def final_state(engine):
+    """
+    Encode the score, status and snake body of an engine.
+
+    :param engine: game engine
+    :type engine: Engine
+    :return: the encoded state
+    """
+    body = array('I', engine.snake.get_cells())
+    return FINAL.pack(engine.score, STATUSES.index(engine.status), engine.snake.size) + body.tobytes()
+
+
+def keyframe(engine, direction=None):
+    """
+    Encode the state of a game being played, except for its settings and its free positions index.
+
+    :param engine: game engine
+    :type engine: Engine
+    :param direction: head direction code, defaults to the snake direction
+    :type direction: int
+    :return: the encoded state
+    """
+    snake = engine.snake
+    f_y, f_x = engine.food.get_position()
+    direction = snake.direction if direction is None else direction
+    header = KEYFRAME.pack(engine.rng.getstate(), engine.ticks, engine.score, direction,
+                           f_y * engine.board_width + f_x, snake.size)
+    return header + snake.get_cells().tobytes()
+
+
+def restore_keyframe(engine, data):
+    """
+    Restore the state of a game from a keyframe, on an engine with the recorded settings. The speed is the one
+    reached after eating score times, and the free positions index is rebuilt from the snake body.
+
+    :param engine: game engine
+    :type engine: Engine
+    :param data: keyframe, as returned by the keyframe function
+    :type data: bytes
+    """
+    rng_state, engine.ticks, engine.score, direction, food, size = KEYFRAME.unpack_from(data)
+    body = array(cell_typecode(engine.board_height * engine.board_width))
+    body.frombytes(data[KEYFRAME.size:KEYFRAME.size + size * body.itemsize])
+    engine.snake.set_cells(body)
+    engine.snake.direction = direction
+    engine.food.set_position(*divmod(food, engine.board_width))
+    engine.rng.setstate(rng_state)
+    engine.status = PLAYING
+    engine.speed = engine.initial_speed
+    for _ in range(engine.score):
+        engine.speed += engine.speed_increase
+    engine.rebuild_free_cells()
+
+
+def fast_forward(engine, directions, foods=None):
+    """
+    Apply recorded directions to an engine.
+
+    :param engine: game engine
+    :type engine: Engine
+    :param directions: direction of each tick
+    :type directions: list
+    :param foods: recorded food position placed by each tick, see ReplayReader.foods, to place instead of the
+                  engine
+    :type foods: dict
+    """
+    step = engine.step
+    if not foods:
+        for direction in directions:
+            step(direction)
+        return
+    for direction in directions:
+        step(direction)
+        food = foods.get(engine.ticks)
+        if food is not None:
+            engine.food.set_position(*food)
+
+
+def verify(path, full=True):
+    """
+    Replay a recorded game and check that it reaches the recorded final score, status and snake body.
+    A full verification replays the whole game from its seed. A quick verification only replays the last block,
+    from its keyframe, so it takes at most keyframe_interval ticks.
+
+    :param path: replay file path
+    :type path: str
+    :param full: replay the whole game instead of the last block only
+    :type full: bool
+    :return: True if the replay reproduces the recorded game, False otherwise
+    """
+    with ReplayReader(path) as reader:
+        if full:
+            engine = reader.new_engine()
+            fast_forward(engine, reader.actions())
+        else:
+            engine = reader.seek(reader.ticks)
+        return final_state(engine) == reader.final_state()
+
+
+def verify_many(paths, full=True, workers=None):
+    """
+    Verify replay files across a pool of worker processes.
+
+    :param paths: replay file paths
+    :type paths: list
+    :param full: replay the whole games instead of their last block only
+    :type full: bool
+    :param workers: number of worker processes, defaults to the number of cores
+    :type workers: int
+    :return: iterator over the path and verification result of each replay, in input order
+    """
+    workers = workers or os.cpu_count() or 1
+    check = verify if full else _verify_quick
+    if workers == 1:
+        for path in paths:
+            yield path, check(path)
+        return
+    with multiprocessing.Pool(workers) as pool:
+        yield from zip(paths, pool.imap(check, paths, chunksize=16))
+
+
+def _verify_quick(path):
+    """
+    Pool worker entry point of a quick verification.
+    """
+    return verify(path, full=False)
+
+
+def add_arguments(parser):
+    """
+    Add the replay command line arguments.
+
+    :param parser: argument parser
+    :type parser: argparse.ArgumentParser
+    """
+    parser.add_argument('action', choices=['verify', 'info'])
+    parser.add_argument('paths', nargs='+', help='replay files')
+    parser.add_argument('--quick', action='store_true', help='only replay the last block of each game')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: number of cores)')
+
+
+def main(args):
+    """
+    Verify or describe replay files from the command line arguments.
+
+    :param args: parsed command line arguments
+    :type args: argparse.Namespace
+    """
+    if args.action == 'info':
+        for path in args.paths:
+            with ReplayReader(path) as reader:
+                engine = reader.seek(reader.ticks)
+                print('{}: {}x{} board, seed {}, {} ticks, score {}, {}'.format(
+                    path, reader.board_height, reader.board_width, reader.seed, reader.ticks, engine.score,
+                    engine.status))
+        return
+
+    start = time.monotonic()
+    failed = 0
+    for path, ok in verify_many(args.paths, full=not args.quick, workers=args.workers):
+        if not ok:
+            failed += 1
+            print('{}: FAILED'.format(path))
+    elapsed = time.monotonic() - start
+    print('{} replays verified in {:.2f}s, {} failed'.format(len(args.paths), elapsed, failed), file=sys.stderr)
+    if failed:
+        sys.exit(1)
@@ -0,0 +1,121 @@
+"""
+Copyright 2019
+Author: Joao Carvalho <joao.ac.carvalho@gmail.com>
+"""
+import random
+
+
+MASK64 = (1 << 64) - 1
+GOLDEN_GAMMA = 0x9E3779B97F4A7C15
+
+
+def mix64(z):
+    """
+    SplitMix64 finalizer, a bijective scrambling of a 64-bit integer.
+
+    :param z: 64-bit integer
+    :type z: int
+    :return: scrambled 64-bit integer
+    """
+    z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & MASK64
+    z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & MASK64
+    return z ^ (z >> 31)
+
+
+def derive_seed(seed, index):
+    """
+    Derive independent seeds from a base seed, for instance one per game or per worker, so that work can be split
+    deterministically.
+
+    :param seed: base seed
+    :type seed: int
+    :param index: index of the derived seed
+    :type index: int
+    :return: 63-bit seed
+    """
+    return mix64((mix64(seed & MASK64) + (index + 1) * GOLDEN_GAMMA) & MASK64) >> 1
+
+
+class GameRandom:
+
+    __slots__ = ['state']
+
+    def __init__(self, seed=None):
+        """
+        This class implements a small random number generator, SplitMix64, for games that need their own
+        reproducible stream. Its whole state is a single 64-bit integer, so it can be saved and restored in
+        constant time. It implements the subset of the random.Random interface used by the game.
+
+        :param seed: seed, None to draw one from the system
+        :type seed: int
+        """
+        self.seed(seed)
+
+    def seed(self, seed=None):
+        """
+        Reset the generator state from a seed.
+
+        :param seed: seed, None to draw one from the system
+        :type seed: int
+        """
+        if seed is None:
+            seed = random.SystemRandom().getrandbits(64)
+        self.state = mix64(seed & MASK64)
+
+    def getstate(self):
+        """
+        Getter for the generator state.
+
+        :return: 64-bit state
+        """
+        return self.state
+
+    def setstate(self, state):
+        """
+        Setter for the generator state.
+
+        :param state: 64-bit state, as returned by getstate
+        :type state: int
+        """
+        self.state = state
+
+    def next64(self):
+        """
+        Advance the generator.
+
+        :return: random 64-bit integer
+        """
+        self.state = (self.state + GOLDEN_GAMMA) & MASK64
+        return mix64(self.state)
+
+    def random(self):
+        """
+        Random float in [0, 1).
+        """
+        return (self.next64() >> 11) * (1.0 / (1 << 53))
+
+    def randrange(self, n):
+        """
+        Uniformly random integer in [0, n), without modulo bias.
+
+        :param n: number of values
+        :type n: int
+        :return: random integer
+        """
+        limit = (1 << 64) - (1 << 64) % n
+        x = self.next64()
+        while x >= limit:
+            x = self.next64()
+        return x % n
+
+    def randint(self, a, b):
+        """
+        Uniformly random integer in [a, b].
+        """
+        return a + self.randrange(b - a + 1)
+
+    def choice(self, seq):
+        """
+        Uniformly random element of a non-empty sequence.
+        """
+        return seq[self.randrange(len(seq))]
@@ -0,0 +1,429 @@
+"""
+Copyright 2019
+Author: Joao Carvalho <joao.ac.carvalho@gmail.com>
+"""
+import asyncio
+import struct
+import sys
+import time
+from array import array
+from collections import deque
+from .clock import TickScheduler
+from .components import Snake, cell_typecode
+from .engine import Engine, STATUSES, PLAYING
+
+
+# Frame header: payload length, message type and session id. A connection can carry many sessions, each one
+# identified by an id chosen by the client.
+FRAME = struct.Struct('<IBI')
+# Client messages.
+JOIN = 1
+TURN = 2
+LEAVE = 3
+# Server messages.
+START = 4
+DELTA = 5
+ERROR = 6
+
+# Join payload: board height, board width and seed, negative for a random seed.
+JOIN_PAYLOAD = struct.Struct('<IIq')
+# Turn payload: direction index in Snake.directions.
+TURN_PAYLOAD = struct.Struct('<B')
+# Start payload: board height, board width, seed, ticks, score, status, head direction, food cell and snake size,
+# followed by the snake cells from the head to the tail, with the item size of the cell arrays of the board.
+START_PAYLOAD = struct.Struct('<IIqIIBBII')
+# Delta payload: ticks, head cell, tail cell, food cell, score and status. Cells are flattened, y * width + x.
+DELTA_PAYLOAD = struct.Struct('<IIIIIB')
+# Delta frame, header and payload packed at once.
+DELTA_FRAME = struct.Struct('<IBI' + DELTA_PAYLOAD.format[1:])
+
+# Largest payload accepted from a client.
+MAX_PAYLOAD = JOIN_PAYLOAD.size
+# Largest board a client can ask for.
+MAX_BOARD_SIZE = 500
+
+
+def start_payload(engine):
+    """
+    Encode the START message of a game: its settings, seed, direction, food, score and snake cells. Unlike an engine
+    snapshot, it does not carry the free positions, so its size depends on the snake length and not on the board size.
+
+    :param engine: game engine
+    :type engine: Engine
+    :return: the payload as bytes
+    """
+    snake = engine.snake
+    f_y, f_x = engine.food.get_position()
+    header = START_PAYLOAD.pack(engine.board_height, engine.board_width, engine.seed, engine.ticks, engine.score,
+                                STATUSES.index(engine.status), snake.direction, f_y * engine.board_width + f_x,
+                                snake.size)
+    return header + snake.get_cells().tobytes()
+
+
+def encode_frame(kind, session_id, payload=b''):
+    """
+    Encode a message as a frame.
+
+    :param kind: message type
+    :type kind: int
+    :param session_id: session id
+    :type session_id: int
+    :param payload: message payload
+    :type payload: bytes
+    :return: the frame as bytes
+    """
+    return FRAME.pack(len(payload), kind, session_id) + payload
+
+
+class FrameDecoder:
+
+    def __init__(self, max_payload=None):
+        """
+        This class splits a byte stream into frames. Data is fed as it arrives, frames split across reads are kept
+        until they are complete.
+
+        :param max_payload: largest payload accepted, None for no limit
+        :type max_payload: int
+        """
+        self.max_payload = max_payload
+        self.buffer = bytearray()
+
+    def feed(self, data):
+        """
+        Add received data and decode the complete frames.
+
+        :param data: received data
+        :type data: bytes
+        :return: list of message type, session id and payload tuples
+        """
+        buffer = self.buffer
+        buffer += data
+        frames = []
+        offset = 0
+        end = len(buffer)
+        while end - offset >= FRAME.size:
+            length, kind, session_id = FRAME.unpack_from(buffer, offset)
+            if self.max_payload is not None and length > self.max_payload:
+                raise ValueError('Frame payload of {} bytes is too large'.format(length))
+            start = offset + FRAME.size
+            if end - start < length:
+                break
+            frames.append((kind, session_id, bytes(buffer[start:start + length])))
+            offset = start + length
+        del buffer[:offset]
+        return frames
+
+
+class SessionView:
+
+    def __init__(self, payload):
+        """
+        This class keeps the client side copy of a session, built from the START message sent when the session
+        starts and updated with the delta of every tick. The snake is kept as a deque of flattened cells, from the
+        head to the tail: each delta adds the new head and drops the old tail, and a growing snake appends the new
+        tail cell.
+
+        :param payload: START payload, see start_payload
+        :type payload: bytes
+        """
+        (self.board_height, self.board_width, self.seed, self.ticks, self.score, status, direction, self.food,
+         size) = START_PAYLOAD.unpack_from(payload)
+        self.status = STATUSES[status]
+        self.direction = Snake.directions[direction]
+        cells = array(cell_typecode(self.board_height * self.board_width))
+        cells.frombytes(payload[START_PAYLOAD.size:START_PAYLOAD.size + size * cells.itemsize])
+        self.cells = deque(cells)
+
+    def apply(self, payload):
+        """
+        Apply the delta of a tick.
+
+        :param payload: delta payload
+        :type payload: bytes
+        """
+        self.ticks, head, tail, self.food, score, status = DELTA_PAYLOAD.unpack(payload)
+        cells = self.cells
+        cells.pop()
+        cells.appendleft(head)
+        if score != self.score:
+            cells.append(tail)
+        self.score = score
+        self.status = STATUSES[status]
+
+    def get_head_position(self):
+        """
+        Getter for the snake head position.
+
+        :return: y and x head position
+        """
+        return divmod(self.cells[0], self.board_width)
+
+    def get_food_position(self):
+        """
+        Getter for the food position.
+
+        :return: y and x food position
+        """
+        return divmod(self.food, self.board_width)
+
+
+class Session:
+
+    __slots__ = ['session_id', 'engine', 'direction']
+
+    def __init__(self, session_id, engine):
+        """
+        This class holds a game hosted by the server and the direction requested by the client for the next tick.
+
+        :param session_id: session id, unique within its connection
+        :type session_id: int
+        :param engine: game engine
+        :type engine: Engine
+        """
+        self.session_id = session_id
+        self.engine = engine
+        self.direction = None
+
+
+class ServerConnection(asyncio.Protocol):
+
+    def __init__(self, server):
+        """
+        This class handles a client connection: it decodes the client messages and sends the frames of its
+        sessions. Writing is paused by the transport while its buffer is above the high water mark, the sessions of
+        a paused connection are not stepped, so a slow client slows down its own games instead of piling up
+        frames in the server.
+
+        :param server: game server
+        :type server: GameServer
+        """
+        self.server = server
+        self.transport = None
+        self.decoder = FrameDecoder(MAX_PAYLOAD)
+        self.sessions = {}
+        # Tick the writing was paused at, None while writing.
+        self.paused_at = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+        transport.set_write_buffer_limits(high=self.server.high_water)
+        self.server.connections.add(self)
+
+    def connection_lost(self, exc):
+        self.server.connections.discard(self)
+        self.server.n_sessions -= len(self.sessions)
+        self.sessions.clear()
+
+    def pause_writing(self):
+        self.paused_at = self.server.ticks
+
+    def resume_writing(self):
+        self.paused_at = None
+
+    def data_received(self, data):
+        try:
+            frames = self.decoder.feed(data)
+        except ValueError:
+            self.transport.abort()
+            return
+        for kind, session_id, payload in frames:
+            if kind == TURN and len(payload) == TURN_PAYLOAD.size:
+                session = self.sessions.get(session_id)
+                if session is not None and payload[0] < len(Snake.directions):
+                    session.direction = Snake.directions[payload[0]]
+            elif kind == JOIN and len(payload) == JOIN_PAYLOAD.size:
+                self.join(session_id, *JOIN_PAYLOAD.unpack(payload))
+            elif kind == LEAVE:
+                if self.sessions.pop(session_id, None) is not None:
+                    self.server.n_sessions -= 1
+            else:
+                self.transport.abort()
+                return
+
+    def join(self, session_id, board_height, board_width, seed):
+        """
+        Start a new session and send its START message to the client.
+
+        :param session_id: session id
+        :type session_id: int
+        :param board_height: board game height
+        :type board_height: int
+        :param board_width: board game width
+        :type board_width: int
+        :param seed: game seed, negative for a random seed
+        :type seed: int
+        """
+        server = self.server
+        if session_id in self.sessions:
+            error = 'Session {} is already playing'.format(session_id)
+        elif server.n_sessions >= server.max_sessions:
+            error = 'The server is full'
+        elif max(board_height, board_width) > MAX_BOARD_SIZE:
+            error = 'Boards are at most {0}x{0}'.format(MAX_BOARD_SIZE)
+        else:
+            error = None
+        if error is not None:
+            self.transport.write(encode_frame(ERROR, session_id, error.encode()))
+            return
+        engine = Engine(board_height=board_height, board_width=board_width, seed=seed if seed >= 0 else None)
+        self.sessions[session_id] = Session(session_id, engine)
+        server.n_sessions += 1
+        self.transport.write(encode_frame(START, session_id, start_payload(engine)))
+
+
+class GameServer:
+
+    def __init__(self, rate=10, max_sessions=100000, high_water=64 * 1024, max_stall=100, clock=time.monotonic):
+        """
+        This class hosts many game sessions in a single process. A shared tick scheduler steps every session once
+        per tick, all of them in a single pass, and the deltas of all the sessions of a connection are sent in a
+        single write. Clients join sessions and send directions over TCP, with length prefixed frames, and receive
+        the settings and snake of each new game followed by a small delta per tick: new head, tail and food cells,
+        score and status. Finished sessions are dropped after their last delta, the client can join again with the
+        same id. Sessions all run at the server tick rate, the engine speed is not used.
+
+        :param rate: ticks per second
+        :type rate: float
+        :param max_sessions: maximum number of sessions, across all connections
+        :type max_sessions: int
+        :param high_water: connection write buffer size, in bytes, above which its sessions are paused
+        :type high_water: int
+        :param max_stall: ticks a connection can stay paused before it is closed
+        :type max_stall: int
+        :param clock: monotonic clock in seconds
+        :type clock: function
+        """
+        self.rate = rate
+        self.max_sessions = max_sessions
+        self.high_water = high_water
+        self.max_stall = max_stall
+        self.scheduler = TickScheduler(rate, max_rate=rate, clock=clock)
+        self.connections = set()
+        self.n_sessions = 0
+        self.ticks = 0
+        # Time spent stepping the sessions, in seconds.
+        self.busy = 0.0
+
+    async def start(self, host='127.0.0.1', port=8765):
+        """
+        Start listening for clients.
+
+        :param host: address to listen on
+        :type host: str
+        :param port: port to listen on, 0 for any free port
+        :type port: int
+        :return: the asyncio server
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.create_server(lambda: ServerConnection(self), host, port)
+
+    async def run(self):
+        """
+        Step the sessions at the server tick rate, forever.
+        """
+        scheduler = self.scheduler
+        scheduler.start()
+        while True:
+            delay = scheduler.deadline - scheduler.clock()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self.tick()
+            scheduler.tick()
+
+    def tick(self):
+        """
+        Step every session of the connections that are not paused and send the deltas.
+        """
+        start = time.perf_counter()
+        self.ticks += 1
+        pack = DELTA_FRAME.pack
+        writes = []
+        for connection in list(self.connections):
+            if connection.paused_at is not None:
+                if self.ticks - connection.paused_at > self.max_stall:
+                    connection.transport.abort()
+                continue
+            frames = []
+            finished = []
+            for session in connection.sessions.values():
+                engine = session.engine
+                engine.step(session.direction)
+                session.direction = None
+                snake = engine.snake
+                cells = snake.cells
+                f_y, f_x = engine.food.get_position()
+                frames.append(pack(DELTA_PAYLOAD.size, DELTA, session.session_id, engine.ticks, cells[snake.head],
+                                   cells[(snake.head + snake.size - 1) & snake.mask],
+                                   f_y * engine.board_width + f_x, engine.score, STATUSES.index(engine.status)))
+                if engine.status != PLAYING:
+                    finished.append(session.session_id)
+            for session_id in finished:
+                del connection.sessions[session_id]
+            self.n_sessions -= len(finished)
+            if frames:
+                writes.append((connection.transport, b''.join(frames)))
+        # Send once every session was stepped, so that waking up the clients does not delay the tick.
+        for transport, data in writes:
+            transport.write(data)
+        self.busy += time.perf_counter() - start
+
+
+async def serve(host, port, rate=10, max_sessions=100000, stats_interval=5):
+    """
+    Run a game server until it is cancelled, printing its load every stats_interval seconds.
+
+    :param host: address to listen on
+    :type host: str
+    :param port: port to listen on
+    :type port: int
+    :param rate: ticks per second
+    :type rate: float
+    :param max_sessions: maximum number of sessions
+    :type max_sessions: int
+    :param stats_interval: seconds between load reports, 0 to disable them
+    :type stats_interval: float
+    """
+    server = GameServer(rate=rate, max_sessions=max_sessions)
+    listener = await server.start(host, port)
+    print('Listening on {}:{}'.format(host, port), file=sys.stderr)
+    runner = asyncio.ensure_future(server.run())
+    try:
+        while stats_interval:
+            ticks, busy, missed = server.ticks, server.busy, server.scheduler.missed
+            await asyncio.sleep(stats_interval)
+            n_ticks = max(server.ticks - ticks, 1)
+            print('{} sessions, {} connections, {:.1f} ticks/s, {:.1f} ms per tick, {} missed'.format(
+                server.n_sessions, len(server.connections), (server.ticks - ticks) / stats_interval,
+                (server.busy - busy) / n_ticks * 1e3, server.scheduler.missed - missed), file=sys.stderr)
+        await runner
+    finally:
+        runner.cancel()
+        listener.close()
+
+
+def add_arguments(parser):
+    """
+    Add the server command line arguments.
+
+    :param parser: argument parser
+    :type parser: argparse.ArgumentParser
+    """
+    parser.add_argument('--host', default='127.0.0.1', help='address to listen on')
+    parser.add_argument('--port', type=int, default=8765, help='port to listen on')
+    parser.add_argument('--rate', type=float, default=10, help='ticks per second')
+    parser.add_argument('--max-sessions', type=int, default=100000, help='maximum number of sessions')
+    parser.add_argument('--stats', type=float, default=5, help='seconds between load reports, 0 to disable them')
+
+
+def main(args):
+    """
+    Run a game server from the command line arguments.
+
+    :param args: parsed command line arguments
+    :type args: argparse.Namespace
+    """
+    try:
+        asyncio.run(serve(args.host, args.port, rate=args.rate, max_sessions=args.max_sessions,
+                          stats_interval=args.stats))
+    except KeyboardInterrupt:
+        pass
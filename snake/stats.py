@@ -0,0 +1,19 @@
+"""
+Copyright 2019
+Author: Joao Carvalho <joao.ac.carvalho@gmail.com>
+"""
+import math
+
+
+def percentile(values, q):
+    """
+    Percentile of sorted values, with the nearest rank method.
+
+    :param values: sorted values
+    :type values: list
+    :param q: percentile, between 0 and 100
+    :type q: float
+    :return: the percentile value
+    """
+    index = max(0, min(len(values) - 1, math.ceil(q / 100 * len(values)) - 1))
+    return values[index]
@@ -0,0 +1,249 @@
+"""
+Copyright 2019
+Author: Joao Carvalho <joao.ac.carvalho@gmail.com>
+"""
+import json
+import math
+import queue
+import sqlite3
+import threading
+from .tournament import GameResult
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    id INTEGER PRIMARY KEY,
+    seed INTEGER NOT NULL,
+    agent TEXT NOT NULL,
+    score INTEGER NOT NULL,
+    length INTEGER NOT NULL,
+    ticks INTEGER NOT NULL,
+    status TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS results_score ON results (score);
+CREATE INDEX IF NOT EXISTS results_agent_score ON results (agent, score);
+"""
+INSERT = 'INSERT INTO results (seed, agent, score, length, ticks, status) VALUES (?, ?, ?, ?, ?, ?)'
+COLUMNS = 'seed, agent, score, length, ticks, status'
+
+
+def connect(path):
+    """
+    Open a store database, creating its tables if needed. The journal is a write-ahead log, so that queries do not
+    block the writer, and it is only synced at checkpoints: a crash may lose the last results, not corrupt the file.
+
+    :param path: database file path
+    :type path: str
+    :return: the connection
+    """
+    connection = sqlite3.connect(path)
+    connection.execute('PRAGMA journal_mode=WAL')
+    connection.execute('PRAGMA synchronous=NORMAL')
+    connection.executescript(SCHEMA)
+    return connection
+
+
+class ScoreStore:
+
+    def __init__(self, path, batch_size=10000):
+        """
+        This class stores the results of finished games in a SQLite database, for high-score tables and run
+        histories. Adding a result only puts it in a queue, a background thread writes the queued results, each
+        batch in a single transaction, so the game loop never waits for the disk. The writer takes whatever is queued
+        when it wakes up, so the batches grow with the load up to batch_size results.
+        Queries run on a separate connection, in the calling thread, and see the results written so far, call flush
+        first to see every result added.
+
+        :param path: database file path
+        :type path: str
+        :param batch_size: maximum number of results per transaction
+        :type batch_size: int
+        """
+        self.path = path
+        self.batch_size = batch_size
+        self.connection = connect(path)
+        self.queue = queue.SimpleQueue()
+        self.error = None
+        self.writer = threading.Thread(target=self._write, name='score-store', daemon=True)
+        self.writer.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def add(self, result):
+        """
+        Queue a game result to be written.
+
+        :param result: game result
+        :type result: GameResult
+        """
+        self.queue.put(result)
+
+    def _write(self):
+        """
+        Writer thread loop, writes the queued results until it gets None.
+        """
+        connection = connect(self.path)
+        try:
+            stop = False
+            while not stop:
+                item = self.queue.get()
+                batch = []
+                events = []
+                while True:
+                    if item is None:
+                        stop = True
+                        break
+                    if isinstance(item, threading.Event):
+                        # Flush request, set once the results queued before it are written.
+                        events.append(item)
+                    else:
+                        batch.append(item)
+                        if len(batch) >= self.batch_size:
+                            break
+                    try:
+                        item = self.queue.get_nowait()
+                    except queue.Empty:
+                        break
+                if batch and self.error is None:
+                    try:
+                        with connection:
+                            connection.executemany(INSERT, batch)
+                    except sqlite3.Error as e:
+                        self.error = e
+                for event in events:
+                    event.set()
+        finally:
+            connection.close()
+
+    def flush(self):
+        """
+        Wait until every result added so far is written.
+        """
+        if self.writer.is_alive():
+            event = threading.Event()
+            self.queue.put(event)
+            event.wait()
+        if self.error is not None:
+            raise self.error
+
+    def close(self):
+        """
+        Write the queued results and close the store.
+        """
+        if self.writer.is_alive():
+            self.queue.put(None)
+            self.writer.join()
+        self.connection.close()
+        if self.error is not None:
+            raise self.error
+
+    def count(self, agent=None):
+        """
+        Number of results written.
+
+        :param agent: only count the games of this agent
+        :type agent: str
+        :return: number of results
+        """
+        if agent is None:
+            return self.connection.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+        return self.connection.execute('SELECT COUNT(*) FROM results WHERE agent = ?', (agent,)).fetchone()[0]
+
+    def agents(self):
+        """
+        Getter for the agents with results.
+
+        :return: sorted list of agent names
+        """
+        return [row[0] for row in self.connection.execute('SELECT DISTINCT agent FROM results ORDER BY agent')]
+
+    def top(self, n=10, agent=None):
+        """
+        High-score table, read from the score indexes.
+
+        :param n: number of results
+        :type n: int
+        :param agent: only the games of this agent
+        :type agent: str
+        :return: list of the game results with the highest scores, the first written first among equal scores
+        """
+        if agent is None:
+            rows = self.connection.execute('SELECT {} FROM results ORDER BY score DESC, id LIMIT ?'.format(COLUMNS),
+                                           (n,))
+        else:
+            rows = self.connection.execute('SELECT {} FROM results WHERE agent = ? ORDER BY score DESC, id '
+                                           'LIMIT ?'.format(COLUMNS), (agent, n))
+        return [GameResult(*row) for row in rows]
+
+    def history(self, n=10, agent=None):
+        """
+        Last games written.
+
+        :param n: number of results
+        :type n: int
+        :param agent: only the games of this agent
+        :type agent: str
+        :return: list of the last game results, the latest first
+        """
+        if agent is None:
+            rows = self.connection.execute('SELECT {} FROM results ORDER BY id DESC LIMIT ?'.format(COLUMNS), (n,))
+        else:
+            rows = self.connection.execute('SELECT {} FROM results WHERE agent = ? ORDER BY id DESC '
+                                           'LIMIT ?'.format(COLUMNS), (agent, n))
+        return [GameResult(*row) for row in rows]
+
+    def percentiles(self, agent, qs=(50, 90, 99)):
+        """
+        Score percentiles of an agent, with the nearest rank method like stats.percentile. Each percentile is
+        read by walking the agent score index up to its rank, nothing is sorted.
+
+        :param agent: agent name
+        :type agent: str
+        :param qs: percentiles, between 0 and 100
+        :type qs: list
+        :return: dictionary from percentile to score, empty if the agent has no results
+        """
+        n = self.count(agent)
+        if n == 0:
+            return {}
+        percentiles = {}
+        for q in qs:
+            index = max(0, min(n - 1, math.ceil(q / 100 * n) - 1))
+            row = self.connection.execute('SELECT score FROM results WHERE agent = ? ORDER BY score LIMIT 1 OFFSET ?',
+                                          (agent, index)).fetchone()
+            percentiles[q] = row[0]
+        return percentiles
+
+
+def add_arguments(parser):
+    """
+    Add the score store command line arguments.
+
+    :param parser: argument parser
+    :type parser: argparse.ArgumentParser
+    """
+    parser.add_argument('store', help='score database file')
+    parser.add_argument('--agent', help='only the games of this agent')
+    parser.add_argument('--top', type=int, default=10, help='number of high scores')
+
+
+def main(args):
+    """
+    Print the high scores, the last games and the score percentiles of each agent of a store.
+
+    :param args: parsed command line arguments
+    :type args: argparse.Namespace
+    """
+    with ScoreStore(args.store) as store:
+        agents = [args.agent] if args.agent else store.agents()
+        report = {
+            'games': store.count(args.agent),
+            'top': [result._asdict() for result in store.top(args.top, args.agent)],
+            'last': [result._asdict() for result in store.history(args.top, args.agent)],
+            'percentiles': {agent: store.percentiles(agent) for agent in agents},
+        }
+    print(json.dumps(report, indent=2))
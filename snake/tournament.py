@@ -0,0 +1,184 @@
+"""
+Copyright 2019
+Author: Joao Carvalho <joao.ac.carvalho@gmail.com>
+"""
+import json
+import multiprocessing
+import os
+import sys
+import time
+from collections import namedtuple
+from .agents import load_agent
+from .engine import Engine
+from .stats import percentile
+
+
+# Outcome of a single game.
+GameResult = namedtuple('GameResult', ['seed', 'agent', 'score', 'length', 'ticks', 'status'])
+
+
+def play_games(agent_spec, seeds, board_height=20, board_width=40, max_ticks=100000):
+    """
+    Play one headless game per seed with the same agent.
+
+    :param agent_spec: agent name or 'module:Class' import path
+    :type agent_spec: str
+    :param seeds: game seeds
+    :type seeds: list
+    :param board_height: board game height
+    :type board_height: int
+    :param board_width: board game width
+    :type board_width: int
+    :param max_ticks: games still running after this many ticks are stopped
+    :type max_ticks: int
+    :return: list with the result of each game
+    """
+    agent = load_agent(agent_spec)
+    engine = Engine(board_height=board_height, board_width=board_width)
+    results = []
+    for seed in seeds:
+        state = engine.reset(seed)
+        agent.reset(engine.board_height, engine.board_width, seed)
+        done = False
+        while not done and engine.ticks < max_ticks:
+            state, _, done = engine.step(agent.act(state))
+        results.append(GameResult(seed, agent_spec, engine.score, engine.snake.size, engine.ticks, engine.status))
+    return results
+
+
+def _play_batch(args):
+    """
+    Pool worker entry point, unpacks the arguments of play_games.
+    """
+    return play_games(*args)
+
+
+def run_tournament(agent_specs, num_games, seed=0, workers=None, batch_size=64, board_height=20, board_width=40,
+                   max_ticks=100000):
+    """
+    Play seeded headless games for each agent across a pool of worker processes. The games of an agent use the seeds
+    seed, seed + 1, ..., so every agent plays the same boards. Each worker task plays a batch of games, so the
+    inter-process communication is one message per batch instead of one per game.
+
+    :param agent_specs: agent names or 'module:Class' import paths
+    :type agent_specs: list
+    :param num_games: number of games per agent
+    :type num_games: int
+    :param seed: seed of the first game
+    :type seed: int
+    :param workers: number of worker processes, defaults to the number of cores
+    :type workers: int
+    :param batch_size: number of games per worker task
+    :type batch_size: int
+    :param board_height: board game height
+    :type board_height: int
+    :param board_width: board game width
+    :type board_width: int
+    :param max_ticks: games still running after this many ticks are stopped
+    :type max_ticks: int
+    :return: iterator over the game results, in completion order
+    """
+    tasks = []
+    for agent_spec in agent_specs:
+        for start in range(seed, seed + num_games, batch_size):
+            seeds = list(range(start, min(start + batch_size, seed + num_games)))
+            tasks.append((agent_spec, seeds, board_height, board_width, max_ticks))
+
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        for task in tasks:
+            yield from _play_batch(task)
+        return
+    with multiprocessing.Pool(workers) as pool:
+        for results in pool.imap_unordered(_play_batch, tasks):
+            yield from results
+
+
+def summarize(results):
+    """
+    Aggregate the score, length and survival time distributions of the game results of each agent.
+
+    :param results: game results
+    :type results: list
+    :return: dictionary from agent to its statistics
+    """
+    by_agent = {}
+    for result in results:
+        by_agent.setdefault(result.agent, []).append(result)
+
+    summary = {}
+    for agent, agent_results in by_agent.items():
+        stats = {'games': len(agent_results)}
+        for field in ['score', 'length', 'ticks']:
+            values = sorted(getattr(r, field) for r in agent_results)
+            stats[field] = {
+                'mean': sum(values) / len(values),
+                'min': values[0],
+                'p50': percentile(values, 50),
+                'p90': percentile(values, 90),
+                'p99': percentile(values, 99),
+                'max': values[-1],
+            }
+        statuses = {}
+        for r in agent_results:
+            statuses[r.status] = statuses.get(r.status, 0) + 1
+        stats['status'] = statuses
+        summary[agent] = stats
+    return summary
+
+
+def add_arguments(parser):
+    """
+    Add the tournament command line arguments.
+
+    :param parser: argument parser
+    :type parser: argparse.ArgumentParser
+    """
+    parser.add_argument('--agent', action='append', dest='agents',
+                        help="agent name or 'module:Class', can be repeated (default: greedy)")
+    parser.add_argument('--games', type=int, default=1000, help='games per agent')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the first game')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: number of cores)')
+    parser.add_argument('--batch-size', type=int, default=64, help='games per worker task')
+    parser.add_argument('--board-height', type=int, default=20)
+    parser.add_argument('--board-width', type=int, default=40)
+    parser.add_argument('--max-ticks', type=int, default=100000, help='stop games longer than this')
+    parser.add_argument('--output', help='write each game result as a JSON line to this file')
+    parser.add_argument('--scores', help='add the game results to a score database')
+
+
+def main(args):
+    """
+    Run a tournament from the command line arguments and print the summary.
+
+    :param args: parsed command line arguments
+    :type args: argparse.Namespace
+    """
+    # Imported here, the store module imports GameResult from this module.
+    from .store import ScoreStore
+
+    agents = args.agents or ['greedy']
+    output = open(args.output, 'w') if args.output else None
+    store = ScoreStore(args.scores) if args.scores else None
+    results = []
+    start = time.monotonic()
+    try:
+        for result in run_tournament(agents, args.games, seed=args.seed, workers=args.workers,
+                                     batch_size=args.batch_size, board_height=args.board_height,
+                                     board_width=args.board_width, max_ticks=args.max_ticks):
+            results.append(result)
+            if output is not None:
+                output.write(json.dumps(result._asdict()) + '\n')
+            if store is not None:
+                store.add(result)
+    finally:
+        if output is not None:
+            output.close()
+        if store is not None:
+            store.close()
+    elapsed = time.monotonic() - start
+
+    ticks = sum(r.ticks for r in results)
+    print('{} games, {} ticks in {:.2f}s ({:.0f} ticks/s)'.format(len(results), ticks, elapsed,
+                                                                  ticks / max(elapsed, 1e-9)), file=sys.stderr)
+    print(json.dumps(summarize(results), indent=2))
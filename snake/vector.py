@@ -0,0 +1,251 @@
+"""
+Copyright 2019
+Author: Joao Carvalho <joao.ac.carvalho@gmail.com>
+"""
+from collections import namedtuple
+import numpy as np
+from .components import Point
+
+
+# Integer encoding of the snake directions, in the same order as Snake.directions. -1 keeps the current direction.
+RIGHT, LEFT, UP, DOWN = 0, 1, 2, 3
+DIRECTIONS = ['RIGHT', 'LEFT', 'UP', 'DOWN']
+
+# Integer encoding of the game status.
+PLAYING, WIN, LOST = 0, 1, 2
+
+# Arrays describing all games after a step. Cells are flattened board indices, y * board_width + x.
+VectorState = namedtuple('VectorState', ['grid', 'head', 'food', 'score', 'size', 'direction'])
+
+
+class VectorEngine:
+
+    def __init__(self, num_games, board_height=20, board_width=40, initial_speed=2, speed_increase=0.5,
+                 initial_size=3, seed=None):
+        """
+        This class implements a batch of independent games stored as NumPy arrays, all advanced by a single
+        vectorized call to step. The rules are the same as in Engine: the snake drops its tail and moves its head,
+        eats the food, grows from the tail and is LOST if its head hits the body or the board walls or WON once it
+        covers the whole board.
+        Games that end are automatically reset. Their final score, size and ticks are kept in final_score,
+        final_size and final_ticks until the game ends again.
+
+        Each game owns a ring buffer with the flattened body cells, from the tail up to the head, and an occupancy
+        grid with the number of body segments on each cell.
+
+        :param num_games: number of games in the batch
+        :type num_games: int
+        :param board_height: board game height
+        :type board_height: int
+        :param board_width: board game width
+        :type board_width: int
+        :param initial_speed: initial game speed
+        :type initial_speed: int
+        :param speed_increase: game speed incremental increase after eating a food element
+        :type speed_increase: float
+        :param initial_size: initial size for the snakes
+        :type initial_size: int
+        :param seed: seed for the batch random number generator
+        :type seed: int
+        """
+        assert initial_size >= 2, "Initially the snake must have size 2"
+        self.num_games = num_games
+        self.board_height = max(10, board_height)
+        self.board_width = max(10, board_width)
+        self.initial_speed = initial_speed
+        self.speed_increase = speed_increase
+        self.initial_size = initial_size
+
+        n_cells = self.board_height * self.board_width
+        # Ring buffer capacity, a power of two so that wrapping around is a bitwise and instead of a modulo.
+        self.capacity = 1 << (n_cells - 1).bit_length()
+        self.mask = self.capacity - 1
+        # Cell offset of a move in each direction.
+        self.deltas = np.array([1, -1, -self.board_width, self.board_width], dtype=np.int64)
+
+        # Board cells that are walls and interior cells where food can be placed.
+        ys, xs = np.divmod(np.arange(n_cells), self.board_width)
+        self.walls = (ys == 0) | (ys == self.board_height - 1) | (xs == 0) | (xs == self.board_width - 1)
+        self.interior = np.flatnonzero(~self.walls)
+
+        self.grid = np.zeros((num_games, n_cells), dtype=np.int8)
+        self.body = np.zeros((num_games, self.capacity), dtype=np.int32)
+        # Offset of each game in the flattened grid and body arrays.
+        self.grid_rows = np.arange(num_games, dtype=np.int64) * n_cells
+        self.body_rows = np.arange(num_games, dtype=np.int64) * self.capacity
+        self.head = np.zeros(num_games, dtype=np.int64)
+        self.head_cell = np.zeros(num_games, dtype=np.int64)
+        self.size = np.zeros(num_games, dtype=np.int64)
+        self.direction = np.zeros(num_games, dtype=np.int64)
+        self.food = np.zeros(num_games, dtype=np.int64)
+        self.score = np.zeros(num_games, dtype=np.int64)
+        self.ticks = np.zeros(num_games, dtype=np.int64)
+        self.speed = np.zeros(num_games, dtype=np.float64)
+        self.status = np.zeros(num_games, dtype=np.int8)
+
+        self.final_score = np.zeros(num_games, dtype=np.int64)
+        self.final_size = np.zeros(num_games, dtype=np.int64)
+        self.final_ticks = np.zeros(num_games, dtype=np.int64)
+        self.final_status = np.zeros(num_games, dtype=np.int8)
+
+        self.reset(seed)
+
+    def reset(self, seed=None):
+        """
+        Reset all games.
+
+        :param seed: seed for the batch random number generator, None to seed from the system
+        :type seed: int
+        :return: the state of all games
+        """
+        self.rng = np.random.default_rng(seed)
+        self.reset_games(np.arange(self.num_games))
+        return self.get_state()
+
+    def reset_games(self, games):
+        """
+        Reset a subset of the games. The snake is placed at the center of the board heading to the RIGHT.
+
+        :param games: indices of the games to reset
+        :type games: numpy.ndarray
+        """
+        if len(games) == 0:
+            return
+        center = (self.board_height // 2) * self.board_width + self.board_width // 2
+        # The ring buffer holds the tail first and the head last.
+        initial_body = center - np.arange(self.initial_size)[::-1]
+
+        # Clear only the cells of the previous snakes, dead snakes are usually much smaller than the board.
+        sizes = self.size[games]
+        starts = np.repeat(np.cumsum(sizes) - sizes, sizes)
+        positions = (np.repeat(self.head[games] - sizes + 1, sizes) + np.arange(starts.size) - starts) & self.mask
+        cells = self.body.reshape(-1)[np.repeat(self.body_rows[games], sizes) + positions]
+        self.grid.reshape(-1)[np.repeat(self.grid_rows[games], sizes) + cells] = 0
+
+        self.body[games, :self.initial_size] = initial_body
+        self.grid[games[:, None], initial_body[None, :]] = 1
+        self.head[games] = self.initial_size - 1
+        self.head_cell[games] = center
+        self.size[games] = self.initial_size
+        self.direction[games] = RIGHT
+        self.score[games] = 0
+        self.ticks[games] = 0
+        self.speed[games] = self.initial_speed
+        self.status[games] = PLAYING
+        self.place_food(games)
+
+    def get_state(self):
+        """
+        Getter for the state of all games. The arrays are the engine arrays, not copies.
+
+        :return: the state of all games
+        """
+        return VectorState(self.grid, self.head_cell, self.food, self.score, self.size, self.direction)
+
+    def get_body(self, game):
+        """
+        Getter for the snake positions of one game, in the same order as Snake.get_body.
+
+        :param game: game index
+        :type game: int
+        :return: list with the snake y and x positions, from the head to the tail
+        """
+        indices = (self.head[game] - np.arange(self.size[game])) & self.mask
+        return [Point(*divmod(int(cell), self.board_width)) for cell in self.body[game, indices]]
+
+    def place_food(self, games):
+        """
+        Place the food of some games in a random interior position, where it doesn't hit the snake.
+        Rejection sampling is tried first for all games at once, games with a crowded board fall back to sampling
+        the free cells directly. Games without any free cell are WON.
+
+        :param games: indices of the games that need new food
+        :type games: numpy.ndarray
+        """
+        pending = games
+        for _ in range(8):
+            if len(pending) == 0:
+                return
+            cells = self.interior[self.rng.integers(0, len(self.interior), size=len(pending))]
+            free = self.grid[pending, cells] == 0
+            self.food[pending[free]] = cells[free]
+            pending = pending[~free]
+
+        for game in pending:
+            free_cells = self.interior[self.grid[game, self.interior] == 0]
+            if len(free_cells) == 0:
+                self.status[game] = WIN
+            else:
+                self.food[game] = free_cells[self.rng.integers(0, len(free_cells))]
+
+    def step(self, actions=None):
+        """
+        Advance all games by one tick: change the snake directions, move them and check for collisions.
+        Games that end in this tick are reset before returning.
+
+        :param actions: new head direction of each game, encoded as RIGHT, LEFT, UP or DOWN. -1 or None keep the
+                        current direction
+        :type actions: numpy.ndarray
+        :return: the state of all games, the score gained by each game and which games ended in this tick
+        """
+        if actions is not None:
+            actions = np.asarray(actions)
+            np.copyto(self.direction, actions, where=(actions >= 0) & (actions < 4))
+
+        # Index the flattened body and grid arrays directly, it avoids building 2-d indices on every tick.
+        body = self.body.reshape(-1)
+        grid = self.grid.reshape(-1)
+
+        # Delete the tails.
+        tails = body[self.body_rows + ((self.head - self.size + 1) & self.mask)]
+        grid[self.grid_rows + tails] -= 1
+
+        # Move the heads.
+        heads = self.head_cell
+        heads += self.deltas[self.direction]
+        self.head += 1
+        self.head &= self.mask
+        body[self.body_rows + self.head] = heads
+        head_cells = self.grid_rows + heads
+        occupied = grid[head_cells]
+        grid[head_cells] = occupied + 1
+        # Check for body and board collisions, the body grown below is checked separately.
+        lost = (occupied > 0) | self.walls[heads]
+        self.ticks += 1
+
+        # Check for food collisions. The new food is placed after the snake grows, as in Engine.check_collisions.
+        ate = np.flatnonzero(heads == self.food)
+        rewards = np.zeros(self.num_games, dtype=np.int64)
+        if len(ate) > 0:
+            self.score[ate] += 1
+            self.speed[ate] += self.speed_increase
+            rewards[ate] = 1
+
+            # Grow from the tail, away from the penultimate body part.
+            tail_index = (self.head[ate] - self.size[ate] + 1) & self.mask
+            tail = self.body[ate, tail_index]
+            penultimate = self.body[ate, (tail_index + 1) & self.mask]
+            new_tail = 2 * tail - penultimate
+            self.body[ate, (tail_index - 1) & self.mask] = new_tail
+            self.grid[ate, new_tail] += 1
+            self.size[ate] += 1
+            lost[ate] |= new_tail == heads[ate]
+
+            # The game is WON when the snake covers the whole board, which needs at least one part per cell.
+            for game in ate[self.size[ate] >= len(self.interior)]:
+                if self.grid[game, self.interior].all():
+                    self.status[game] = WIN
+            self.place_food(ate[self.status[ate] == PLAYING])
+
+        self.status[lost & (self.status == PLAYING)] = LOST
+
+        dones = self.status != PLAYING
+        ended = np.flatnonzero(dones)
+        if len(ended) > 0:
+            self.final_score[ended] = self.score[ended]
+            self.final_size[ended] = self.size[ended]
+            self.final_ticks[ended] = self.ticks[ended]
+            self.final_status[ended] = self.status[ended]
+            self.reset_games(ended)
+
+        return self.get_state(), rewards, dones
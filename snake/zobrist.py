@@ -0,0 +1,175 @@
+"""
+Copyright 2019
+Author: Joao Carvalho <joao.ac.carvalho@gmail.com>
+"""
+from collections import OrderedDict
+from itertools import islice
+from .rng import GOLDEN_GAMMA, MASK64, mix64
+
+
+# Kinds of the hashed features of a game state.
+BODY, DIRECTION, FOOD, SCORE = 0, 1, 2, 3
+# Link of a body part to the part before it: the direction the snake moved in to leave the cell, as its index in
+# Snake.directions, or one of these for the head and for a part that is not next to the part before it.
+HEAD_LINK = 4
+DETACHED_LINK = 5
+
+
+def zobrist_key(value, kind):
+    """
+    Random 64-bit key of a feature of a game state. Keys are computed rather than drawn from a table, so they take no
+    memory whatever the board size, and are the same in every process. Different features always get different keys.
+
+    :param value: feature value, a non-negative integer below 2 ** 61
+    :type value: int
+    :param kind: feature kind, BODY, DIRECTION, FOOD or SCORE
+    :type kind: int
+    :return: 64-bit key
+    """
+    return mix64((((value << 2) | kind) + 1) * GOLDEN_GAMMA & MASK64)
+
+
+def link_code(cell, previous, board_width):
+    """
+    Link of a body part to the part before it, towards the head.
+
+    :param cell: flattened cell of the body part
+    :type cell: int
+    :param previous: flattened cell of the part before it
+    :type previous: int
+    :param board_width: board game width
+    :type board_width: int
+    :return: index of the direction in Snake.directions, or DETACHED_LINK
+    """
+    step = previous - cell
+    if step == 1:
+        return 0
+    if step == -1:
+        return 1
+    if step == -board_width:
+        return 2
+    if step == board_width:
+        return 3
+    return DETACHED_LINK
+
+
+def part_key(cell, link):
+    """
+    Key of a body part.
+
+    :param cell: flattened cell of the body part
+    :type cell: int
+    :param link: link to the part before it, as returned by link_code, or HEAD_LINK
+    :type link: int
+    :return: 64-bit key
+    """
+    # Same as zobrist_key((cell << 3) | link, BODY), inlined since every move computes four of these.
+    z = ((((cell << 3) | link) << 2) + 1) * GOLDEN_GAMMA & MASK64
+    z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & MASK64
+    z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & MASK64
+    return z ^ (z >> 31)
+
+
+def body_hash(cells, board_width):
+    """
+    Hash of a snake body, computed from scratch. Each body part is hashed with its cell and its link to the part
+    before it, so that the order of the parts is part of the hash, and a move only changes the keys of the new head,
+    the old head and the vacated tail.
+
+    :param cells: flattened cells, from the head to the tail
+    :type cells: list
+    :param board_width: board game width
+    :type board_width: int
+    :return: 64-bit hash
+    """
+    if not len(cells):
+        return 0
+    value = part_key(cells[0], HEAD_LINK)
+    for i in range(1, len(cells)):
+        value ^= part_key(cells[i], link_code(cells[i], cells[i - 1], board_width))
+    return value
+
+
+class TranspositionTable:
+
+    def __init__(self, capacity=65536, probe=4):
+        """
+        This class implements a bounded cache of evaluated game states, keyed by their hash, for search agents.
+        Each entry keeps a value and the search depth it was computed at: storing a state again only replaces its
+        value if the new depth is at least as deep. Entries are kept in least recently used order, and once the table
+        is full, a new entry evicts the shallowest of the probe least recently used entries, so that costly deep
+        results outlive cheap shallow ones. Getting and storing take constant time.
+
+        :param capacity: maximum number of entries
+        :type capacity: int
+        :param probe: number of least recently used entries considered for eviction
+        :type probe: int
+        """
+        self.capacity = capacity
+        self.probe = probe
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        """
+        Number of entries.
+        """
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def get(self, key, depth=0):
+        """
+        Getter for the value of a state, computed at least at a given depth.
+
+        :param key: state hash
+        :type key: int
+        :param depth: minimum search depth of the value
+        :type depth: int
+        :return: the value, None if the state is unknown or was only searched shallower
+        """
+        entry = self.entries.get(key)
+        if entry is None or entry[1] < depth:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, key, value, depth=0):
+        """
+        Store the value of a state.
+
+        :param key: state hash
+        :type key: int
+        :param value: value of the state
+        :type value: object
+        :param depth: search depth the value was computed at
+        :type depth: int
+        :return: True if the value was stored, False if a deeper value is kept instead
+        """
+        entries = self.entries
+        entry = entries.get(key)
+        if entry is not None:
+            if entry[1] > depth:
+                entries.move_to_end(key)
+                return False
+        elif len(entries) >= self.capacity:
+            victim = min(islice(entries, self.probe), key=lambda k: entries[k][1])
+            del entries[victim]
+            self.evictions += 1
+        entries[key] = (value, depth)
+        entries.move_to_end(key)
+        return True
+
+    def clear(self):
+        """
+        Remove every entry and reset the counters.
+        """
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
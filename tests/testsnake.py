@@ -2,10 +2,45 @@
 Copyright 2019
 Author: Joao Carvalho <joao.ac.carvalho@gmail.com>
 """
+import asyncio
+import io
+import json
+import os
+import time
 import unittest
 import curses
-from snake.components import Snake, Point
+import random
+import struct
+import socket
+import tempfile
+import threading
+from array import array
+from snake.components import Snake, Point, FreeCells, SCAN_SIZE
 from snake.game import Game
+from snake.render import AnsiScreen, CursesRenderer, row_symbols
+from snake.clock import TickScheduler
+from snake.input import InputQueue
+from snake.agents import GreedyAgent, AutopilotAgent, agent_name, load_agent
+from snake.autopilot import DistanceField, hamiltonian_cycle
+from snake.tournament import GameResult, percentile, play_games, run_tournament, summarize
+from snake.store import ScoreStore
+from snake.events import EventStream
+from snake.export import AsciicastWriter, GifWriter, COLORS, END_HOLD, export, lzw_encode
+from snake.replay import Recorder, ReplayReader, verify, HEADER, KEYFRAME, LENGTH
+from snake.engine import Engine, LOST, PLAYING, SNAPSHOT_HEADER, WIN
+from snake.maps import load_map, parse_map
+from snake.arena import Arena, EMPTY as CELL_EMPTY, FOOD as CELL_FOOD, WALL as CELL_WALL
+from snake.rng import GameRandom, derive_seed
+from snake.profiling import NullProfiler, PhaseProfiler
+from snake.zobrist import TranspositionTable, body_hash
+from snake.server import (GameServer, ServerConnection, FrameDecoder, SessionView, encode_frame, FRAME, JOIN_PAYLOAD,
+                          TURN_PAYLOAD, START_PAYLOAD, JOIN, TURN, START, DELTA, ERROR)
+try:
+    import numpy as np
+    from snake.vector import VectorEngine, DIRECTIONS
+    from snake.observation import Observation, FrameStack, BODY, HEAD, FOOD, WALLS
+except ImportError:
+    np = None
 
 
 class TestSnake(unittest.TestCase):
@@ -91,6 +126,194 @@ class TestSnake(unittest.TestCase):
         body = [Point(6, 5), Point(5, 5), Point(5, 4)]
         self.assertEqual(snake.get_body(), body)
 
+    def test_occupancy(self):
+        snake = Snake(5, 5, initial_size=3)
+        self.assertTrue(snake.is_occupied(5, 3))
+        snake.move()
+        self.assertFalse(snake.is_occupied(5, 3))
+        self.assertTrue(snake.is_occupied(5, 6))
+        snake.increase_body()
+        self.assertTrue(snake.is_occupied(5, 3))
+
+    def test_head_collision(self):
+        snake = Snake(5, 5, initial_size=5)
+        self.assertFalse(snake.check_head_collision())
+        for direction in ['UP', 'LEFT', 'DOWN']:
+            snake.change_direction(direction)
+            snake.move()
+        self.assertTrue(snake.check_head_collision())
+
+        snake.body = [Point(5, 5), Point(5, 6), Point(5, 5)]
+        self.assertTrue(snake.check_head_collision())
+
+    def test_long_snake(self):
+        # Short snakes scan their cells, long ones keep a bitmap. Both must agree with the body.
+        for size in [3, SCAN_SIZE + 5]:
+            snake = Snake(10, 5, initial_size=3, board_height=20, board_width=60)
+            for i in range(size - 3):
+                snake.move()
+                snake.increase_body()
+            for direction in ['DOWN', 'RIGHT', 'UP', 'UP', 'LEFT', 'DOWN']:
+                snake.change_direction(direction)
+                snake.move()
+                snake.increase_body()
+                body = snake.get_body()
+                self.assertEqual(len(body), snake.size)
+                self.assertEqual(snake.get_head_position(), body[0])
+                self.assertEqual(snake.get_tail_position(), body[-1])
+                occupied = [(y, x) for y in range(20) for x in range(60) if snake.is_occupied(y, x)]
+                self.assertEqual(sorted(occupied), sorted(set(body)))
+                self.assertEqual(snake.check_head_collision(), body[0] in body[1:])
+
+    def test_footprint(self):
+        snake = Snake(board_height=20, board_width=40)
+        self.assertFalse(hasattr(snake, '__dict__'))
+        self.assertEqual(snake.direction, 0)
+        self.assertEqual(snake.cells.itemsize, 2)
+
+    def test_board_size(self):
+        # Without a board size, the board is large enough for the head position.
+        self.assertEqual(Snake(30, 50).get_body(), [Point(30, 50), Point(30, 49), Point(30, 48)])
+        self.assertEqual((Snake(5, 2).board_height, Snake(5, 2).board_width), (20, 40))
+        for y, x in [(0, 0), (5, 1), (-1, 5)]:
+            with self.assertRaises(ValueError):
+                Snake(y, x)
+        with self.assertRaises(ValueError):
+            Snake(5, 10, board_height=5, board_width=20)
+
+    def test_move_off_board(self):
+        # A move off the board is rejected before it changes the snake.
+        for y, x, direction in [(0, 5, 'UP'), (9, 5, 'DOWN'), (5, 9, 'RIGHT'), (5, 1, 'LEFT')]:
+            snake = Snake(y, x, initial_size=2, board_height=10, board_width=10)
+            if direction == 'LEFT':
+                snake.body = [Point(5, 0), Point(5, 1)]
+            snake.change_direction(direction)
+            body = snake.get_body()
+            with self.assertRaises(ValueError):
+                snake.move()
+            self.assertEqual(snake.get_body(), body)
+            self.assertFalse(snake.check_head_collision())
+
+
+class TestFreeCells(unittest.TestCase):
+    """
+    Test the FreeCells class methods.
+    """
+
+    def test_add_remove(self):
+        free_cells = FreeCells(10, 10)
+        self.assertEqual(len(free_cells), 64)
+        self.assertFalse(free_cells.is_free(0, 5))
+        free_cells.remove(5, 5)
+        free_cells.remove(5, 5)
+        free_cells.remove(0, 5)
+        self.assertEqual(len(free_cells), 63)
+        self.assertFalse(free_cells.is_free(5, 5))
+        free_cells.add(5, 5)
+        free_cells.add(9, 9)
+        self.assertEqual(len(free_cells), 64)
+        self.assertTrue(free_cells.is_free(5, 5))
+
+    def test_sample(self):
+        free_cells = FreeCells(10, 10)
+        for y in range(1, 9):
+            for x in range(1, 9):
+                if (y, x) != (3, 4):
+                    free_cells.remove(y, x)
+        self.assertEqual(free_cells.sample(random.Random(0)), (3, 4))
+        free_cells.remove(3, 4)
+        self.assertIsNone(free_cells.sample(random.Random(0)))
+
+
+class FakeClock:
+    """
+    Clock controlled by the tests.
+    """
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class TestTickScheduler(unittest.TestCase):
+    """
+    Test the TickScheduler class methods.
+    """
+
+    def test_deadlines(self):
+        clock = FakeClock()
+        scheduler = TickScheduler(10, clock=clock, sleep=clock.sleep)
+        for i in range(1, 4):
+            self.assertFalse(scheduler.wait())
+            self.assertAlmostEqual(clock.now, i * 0.1)
+            # The work done in a tick does not delay the next deadline.
+            clock.now += 0.05
+            self.assertEqual(scheduler.tick(), 0)
+        self.assertEqual(scheduler.missed, 0)
+
+    def test_missed_deadlines(self):
+        clock = FakeClock()
+        scheduler = TickScheduler(10, clock=clock, sleep=clock.sleep)
+        scheduler.wait()
+        clock.now += 0.25
+        self.assertEqual(scheduler.tick(), 2)
+        self.assertEqual(scheduler.missed, 2)
+        scheduler.wait()
+        self.assertAlmostEqual(clock.now, 0.4)
+
+    def test_input_wakeup(self):
+        read_fd, write_fd = os.pipe()
+        scheduler = TickScheduler(1)
+        os.write(write_fd, b'q')
+        start = time.monotonic()
+        self.assertTrue(scheduler.wait(read_fd))
+        self.assertLess(time.monotonic() - start, 0.5)
+        os.close(read_fd)
+        os.close(write_fd)
+
+    def test_max_rate(self):
+        scheduler = TickScheduler(100, max_rate=30)
+        self.assertEqual(scheduler.rate, 30)
+        scheduler.set_rate(5)
+        self.assertEqual(scheduler.period, 0.2)
+
+
+class TestInputQueue(unittest.TestCase):
+    """
+    Test the InputQueue class methods.
+    """
+
+    def test_turns(self):
+        clock = FakeClock()
+        queue = InputQueue(capacity=2, clock=clock)
+        # A quick U-turn is applied over two ticks, redundant presses and reversals are not queued.
+        self.assertFalse(queue.push('RIGHT', 'RIGHT'))
+        self.assertFalse(queue.push('LEFT', 'RIGHT'))
+        self.assertTrue(queue.push('UP', 'RIGHT'))
+        self.assertFalse(queue.push('UP', 'RIGHT'))
+        self.assertFalse(queue.push('DOWN', 'RIGHT'))
+        self.assertTrue(queue.push('LEFT', 'RIGHT'))
+        self.assertFalse(queue.push('DOWN', 'RIGHT'))
+        self.assertEqual(len(queue), 2)
+        clock.sleep(0.05)
+        self.assertEqual(queue.pop('RIGHT'), 'UP')
+        clock.sleep(0.1)
+        self.assertEqual(queue.pop('UP'), 'LEFT')
+        self.assertIsNone(queue.pop('LEFT'))
+
+        # Turns no longer valid for the heading are skipped.
+        queue.push('UP', 'RIGHT')
+        self.assertIsNone(queue.pop('DOWN'))
+        stats = queue.stats()
+        self.assertEqual((stats['presses'], stats['applied'], stats['coalesced'], stats['reversals'],
+                          stats['dropped']), (8, 2, 2, 3, 1))
+        self.assertAlmostEqual(stats['latency_ms']['max'], 150)
+
 
 class TestGame(unittest.TestCase):
     """
@@ -113,6 +336,91 @@ class TestGame(unittest.TestCase):
         game.snake.body = [Point(1, 5), Point(2, 5), Point(3, 5)]
         self.assertFalse(game.check_board_collision())
 
+    def test_render(self):
+        def screen_symbol(game, y, x):
+            return chr(game.stdscr.inch(y, x) & 0xFF)
+
+        game = curses.wrapper(Game, board_height=20, board_width=20)
+        game.engine.snake.body = [Point(10, x) for x in range(15, 2, -1)]
+        game.engine.rebuild_free_cells()
+        game.food.position = Point(5, 5)
+        game.render()
+        self.assertEqual(screen_symbol(game, 10, 15), 'O')
+        self.assertEqual(screen_symbol(game, 10, 3), 'o')
+
+        # Only the head, tail and food positions are redrawn.
+        game.engine.step('UP')
+        game.food.position = Point(6, 6)
+        draw_calls = game.renderer.draw_calls
+        game.render()
+        self.assertEqual(game.renderer.draw_calls - draw_calls, 6)
+        self.assertEqual(screen_symbol(game, 9, 15), 'O')
+        self.assertEqual(screen_symbol(game, 10, 15), 'o')
+        self.assertEqual(screen_symbol(game, 10, 3), ' ')
+        self.assertEqual(screen_symbol(game, 5, 5), ' ')
+        self.assertEqual(screen_symbol(game, 6, 6), 'X')
+
+    def test_render_viewport(self):
+        # A board larger than the terminal is shown through a viewport that follows the head.
+        game = curses.wrapper(Game, board_height=300, board_width=500)
+        renderer = game.renderer
+        self.assertTrue(game.viewport)
+        game.engine.snake.body = [Point(150, x) for x in range(400, 100, -1)]
+        game.engine.rebuild_free_cells()
+        game.render()
+        h_y, h_x = game.engine.snake.get_head_position()
+        c_y, c_x = renderer.camera
+        o_y, o_x = renderer.origin
+        self.assertTrue(c_y <= h_y < c_y + renderer.view_height and c_x <= h_x < c_x + renderer.view_width)
+        self.assertEqual(chr(renderer.pad.inch(h_y - o_y, h_x - o_x) & 0xFF), 'O')
+        self.assertEqual(chr(renderer.pad.inch(h_y - o_y, h_x - o_x - 1) & 0xFF), 'o')
+
+        # The frames redraw at most the pad, whatever the snake length.
+        for _ in range(3 * renderer.view_width):
+            draw_calls = renderer.draw_calls
+            game.engine.step('RIGHT')
+            game.render()
+            self.assertLessEqual(renderer.draw_calls - draw_calls, renderer.pad_height + 1)
+            h_y, h_x = game.engine.snake.get_head_position()
+            c_y, c_x = renderer.camera
+            self.assertTrue(c_x + renderer.view_width // 4 <= h_x < c_x + renderer.view_width)
+        o_y, o_x = renderer.origin
+        self.assertEqual(chr(renderer.pad.inch(h_y - o_y, h_x - o_x) & 0xFF), 'O')
+
+    def test_render_ansi(self):
+        output = io.BytesIO()
+        screen = AnsiScreen(output, 20, 20)
+        renderer = CursesRenderer(screen, 20, 20, doupdate=screen.flush)
+        engine = Engine(board_height=20, board_width=20, seed=1)
+        renderer.render(engine)
+        self.assertTrue(output.getvalue().startswith(AnsiScreen.CLEAR))
+        self.assertEqual(chr(screen.inch(10, 10)), 'O')
+        self.assertEqual(bytes(screen.front[10]), bytes(screen.back[10]))
+
+        # Each frame is a single write with the changed cells only.
+        engine.snake.change_direction('UP')
+        engine.step()
+        output.seek(0)
+        output.truncate()
+        renderer.render(engine)
+        # The new head, then the old tail, the body part next to it and the old head in a single run.
+        self.assertEqual(output.getvalue(), b'\x1b[10;11HO\x1b[11;9H oo')
+        self.assertEqual(screen.updates, 2)
+
+    def test_ansi_diff(self):
+        screen = AnsiScreen(io.BytesIO(), 3, 40, origin=(2, 5))
+        screen.flush()
+        # Close changes are sent as a single run, distant ones after a new cursor move.
+        screen.addstr(1, 2, 'ab')
+        screen.addch(1, 6, 'c')
+        screen.addch(1, 30, 'd')
+        self.assertEqual(screen.diff(), b'\x1b[4;8Hab  c\x1b[4;36Hd')
+        # Redrawing the same content sends nothing.
+        screen.addstr(1, 2, 'ab')
+        self.assertEqual(screen.diff(), b'')
+        screen.invalidate()
+        self.assertTrue(screen.diff().startswith(AnsiScreen.CLEAR))
+
     def test_food_collision(self):
         # Collision.
         game = curses.wrapper(Game, board_height=20, board_width=20)
@@ -127,5 +435,1275 @@ class TestGame(unittest.TestCase):
         self.assertFalse(game.check_food_colision())
 
 
+class TestEngine(unittest.TestCase):
+    """
+    Test the headless Engine class methods.
+    """
+
+    def test_reset(self):
+        engine = Engine(board_height=20, board_width=20)
+        state = engine.reset(seed=1)
+        self.assertEqual(state.snake.get_body(), [Point(10, 10), Point(10, 9), Point(10, 8)])
+        self.assertEqual(state.score, 0)
+        self.assertEqual(state.status, PLAYING)
+        self.assertNotIn(Point(*state.food), state.snake.get_body())
+
+    def test_step_move(self):
+        engine = Engine(board_height=20, board_width=20, seed=1)
+        engine.food.position = Point(1, 1)
+        state, reward, done = engine.step('UP')
+        self.assertEqual(state.snake.get_body(), [Point(9, 10), Point(10, 10), Point(10, 9)])
+        self.assertEqual((reward, done, state.ticks), (0, False, 1))
+
+    def test_step_food(self):
+        engine = Engine(board_height=20, board_width=20, initial_speed=2, speed_increase=0.5, seed=1)
+        engine.food.position = Point(10, 11)
+        state, reward, done = engine.step()
+        self.assertEqual((reward, done, state.score, engine.speed), (1, False, 1, 2.5))
+        self.assertEqual(state.snake.size, 4)
+        self.assertNotIn(Point(*state.food), state.snake.get_body())
+
+    def test_food_off_body(self):
+        # The food never lands under the snake, including the tail grown when eating.
+        engine = Engine(board_height=10, board_width=10)
+        agent = GreedyAgent()
+        for seed in range(300):
+            state = engine.reset(seed)
+            agent.reset(10, 10, seed)
+            done = False
+            while not done:
+                state, _, done = engine.step(agent.act(state))
+                if engine.status == PLAYING:
+                    self.assertFalse(engine.snake.is_occupied(*engine.food.get_position()))
+                    self.assertFalse(engine.free_cells.is_free(*engine.snake.get_tail_position()))
+
+    def test_step_board_collision(self):
+        engine = Engine(board_height=20, board_width=20, seed=1)
+        engine.food.position = Point(1, 1)
+        done = False
+        for _ in range(9):
+            self.assertFalse(done)
+            _, _, done = engine.step('RIGHT')
+        self.assertTrue(done)
+        self.assertEqual(engine.status, LOST)
+
+    def test_step_snake_collision(self):
+        engine = Engine(board_height=20, board_width=20, initial_size=5, seed=1)
+        engine.food.position = Point(1, 1)
+        for action in ['UP', 'LEFT']:
+            _, _, done = engine.step(action)
+            self.assertFalse(done)
+        _, _, done = engine.step('DOWN')
+        self.assertTrue(done)
+
+    def test_win(self):
+        # Hamiltonian cycle of the interior of a 10x10 board.
+        cycle = [Point(1, x) for x in range(1, 9)]
+        for i, y in enumerate(range(2, 9)):
+            cycle += [Point(y, x) for x in (range(8, 1, -1) if i % 2 == 0 else range(2, 9))]
+        cycle += [Point(y, 1) for y in range(8, 1, -1)]
+        # The snake covers all but the last position, where the food is.
+        engine = Engine(board_height=10, board_width=10, seed=1)
+        engine.snake.body = cycle[-2::-1]
+        engine.snake.change_direction('UP')
+        engine.rebuild_free_cells()
+        engine.food.set_position(*cycle[-1])
+        _, reward, done = engine.step()
+        self.assertEqual((reward, done, engine.status), (1, True, WIN))
+
+    def test_free_cells(self):
+        engine = Engine(board_height=10, board_width=10, seed=1)
+        rng = random.Random(0)
+        for _ in range(500):
+            _, _, done = engine.step(rng.choice(['UP', 'RIGHT', 'DOWN', 'LEFT', None, None, None]))
+            if done:
+                engine.reset()
+            free = [(y, x) for y in range(1, 9) for x in range(1, 9) if not engine.snake.is_occupied(y, x)]
+            self.assertEqual(len(engine.free_cells), len(free))
+            self.assertTrue(all(engine.free_cells.is_free(y, x) for y, x in free))
+
+    def test_seed(self):
+        foods = []
+        for _ in range(2):
+            engine = Engine(board_height=20, board_width=20)
+            engine.reset(seed=7)
+            foods.append(engine.food.get_position())
+        self.assertEqual(foods[0], foods[1])
+
+    def test_snapshot(self):
+        engine = Engine(board_height=12, board_width=15, seed=3)
+        agent = GreedyAgent()
+        agent.reset(12, 15)
+        state = engine.get_state()
+        for _ in range(40):
+            state, _, _ = engine.step(agent.act(state))
+        snapshot = engine.snapshot()
+        # A snapshot restores on an engine with other settings, and the resumed game continues identically.
+        resumed = Engine(board_height=20, board_width=20, seed=4)
+        resumed.restore(snapshot)
+        self.assertEqual(resumed.snapshot(), snapshot)
+        self.assertEqual((resumed.board_height, resumed.board_width, resumed.seed), (12, 15, 3))
+        for game in [engine, resumed]:
+            state = game.get_state()
+            for _ in range(200):
+                state, _, done = game.step(agent.act(state))
+                if done:
+                    break
+        self.assertEqual(resumed.snapshot(), engine.snapshot())
+
+    def test_fork(self):
+        engine = Engine(board_height=12, board_width=15, seed=3, hashing=True)
+        agent = GreedyAgent()
+        agent.reset(12, 15)
+        state = engine.get_state()
+        for _ in range(40):
+            state, _, _ = engine.step(agent.act(state))
+        snapshot = engine.snapshot()
+        # Each child plays on like an engine restored from a snapshot of the parent, with its own generator.
+        children = [engine.fork(), engine.fork(), engine.fork(seed=11)]
+        self.assertEqual(len({child.seed for child in children}), 3)
+        for child in children:
+            reference = Engine(hashing=True)
+            reference.restore(snapshot)
+            reference.seed = child.seed
+            reference.rng.setstate(GameRandom(child.seed).getstate())
+            for game in [child, reference]:
+                state = game.get_state()
+                for _ in range(300):
+                    state, _, done = game.step(agent.act(state))
+                    if done:
+                        break
+            self.assertGreater(child.ticks, 100)
+            self.assertEqual(child.snapshot(), reference.snapshot())
+            self.assertEqual(child.state_hash(), reference.state_hash())
+        self.assertEqual(engine.snapshot(), snapshot)
+
+        # Children do not see the later moves of the parent, nor the moves of each other.
+        first, second = engine.fork(seed=5), engine.fork(seed=5)
+        grandchild = first.fork(seed=6)
+        expected = first.snapshot()
+        for game in [engine, first]:
+            state = game.get_state()
+            for _ in range(20):
+                state, _, _ = game.step(agent.act(state))
+        self.assertEqual(second.snapshot(), expected)
+        self.assertEqual(grandchild.snapshot()[SNAPSHOT_HEADER.size:], expected[SNAPSHOT_HEADER.size:])
+
+
+class TestGameRandom(unittest.TestCase):
+    """
+    Test the GameRandom class methods.
+    """
+
+    def test_seed(self):
+        values = [[GameRandom(seed).randrange(1000) for _ in range(10)] for seed in [1, 1, 2]]
+        self.assertEqual(values[0], values[1])
+        self.assertNotEqual(values[0], values[2])
+
+    def test_state(self):
+        rng = GameRandom(5)
+        rng.random()
+        state = rng.getstate()
+        first = [rng.randint(1, 6) for _ in range(20)]
+        rng.setstate(state)
+        self.assertEqual([rng.randint(1, 6) for _ in range(20)], first)
+        self.assertTrue(all(1 <= value <= 6 for value in first))
+
+    def test_derive_seed(self):
+        seeds = [derive_seed(0, i) for i in range(1000)]
+        self.assertEqual(len(set(seeds)), 1000)
+        self.assertEqual(derive_seed(0, 3), seeds[3])
+        self.assertTrue(all(0 <= seed < 2 ** 63 for seed in seeds))
+
+
+@unittest.skipIf(np is None, "numpy is not installed")
+class TestVectorEngine(unittest.TestCase):
+    """
+    Test the VectorEngine class methods.
+    """
+
+    def test_reset(self):
+        engine = VectorEngine(4, board_height=20, board_width=20, seed=0)
+        for game in range(4):
+            self.assertEqual(engine.get_body(game), [Point(10, 10), Point(10, 9), Point(10, 8)])
+            self.assertEqual(engine.grid[game].sum(), 3)
+            self.assertEqual(engine.grid[game, engine.food[game]], 0)
+
+    def test_same_rules_as_engine(self):
+        # Play random actions on both engines, sharing the food positions.
+        num_games = 16
+        vector = VectorEngine(num_games, board_height=10, board_width=10, seed=0)
+        engines = [Engine(board_height=10, board_width=10, seed=0) for _ in range(num_games)]
+        rng = np.random.default_rng(0)
+        scores = 0
+        for _ in range(500):
+            for game, engine in enumerate(engines):
+                engine.food.position = Point(*divmod(int(vector.food[game]), 10))
+            actions = np.where(rng.random(num_games) < 0.3, rng.integers(0, 4, num_games), -1)
+            _, rewards, dones = vector.step(actions)
+            for game, engine in enumerate(engines):
+                _, reward, done = engine.step(DIRECTIONS[actions[game]] if actions[game] >= 0 else None)
+                self.assertEqual((reward, done), (rewards[game], dones[game]))
+                scores += reward
+                if done:
+                    self.assertEqual(engine.score, vector.final_score[game])
+                    self.assertEqual(engine.snake.size, vector.final_size[game])
+                    engine.reset()
+                else:
+                    self.assertEqual(engine.snake.get_body(), vector.get_body(game))
+        self.assertGreater(scores, 0)
+
+    def test_food_off_body(self):
+        # Steer every snake towards its food, the food never lands under a snake, including its grown tail.
+        num_games = 64
+        engine = VectorEngine(num_games, board_height=10, board_width=10, seed=0)
+        games = np.arange(num_games)
+        eaten = 0
+        for _ in range(2000):
+            (h_y, h_x), (f_y, f_x) = np.divmod(engine.head_cell, 10), np.divmod(engine.food, 10)
+            actions = np.where(f_x > h_x, 0, np.where(f_x < h_x, 1, np.where(f_y < h_y, 2, 3)))
+            _, rewards, _ = engine.step(actions)
+            eaten += rewards.sum()
+            self.assertFalse(engine.grid[games, engine.food].any())
+        self.assertGreater(eaten, 1000)
+
+    def test_auto_reset(self):
+        engine = VectorEngine(2, board_height=20, board_width=20, seed=0)
+        engine.food[:] = 1
+        for _ in range(9):
+            _, _, dones = engine.step([-1, 2])
+        self.assertTrue(dones[0])
+        self.assertFalse(dones[1])
+        self.assertEqual(engine.final_ticks[0], 9)
+        self.assertEqual(engine.get_body(0), [Point(10, 10), Point(10, 9), Point(10, 8)])
+
+
+@unittest.skipIf(np is None, "numpy is not installed")
+class TestObservation(unittest.TestCase):
+    """
+    Test the observation planes and frame stacks.
+    """
+
+    def play(self, engine, ticks, *updates):
+        agent = GreedyAgent()
+        agent.reset(engine.board_height, engine.board_width, 0)
+        state = engine.get_state()
+        for _ in range(ticks):
+            state, _, done = engine.step(agent.act(state))
+            for update in updates:
+                update()
+            if done:
+                break
+
+    def test_update(self):
+        engine = Engine(board_height=10, board_width=12, seed=3)
+        observation = Observation(engine, extra=['direction', 'entered'])
+        planes = observation.planes
+        self.assertEqual(planes.shape, (6, 10, 12))
+        self.assertFalse(planes.flags.writeable)
+        self.assertEqual(planes[HEAD, 5, 6], 1)
+        self.assertEqual(planes[WALLS].sum(), 2 * 10 + 2 * 12 - 4)
+
+        def check():
+            self.assertIs(observation.update(), planes)
+            self.assertLessEqual(len(observation.changes), 14)
+            expected = Observation(engine).planes
+            self.assertTrue(np.array_equal(planes[:4], expected))
+            h_y, h_x = engine.snake.get_head_position()
+            self.assertEqual(planes[4, h_y, h_x], engine.snake.direction + 1)
+            self.assertEqual(planes[5, h_y, h_x], engine.ticks)
+
+        self.play(engine, 200, check)
+        self.assertGreater(engine.score, 0)
+
+        # A reset game is rebuilt.
+        generation = observation.generation
+        engine.reset(4)
+        observation.update()
+        self.assertEqual(observation.generation, generation + 1)
+        self.assertEqual(planes[BODY].sum(), 3)
+
+    def test_grow(self):
+        # Every channel of the incremental observation matches a rebuild, also on the ticks the snake grows.
+        engine = Engine(board_height=10, board_width=12, seed=5)
+        observation = Observation(engine, extra=['direction', 'entered'])
+        rebuilt = Observation(engine, extra=['direction', 'entered'])
+        sizes = set()
+
+        def check():
+            planes = observation.update()
+            if engine.status == PLAYING:
+                sizes.add(engine.snake.size)
+                self.assertTrue(np.array_equal(planes, rebuilt.rebuild()))
+
+        self.play(engine, 300, check)
+        self.assertGreater(len(sizes), 3)
+
+    def test_egocentric(self):
+        engine = Engine(board_height=10, board_width=10, seed=1)
+        observation = Observation(engine, padding=3)
+        window = observation.egocentric(3)
+        self.assertEqual(window.shape, (4, 7, 7))
+        self.assertEqual(window[HEAD, 3, 3], 1)
+        self.assertEqual(window[BODY, 3, :3].tolist(), [0, 1, 1])
+        engine.snake.change_direction('UP')
+        for _ in range(5):
+            engine.step()
+        observation.update()
+        window = observation.egocentric(3)
+        # The head is next to the top wall, the padding above it is walls too.
+        self.assertEqual(window[WALLS, :3, 3].tolist(), [1, 1, 1])
+        with self.assertRaises(ValueError):
+            observation.egocentric(4)
+
+    def test_frame_stack(self):
+        engine = Engine(board_height=10, board_width=10, seed=2)
+        observation = Observation(engine, padding=2)
+        stack = FrameStack(observation, 3)
+        windows = FrameStack(observation, 3, radius=2)
+        history = [observation.planes.copy()] * 3
+        window_history = [observation.egocentric(2).copy()] * 3
+
+        def check():
+            frames = stack.update()
+            windows.update()
+            history.append(observation.planes.copy())
+            window_history.append(observation.egocentric(2).copy())
+            self.assertTrue(np.array_equal(frames, np.stack(history[-3:])))
+            self.assertTrue(np.array_equal(windows.frames(), np.stack(window_history[-3:])))
+
+        self.play(engine, 100, check)
+        self.assertFalse(stack.frames().flags.writeable)
+
+
+class TestTournament(unittest.TestCase):
+    """
+    Test the agents and the tournament runner.
+    """
+
+    def test_load_agent(self):
+        self.assertIsInstance(load_agent('greedy'), GreedyAgent)
+        self.assertIsInstance(load_agent('snake.agents:GreedyAgent'), GreedyAgent)
+        with self.assertRaises(ValueError):
+            load_agent('unknown')
+
+    def test_play_games(self):
+        results = play_games('greedy', [1, 2], board_height=10, board_width=10)
+        self.assertEqual(results, play_games('greedy', [1, 2], board_height=10, board_width=10))
+        self.assertEqual([r.seed for r in results], [1, 2])
+        for result in results:
+            self.assertEqual(result.length, result.score + 3)
+
+    def test_run_tournament(self):
+        results = list(run_tournament(['greedy', 'random'], 5, workers=2, batch_size=2, board_height=10,
+                                      board_width=10, max_ticks=200))
+        self.assertEqual(len(results), 10)
+        self.assertEqual(sorted(r.seed for r in results if r.agent == 'greedy'), list(range(5)))
+        summary = summarize(results)
+        self.assertEqual(summary['random']['games'], 5)
+        self.assertLessEqual(summary['greedy']['score']['p50'], summary['greedy']['score']['max'])
+        self.assertTrue(all(r.ticks <= 200 for r in results))
+
+    def test_agent_name(self):
+        self.assertEqual(agent_name(load_agent('greedy')), 'greedy')
+        self.assertEqual(agent_name(Engine()), 'snake.engine:Engine')
+
+
+class TestScoreStore(unittest.TestCase):
+    """
+    Test the ScoreStore class methods.
+    """
+
+    def test_store(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'scores.db')
+            results = [GameResult(seed, 'greedy' if seed % 3 else 'random', seed % 50, seed % 50 + 3, seed, 'LOST')
+                       for seed in range(1000)]
+            with ScoreStore(path, batch_size=64) as store:
+                for result in results[:600]:
+                    store.add(result)
+                store.flush()
+                self.assertEqual(store.count(), 600)
+                for result in results[600:]:
+                    store.add(result)
+
+            # The results are kept across stores.
+            with ScoreStore(path) as store:
+                self.assertEqual(store.count(), 1000)
+                self.assertEqual(store.agents(), ['greedy', 'random'])
+                self.assertEqual(store.top(3), [results[49], results[99], results[149]])
+                self.assertEqual([r.score for r in store.top(3, 'random')], [49, 49, 49])
+                self.assertEqual(store.history(2, 'greedy'), [results[998], results[997]])
+                scores = sorted(r.score for r in results if r.agent == 'greedy')
+                self.assertEqual(store.percentiles('greedy', [0, 50, 99, 100]),
+                                 {q: percentile(scores, q) for q in [0, 50, 99, 100]})
+                self.assertEqual(store.percentiles('unknown'), {})
+
+
+class TestArena(unittest.TestCase):
+    """
+    Test the Arena class methods.
+    """
+
+    def place(self, arena, bodies, food=()):
+        # Replace the snakes and the food of an arena, and rebuild its grid.
+        arena.grid = array('i', [CELL_EMPTY]) * len(arena.grid)
+        for y in range(arena.board_height):
+            for x in range(arena.board_width):
+                if not (0 < y < arena.board_height - 1 and 0 < x < arena.board_width - 1):
+                    arena.grid[y * arena.board_width + x] = CELL_WALL
+        arena.free_cells = FreeCells(arena.board_height, arena.board_width)
+        arena.food = set()
+        for i, (snake, body) in enumerate(zip(arena.snakes, bodies)):
+            snake.body = body
+            for y, x in body:
+                arena.grid[y * arena.board_width + x] = i + 1
+                arena.free_cells.remove(y, x)
+        for y, x in food:
+            arena.grid[y * arena.board_width + x] = CELL_FOOD
+            arena.food.add(y * arena.board_width + x)
+            arena.free_cells.remove(y, x)
+
+    def check_grid(self, arena):
+        # The incremental grid matches the snakes and food.
+        owners = {}
+        for i in arena.alive:
+            for y, x in arena.snakes[i].get_body():
+                owners[(y, x)] = i
+        for y in range(arena.board_height):
+            for x in range(arena.board_width):
+                self.assertEqual(arena.owner(y, x), owners.get((y, x)))
+        self.assertEqual(len(arena.food), arena.num_food)
+        self.assertTrue(all(arena.grid[cell] == CELL_FOOD for cell in arena.food))
+        self.assertEqual(len(arena.free_cells), arena.grid.count(CELL_EMPTY))
+
+    def test_random_games(self):
+        rng = random.Random(0)
+        for seed in range(5):
+            arena = Arena(20, 30, num_snakes=8, num_food=5, seed=seed)
+            self.check_grid(arena)
+            while not arena.is_done() and arena.ticks < 300:
+                arena.step([rng.choice(['UP', 'DOWN', 'LEFT', 'RIGHT', None, None]) for _ in range(8)])
+                self.check_grid(arena)
+
+    def test_collisions(self):
+        arena = Arena(12, 12, num_snakes=3, num_food=1, seed=0)
+        # Snake 0 eats, snake 1 follows the tail of snake 2, snake 2 runs into the body of snake 0.
+        self.place(arena, [[Point(2, 4), Point(2, 3), Point(2, 2)],
+                           [Point(6, 4), Point(6, 3), Point(6, 2)],
+                           [Point(3, 3), Point(4, 3), Point(5, 3)]], food=[Point(2, 5)])
+        arena.snakes[0].direction = 0
+        rewards, died, done = arena.step([None, 'UP', 'UP'])
+        self.assertEqual(rewards, [1, 0, 0])
+        self.assertEqual(died, [2])
+        self.assertFalse(done)
+        self.assertEqual(arena.snakes[0].get_body(), [Point(2, 5), Point(2, 4), Point(2, 3), Point(2, 2)])
+        self.assertEqual(arena.owner(5, 4), 1)
+        self.assertIsNone(arena.owner(4, 3))
+        self.assertEqual(arena.alive, [0, 1])
+        self.check_grid(arena)
+
+        # Head to head, the longest snake survives.
+        self.place(arena, [[Point(5, 3), Point(5, 2), Point(4, 2), Point(3, 2)],
+                           [Point(5, 5), Point(5, 6), Point(5, 7)]], food=[Point(9, 9)])
+        _, died, _ = arena.step(['RIGHT', 'LEFT'])
+        self.assertEqual(died, [1])
+        self.assertEqual(arena.owner(5, 4), 0)
+        self.check_grid(arena)
+
+    def test_long_snake_collision(self):
+        arena = Arena(12, 12, num_snakes=1, num_food=1, seed=0)
+        # A long snake keeps no bitmap of its own, the grid resolves the collision with its body.
+        body = [Point(y, x) for y in range(1, 11) for x in (range(1, 11) if y % 2 else range(10, 0, -1))][:40][::-1]
+        self.place(arena, [body], food=[Point(10, 10)])
+        self.assertIsNone(arena.snakes[0].occupancy)
+        arena.snakes[0].direction = 2
+        _, died, done = arena.step()
+        self.assertEqual(died, [0])
+        self.assertTrue(done)
+
+
+class TestZobrist(unittest.TestCase):
+    """
+    Test the incremental state hash and the transposition table.
+    """
+
+    def test_incremental_hash(self):
+        # The hash kept by the snake matches the hash of its body through moves, growth and turns.
+        for seed in range(3):
+            engine = Engine(board_height=12, board_width=14, seed=seed, hashing=True)
+            agent = GreedyAgent()
+            agent.reset(12, 14, seed)
+            state = engine.get_state()
+            while not engine.is_done():
+                state, _, _ = engine.step(agent.act(state))
+                self.assertEqual(engine.snake.hash, body_hash(engine.snake.get_cells(), 14))
+            self.assertGreater(engine.score, 0)
+            # Engines without hashing compute the same state hash from scratch.
+            plain = Engine(board_height=12, board_width=14)
+            plain.restore(engine.snapshot())
+            self.assertIsNone(plain.snake.hash)
+            self.assertEqual(plain.state_hash(), engine.state_hash())
+
+    def test_state_hash(self):
+        engine = Engine(board_height=20, board_width=20, seed=1, hashing=True)
+        other = Engine(board_height=20, board_width=20, seed=2, hashing=True)
+        other.food.set_position(*engine.food.get_position())
+        self.assertEqual(engine.state_hash(), other.state_hash())
+        # The direction, the food, the score and the order of the body parts are part of the hash.
+        value = engine.state_hash()
+        engine.snake.change_direction('UP')
+        self.assertNotEqual(engine.state_hash(), value)
+        engine.snake.change_direction('RIGHT')
+        engine.food.set_position(1, 1)
+        self.assertNotEqual(engine.state_hash(), value)
+        other.food.set_position(1, 1)
+        other.score = 1
+        self.assertNotEqual(other.state_hash(), engine.state_hash())
+        engine.snake.body = [Point(5, 5), Point(5, 6), Point(6, 6), Point(6, 5)]
+        other.snake.body = [Point(5, 5), Point(6, 5), Point(6, 6), Point(5, 6)]
+        other.score = 0
+        self.assertNotEqual(engine.state_hash(), other.state_hash())
+
+        # Reaching the same state through different moves gives the same hash.
+        engine.snake.body = [Point(5, 4), Point(5, 3), Point(6, 3)]
+        other.snake.body = [Point(5, 3), Point(6, 3), Point(6, 2)]
+        engine.snake.move()
+        other.snake.move()
+        other.snake.move()
+        self.assertEqual(engine.snake.get_body(), other.snake.get_body())
+        self.assertEqual(engine.state_hash(), other.state_hash())
+
+    def test_transposition_table(self):
+        table = TranspositionTable(capacity=3, probe=2)
+        table.put(1, 'a', depth=5)
+        table.put(2, 'b', depth=1)
+        table.put(3, 'c', depth=1)
+        self.assertEqual(table.get(1), 'a')
+        self.assertIsNone(table.get(2, depth=2))
+        # A shallower value does not replace a deeper one.
+        self.assertFalse(table.put(1, 'x', depth=4))
+        self.assertEqual(table.get(1), 'a')
+        # The shallowest of the two least recently used entries, 2 and 3, is evicted.
+        table.get(2)
+        table.put(4, 'd', depth=0)
+        self.assertEqual(len(table), 3)
+        self.assertNotIn(3, table)
+        self.assertIn(2, table)
+        self.assertEqual(table.evictions, 1)
+        self.assertEqual((table.hits, table.misses), (3, 1))
+
+
+class TestAutopilot(unittest.TestCase):
+    """
+    Test the autopilot agent and its Hamiltonian cycle and distance field.
+    """
+
+    def test_hamiltonian_cycle(self):
+        for rows in range(2, 10):
+            for cols in range(2, 10):
+                cycle = hamiltonian_cycle(rows, cols)
+                self.assertEqual(len(set(cycle)), len(cycle))
+                self.assertEqual(len(cycle), rows * cols - (rows % 2) * (cols % 2))
+                for (y0, x0), (y1, x1) in zip(cycle, cycle[1:] + cycle[:1]):
+                    self.assertEqual(abs(y0 - y1) + abs(x0 - x1), 1)
+
+    def test_distance_field(self):
+        field = DistanceField(10, 10)
+        # Wall of body cells along column 5, open at row 8: the way around is 11 cells down to it and 8 back up.
+        blocked = {y * 10 + 5 for y in range(1, 8)}
+        field.reset(1 * 10 + 1)
+        field.expand(lambda cell: cell in blocked, 10)
+        self.assertIsNone(field.get(1 * 10 + 8))
+        while field.expand(lambda cell: cell in blocked, 10):
+            pass
+        self.assertEqual(field.get(1 * 10 + 1), 0)
+        self.assertEqual(field.get(1 * 10 + 6), 11 + 8)
+        self.assertIsNone(field.get(1 * 10 + 5))
+
+    def test_play(self):
+        self.assertIsInstance(load_agent('autopilot'), AutopilotAgent)
+        for result in play_games('autopilot', range(4), board_height=10, board_width=10, max_ticks=5000):
+            self.assertEqual(result.status, WIN)
+
+    def test_many_games(self):
+        # The snake keeps the cycle order and eats only where the new tail part leaves it a move, on every seed.
+        agent = AutopilotAgent()
+        engine = Engine(board_height=12, board_width=12)
+        for seed in range(40):
+            state, done = engine.reset(seed), False
+            agent.reset(12, 12, seed)
+            while not done:
+                action = agent.act(state)
+                self.assertIsNotNone(action)
+                state, _, done = engine.step(action)
+            self.assertEqual(engine.status, WIN)
+
+
+class TestReplay(unittest.TestCase):
+    """
+    Test the replay recorder and reader.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'game.snkr')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def record_game(self, seed=3, keyframe_interval=16):
+        engine = Engine(board_height=10, board_width=12, seed=seed)
+        agent = GreedyAgent()
+        agent.reset(engine.board_height, engine.board_width)
+        recorder = Recorder(self.path, engine, keyframe_interval=keyframe_interval)
+        state, done = engine.get_state(), False
+        snapshots = [engine.snapshot()]
+        directions = []
+        while not done:
+            state, _, done = engine.step(agent.act(state))
+            directions.append(engine.snake.head_direction)
+            snapshots.append(engine.snapshot())
+        recorder.close()
+        return engine, directions, snapshots
+
+    def test_round_trip(self):
+        engine, directions, _ = self.record_game()
+        with ReplayReader(self.path) as reader:
+            self.assertEqual((reader.board_height, reader.board_width, reader.seed), (10, 12, 3))
+            self.assertEqual(reader.ticks, engine.ticks)
+            self.assertEqual(reader.actions(), directions)
+            self.assertEqual(reader.actions(5, 23), directions[5:23])
+            replayed = reader.seek(reader.ticks)
+        self.assertEqual(replayed.score, engine.score)
+        self.assertEqual(replayed.snake.get_body(), engine.snake.get_body())
+        self.assertGreater(engine.score, 0)
+
+    def test_seek(self):
+        engine, _, snapshots = self.record_game(keyframe_interval=4)
+
+        def state(engine):
+            # The free positions index rebuilt by a seek has the same positions in another order.
+            cells, _ = engine.free_cells.getstate()
+            return engine.snapshot()[:SNAPSHOT_HEADER.size], engine.snake.get_cells().tolist(), sorted(cells)
+
+        with ReplayReader(self.path) as reader:
+            for tick in range(engine.ticks + 1):
+                expected = Engine()
+                expected.restore(snapshots[tick])
+                self.assertEqual(state(reader.seek(tick)), state(expected))
+            # Keyframes hold the snake, not the free positions.
+            size = SNAPSHOT_HEADER.unpack_from(snapshots[4])[14]
+            self.assertEqual(len(reader.keyframe(1)), KEYFRAME.size + 2 * size)
+
+    def test_verify(self):
+        self.record_game()
+        self.assertTrue(verify(self.path))
+        self.assertTrue(verify(self.path, full=False))
+
+        # Flip the direction of the first tick, right after the header and the empty first keyframe.
+        with open(self.path, 'r+b') as f:
+            f.seek(HEADER.size + LENGTH.size)
+            byte = f.read(1)[0]
+            f.seek(HEADER.size + LENGTH.size)
+            f.write(bytes([byte ^ 1]))
+        self.assertFalse(verify(self.path))
+
+
+def lzw_decode(data, min_code_size):
+    """
+    Decompress the LZW code stream of a GIF image.
+    """
+    clear = 1 << min_code_size
+    value = int.from_bytes(data, 'little')
+    position = 0
+    code_size = min_code_size + 1
+    table = []
+    previous = None
+    pixels = bytearray()
+    while True:
+        code = (value >> position) & ((1 << code_size) - 1)
+        position += code_size
+        if code == clear:
+            table = [bytes((i,)) for i in range(clear)] + [b'', b'']
+            code_size = min_code_size + 1
+            previous = None
+            continue
+        if code == clear + 1:
+            return bytes(pixels)
+        if previous is None:
+            entry = table[code]
+        elif code < len(table):
+            entry = table[code]
+            table.append(previous + entry[:1])
+        else:
+            entry = previous + previous[:1]
+            table.append(entry)
+        pixels += entry
+        previous = entry
+        if len(table) >= 1 << code_size and code_size < 12:
+            code_size += 1
+
+
+def read_gif(path):
+    """
+    Decode an animated GIF file with a global palette.
+
+    :return: width, height and list of the delay, left, top, width, height and pixels of each frame
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    assert data[:6] == b'GIF89a' and data[-1:] == b'\x3b'
+    width, height, flags = struct.unpack_from('<HHB', data, 6)
+    i = 13 + 3 * (2 << (flags & 7))
+    frames = []
+    delay = None
+    while data[i] != 0x3b:
+        if data[i] == 0x21:
+            if data[i + 1] == 0xf9:
+                delay, = struct.unpack_from('<H', data, i + 4)
+            i += 2
+            while data[i]:
+                i += data[i] + 1
+            i += 1
+        else:
+            left, top, w, h = struct.unpack_from('<HHHH', data, i + 1)
+            min_code_size = data[i + 10]
+            i += 11
+            code = bytearray()
+            while data[i]:
+                code += data[i + 1:i + 1 + data[i]]
+                i += data[i] + 1
+            i += 1
+            frames.append((delay, left, top, w, h, lzw_decode(code, min_code_size)))
+    return width, height, frames
+
+
+class TestExport(unittest.TestCase):
+    """
+    Test the replay exporter.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.replay = os.path.join(self.directory.name, 'game.snkr')
+        self.cast = os.path.join(self.directory.name, 'game.cast')
+        self.gif = os.path.join(self.directory.name, 'game.gif')
+        engine = Engine(board_height=10, board_width=12, seed=3)
+        agent = GreedyAgent()
+        agent.reset(engine.board_height, engine.board_width)
+        recorder = Recorder(self.replay, engine, keyframe_interval=16)
+        state, done = engine.get_state(), False
+        self.duration = END_HOLD
+        while not done:
+            self.duration += 1 / engine.speed
+            state, _, done = engine.step(agent.act(state))
+        recorder.close()
+        self.engine = engine
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_lzw(self):
+        rng = random.Random(0)
+        for pixels in [bytes([5]), bytes(10000), bytes(rng.randrange(8) for _ in range(20000)),
+                       bytes(rng.randrange(2) for _ in range(5000))]:
+            self.assertEqual(lzw_decode(lzw_encode(pixels, 3), 3), pixels)
+
+    def test_export(self):
+        height, width, scale = 10, 12, 3
+        writers = [AsciicastWriter(self.cast, height, width), GifWriter(self.gif, height, width, scale=scale)]
+        frames = export(self.replay, writers)
+        for writer in writers:
+            writer.close()
+        self.assertEqual(frames, self.engine.ticks + 1)
+
+        # The asciicast has a header, a line per frame and the end of the last frame.
+        with open(self.cast) as f:
+            lines = [json.loads(line) for line in f]
+        self.assertEqual((lines[0]['version'], lines[0]['width'], lines[0]['height']), (2, width, height))
+        events = lines[1:]
+        self.assertEqual(len(events), frames + 1)
+        times = [event[0] for event in events]
+        self.assertEqual(times, sorted(times))
+        self.assertAlmostEqual(times[-1], self.duration, places=4)
+
+        # Drawing the GIF frames over each other gives the last frame of the game.
+        gif_width, gif_height, gif_frames = read_gif(self.gif)
+        self.assertEqual((gif_width, gif_height), (width * scale, height * scale))
+        self.assertEqual(len(gif_frames), frames)
+        self.assertEqual(gif_frames[0][1:5], (0, 0, gif_width, gif_height))
+        areas = [w * h for _, _, _, w, h, _ in gif_frames[1:]]
+        self.assertLess(sum(areas) / len(areas), gif_width * gif_height / 4)
+        self.assertEqual(sum(frame[0] for frame in gif_frames), round(self.duration * 100))
+        canvas = bytearray(gif_width * gif_height)
+        for i, (_, left, top, w, h, pixels) in enumerate(gif_frames):
+            self.assertEqual(len(pixels), w * h)
+            for y in range(h):
+                for x in range(w):
+                    if i == 0 or pixels[y * w + x]:
+                        canvas[(top + y) * gif_width + left + x] = pixels[y * w + x]
+        screen = AnsiScreen(io.BytesIO(), height, width)
+        CursesRenderer(screen, height, width, doupdate=screen.flush).render(self.engine)
+        # The snake ran into itself, the incremental frames draw its head over the body.
+        screen.addch(*self.engine.snake.get_head_position(), self.engine.snake.head_symbol)
+        expected = b''.join(bytes(c for c in row.translate(COLORS) for _ in range(scale)) * scale
+                            for row in screen.back)
+        self.assertEqual(bytes(canvas), expected)
+
+
+class TestMaps(unittest.TestCase):
+    """
+    Test the map files.
+    """
+
+    MAP = '\n'.join(['####.#####',
+                     '#........#',
+                     '#..S.....#',
+                     '..........',
+                     '#...#....a',
+                     '#a.......#',
+                     '####.#####'])
+
+    def setUp(self):
+        self.map = parse_map(self.MAP)
+        self.open_cells = sum(symbol in ' .S' for symbol in self.MAP)
+
+    def test_parse(self):
+        game_map = self.map
+        self.assertEqual((game_map.height, game_map.width, game_map.start), (7, 10, (2, 3)))
+        self.assertEqual(game_map.row(4), '#   #    a')
+        self.assertEqual(game_map.portals, {49: 'a', 51: 'a'})
+        self.assertTrue(game_map.is_wall(0))
+        self.assertTrue(game_map.is_wall(44))
+        self.assertFalse(game_map.is_wall(4))
+        self.assertFalse(game_map.is_wall(30))
+        for text in ['###\n#.\n###', '###\n#@#\n###', '###\n#a#\n###', '###\n###']:
+            with self.assertRaises(ValueError):
+                parse_map(text)
+
+    def test_move(self):
+        game_map = self.map
+        # Directions: RIGHT, LEFT, UP, DOWN.
+        self.assertEqual(game_map.move(23, 0), 24)
+        self.assertEqual(game_map.move(39, 0), 30)
+        self.assertEqual(game_map.move(30, 1), 39)
+        self.assertEqual(game_map.move(4, 2), 64)
+        self.assertEqual(game_map.move(64, 3), 4)
+        # Portals lead to the next cell after the other portal, a wall here after a move down.
+        self.assertEqual(game_map.move(48, 0), 52)
+        self.assertEqual(game_map.move(52, 1), 48)
+        self.assertEqual(game_map.move(41, 3), 59)
+        self.assertTrue(game_map.is_wall(59))
+
+    def test_free_cells(self):
+        free_cells = self.map.free_cells()
+        self.assertEqual(len(free_cells), self.open_cells)
+        for y in range(7):
+            for x in range(10):
+                self.assertEqual(free_cells.is_free(y, x), not self.map.is_wall(y * 10 + x))
+        # Each index is a copy.
+        free_cells.remove(3, 0)
+        self.assertEqual(len(self.map.free_cells()), self.open_cells)
+
+    def test_load(self):
+        with tempfile.TemporaryDirectory() as directory:
+            text, binary = os.path.join(directory, 'map.txt'), os.path.join(directory, 'map.snkm')
+            with open(text, 'w') as f:
+                f.write(self.MAP)
+            load_map(text).save(binary)
+            for game_map in [self.map, load_map(text)]:
+                with load_map(binary) as loaded:
+                    self.assertEqual((loaded.height, loaded.width, loaded.start), (7, 10, (2, 3)))
+                    self.assertEqual(bytes(loaded.walls), bytes(game_map.walls))
+                    self.assertEqual(bytes(loaded.exits), bytes(game_map.exits))
+                    self.assertEqual(loaded.links, game_map.links)
+                    self.assertEqual(loaded.portals, game_map.portals)
+                    # The free cells index is a view of the file, copied by each new game.
+                    self.assertIsInstance(loaded.free_state[0], memoryview)
+                    self.assertEqual([list(values) for values in loaded.free_state],
+                                     [list(values) for values in game_map.free_state])
+                    self.assertEqual([loaded.move(cell, d) for cell in range(70) for d in range(4)],
+                                     [game_map.move(cell, d) for cell in range(70) for d in range(4)])
+                    self.assertEqual(len(Engine(game_map=loaded).free_cells), self.open_cells - 3)
+
+    @unittest.skipIf(np is None, "numpy is not installed")
+    def test_observation(self):
+        # The walls plane has the walls, obstacles and portals of the map, and the open edges.
+        engine = Engine(seed=1, game_map=self.map)
+        planes = Observation(engine, padding=1).rebuild()
+        expected = [[float(symbol not in ' .S') for symbol in row] for row in self.MAP.split('\n')]
+        self.assertEqual(planes[WALLS].tolist(), expected)
+
+    def test_engine(self):
+        engine = Engine(board_height=30, board_width=30, seed=1, game_map=self.map)
+        self.assertEqual((engine.board_height, engine.board_width), (7, 10))
+        self.assertEqual(list(engine.snake.get_cells()), [23, 22, 21])
+        # The snake wraps around the open edge.
+        for action in ['DOWN'] + ['RIGHT'] * 7:
+            _, _, done = engine.step(action)
+            self.assertFalse(done)
+        self.assertEqual(engine.snake.get_head_position(), (3, 0))
+        # And dies on the obstacle.
+        engine.reset(1)
+        for action, expected in [('DOWN', False), ('DOWN', False), ('RIGHT', True)]:
+            _, _, done = engine.step(action)
+            self.assertEqual(done, expected)
+        self.assertEqual(engine.status, LOST)
+
+        # The food is only placed on open cells.
+        for seed in range(50):
+            engine.reset(seed)
+            y, x = engine.food.get_position()
+            self.assertFalse(self.map.is_wall(y * 10 + x))
+            self.assertFalse(engine.snake.is_occupied(y, x))
+        with self.assertRaises(ValueError):
+            Engine(initial_size=5, game_map=self.map)
+
+    def test_hash(self):
+        engine = Engine(seed=2, hashing=True, game_map=self.map)
+        actions = ['DOWN'] + ['RIGHT'] * 5 + ['DOWN', 'RIGHT', 'UP', 'UP', 'LEFT', 'LEFT', 'LEFT']
+        for i, action in enumerate(actions):
+            if i % 4 == 0:
+                engine.snake.increase_body()
+                engine.free_cells.remove(*engine.snake.get_tail_position())
+            _, _, done = engine.step(action)
+            self.assertFalse(done)
+            snake = engine.snake
+            self.assertEqual(snake.hash, body_hash(snake.get_cells(), 10))
+            self.assertEqual(len(engine.free_cells), self.open_cells - len(set(snake.get_cells())))
+        # The snake went through the portal and around the edge.
+        self.assertEqual(engine.snake.get_head_position(), (3, 9))
+
+        # A fork plays on the same map.
+        child = engine.fork(seed=1)
+        child.step('DOWN')
+        self.assertEqual(child.snake.get_head_position(), (6, 1))
+        self.assertEqual(child.status, LOST)
+        self.assertEqual(engine.snake.get_head_position(), (3, 9))
+
+    def test_render(self):
+        engine = Engine(seed=3, game_map=self.map)
+        screen = AnsiScreen(io.BytesIO(), 7, 10)
+        renderer = CursesRenderer(screen, 7, 10, doupdate=screen.flush)
+        for action in [None, 'DOWN'] + ['RIGHT'] * 6:
+            engine.step(action)
+            renderer.render(engine)
+            # Row 0 has the score.
+            for y in range(1, 7):
+                self.assertEqual(bytes(screen.back[y]).decode(), row_symbols(engine, y, 0, 10))
+        self.assertEqual(bytes(screen.back[6]).decode(), '#### #####')
+
+
+class BlockingOutput(io.BytesIO):
+    """
+    Binary output whose writes wait until it is released.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.released = threading.Event()
+        self.writes = 0
+
+    def write(self, data):
+        self.released.wait()
+        self.writes += 1
+        return super().write(data)
+
+
+class TestEventStream(unittest.TestCase):
+    """
+    Test the EventStream class methods.
+    """
+
+    def play(self, stream, seed=3):
+        # Play a greedy game observed by a stream, and return the events written.
+        engine = Engine(board_height=10, board_width=12, seed=seed)
+        agent = GreedyAgent()
+        agent.reset(engine.board_height, engine.board_width)
+        state, done = engine.get_state(), False
+        stream.observe(engine)
+        turns = 0
+        while not done:
+            direction = engine.snake.direction
+            state, _, done = engine.step(agent.act(state))
+            turns += engine.snake.direction != direction
+            stream.observe(engine)
+        stream.observe(engine)
+        stream.close()
+        return engine, turns, [json.loads(line) for line in stream.target.getvalue().decode().splitlines()]
+
+    def test_events(self):
+        engine, turns, events = self.play(EventStream(io.BytesIO(), level='debug'))
+        names = [event['event'] for event in events]
+        self.assertEqual((names[0], names[-1]), ('start', 'game_over'))
+        self.assertEqual(events[0]['seed'], 3)
+        self.assertEqual(events[-1], dict(events[-1], status=engine.status, score=engine.score,
+                                          length=engine.snake.size, tick=engine.ticks))
+        self.assertEqual(names.count('move'), engine.ticks)
+        self.assertEqual(names.count('food'), engine.score)
+        self.assertEqual(names.count('speed'), engine.score)
+        self.assertEqual(names.count('turn'), turns)
+        self.assertEqual([event['tick'] for event in events], sorted(event['tick'] for event in events))
+        self.assertEqual(events[-2]['head'], list(engine.snake.get_head_position()))
+
+    def test_filters(self):
+        engine, turns, events = self.play(EventStream(io.BytesIO()))
+        self.assertNotIn('move', [event['event'] for event in events])
+        self.assertEqual(len(events), turns + 2 * engine.score + 2)
+        engine, _, events = self.play(EventStream(io.BytesIO(), level='debug', sample=4))
+        moves = [event['tick'] for event in events if event['event'] == 'move']
+        self.assertEqual(moves, list(range(4, engine.ticks + 1, 4)))
+        with self.assertRaises(ValueError):
+            EventStream(io.BytesIO(), level='trace')
+
+    def test_backpressure(self):
+        # The drop policy never waits for a stuck writer, it counts the events that did not fit.
+        output = BlockingOutput()
+        stream = EventStream(output, policy='drop', capacity=16, batch_size=4)
+        for tick in range(100):
+            stream.emit('speed', tick, speed=tick)
+        self.assertLessEqual(stream.emitted, 16 + 4)
+        self.assertEqual(stream.emitted + stream.dropped, 100)
+        output.released.set()
+        stream.close()
+        events = [json.loads(line) for line in output.getvalue().decode().splitlines()]
+        reports = [event for event in events if event['event'] == 'dropped']
+        self.assertEqual(sum(event['count'] for event in reports), stream.dropped)
+        self.assertEqual(reports[-1]['total'], stream.dropped)
+        self.assertEqual(stream.written, stream.emitted + 1)
+
+        # The block policy waits for room and loses nothing, writing in batches.
+        output = BlockingOutput()
+        stream = EventStream(output, policy='block', capacity=16, batch_size=8)
+        threading.Timer(0.05, output.released.set).start()
+        for tick in range(100):
+            stream.emit('speed', tick, speed=tick)
+        stream.close()
+        self.assertEqual(stream.stats(), {'emitted': 100, 'dropped': 0, 'written': 100})
+        self.assertLess(output.writes, 100)
+        self.assertEqual([json.loads(line)['tick'] for line in output.getvalue().decode().splitlines()],
+                         list(range(100)))
+
+    @unittest.skipUnless(hasattr(socket, 'AF_UNIX'), 'Unix sockets are not available')
+    def test_unix_socket(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'events.sock')
+            server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            server.bind(path)
+            server.listen(1)
+            received = []
+
+            def read():
+                connection, _ = server.accept()
+                with connection, connection.makefile('rb') as f:
+                    received.extend(json.loads(line) for line in f)
+
+            reader = threading.Thread(target=read)
+            reader.start()
+            with EventStream('unix:' + path) as stream:
+                engine = Engine(seed=1)
+                stream.observe(engine)
+                stream.game_over(engine, 'END')
+            reader.join()
+            server.close()
+        self.assertEqual([event['event'] for event in received], ['start', 'game_over'])
+        self.assertEqual(received[1]['status'], 'END')
+
+        # Errors of the output are raised on close.
+        stream = EventStream('unix:' + path)
+        stream.emit('speed', 0, speed=1)
+        with self.assertRaises(OSError):
+            stream.close()
+
+
+class TestPhaseProfiler(unittest.TestCase):
+    """
+    Test the game loop profiler.
+    """
+
+    def setUp(self):
+        self.now = 0.0
+        self.profiler = PhaseProfiler(window=10, clock=lambda: self.now)
+
+    def test_phases(self):
+        profiler = self.profiler
+        for tick in range(20):
+            profiler.start('step')
+            self.now += 0.001
+            profiler.start('collisions')
+            self.now += 0.002 if tick % 2 else 0.004
+            profiler.stop()
+            profiler.stop()
+            self.now += 0.097 if tick % 2 else 0.095
+            profiler.tick(10)
+        stats = profiler.stats()
+        self.assertEqual(stats['ticks'], 20)
+        self.assertAlmostEqual(stats['rate'], 10)
+        self.assertEqual(stats['target_rate'], 10)
+        # The nested phase is not counted in the outer one, only the last ticks are kept.
+        self.assertAlmostEqual(stats['phases']['step']['max_ms'], 1)
+        self.assertEqual(stats['phases']['collisions']['ticks'], 10)
+        self.assertAlmostEqual(stats['phases']['collisions']['p50_ms'], 2)
+        self.assertAlmostEqual(stats['phases']['collisions']['p99_ms'], 4)
+        self.assertEqual(profiler.overlay(), '10.0/10.0 tps collisions 4.00ms step 1.00ms')
+
+    def test_missed(self):
+        # A slow tick misses the deadlines it overran, which are counted in the stats and shown on the overlay.
+        scheduler = TickScheduler(10, clock=lambda: self.now, sleep=lambda seconds: None)
+        profiler = self.profiler
+        scheduler.start()
+        for tick in range(5):
+            self.now += 0.35 if tick == 2 else 0.1
+            profiler.tick(scheduler.rate, scheduler.tick())
+        self.assertEqual(profiler.stats()['missed'], 2)
+        self.assertIn(' 2 missed', profiler.overlay())
+
+    def test_instrument(self):
+        engine = Engine(seed=1)
+        self.profiler.instrument(engine, 'place_food', 'place_food')
+        self.assertTrue(engine.place_food())
+        self.profiler.tick()
+        self.assertEqual(self.profiler.stats()['phases']['place_food']['ticks'], 1)
+
+        # The null profiler leaves the engine untouched.
+        engine = Engine(seed=1)
+        NullProfiler().instrument(engine, 'place_food', 'place_food')
+        self.assertNotIn('place_food', vars(engine))
+
+    def test_status(self):
+        screen = AnsiScreen(io.BytesIO(), 20, 40)
+        renderer = CursesRenderer(screen, 20, 40, doupdate=screen.flush)
+        engine = Engine(board_height=20, board_width=40, seed=1)
+        renderer.set_status('10.0/10.0 tps')
+        renderer.render(engine)
+        self.assertEqual(bytes(screen.back[19][:17]).decode(), '+-10.0/10.0 tps--')
+        renderer.set_status('9.5/10.0 tps')
+        engine.step()
+        renderer.render(engine)
+        self.assertEqual(bytes(screen.back[19][:17]).decode(), '+-9.5/10.0 tps---')
+
+
+class FakeTransport:
+    """
+    Transport that keeps the written data.
+    """
+
+    def __init__(self):
+        self.data = bytearray()
+        self.aborted = False
+
+    def set_write_buffer_limits(self, high=None):
+        pass
+
+    def write(self, data):
+        self.data += data
+
+    def abort(self):
+        self.aborted = True
+
+
+class TestServer(unittest.TestCase):
+    """
+    Test the game server and its protocol.
+    """
+
+    def join(self, server, n_sessions):
+        connection = ServerConnection(server)
+        connection.connection_made(FakeTransport())
+        connection.data_received(b''.join(encode_frame(JOIN, i, JOIN_PAYLOAD.pack(10, 12, i))
+                                          for i in range(n_sessions)))
+        return connection
+
+    def test_frame_decoder(self):
+        data = encode_frame(TURN, 7, TURN_PAYLOAD.pack(2)) + encode_frame(JOIN, 8, JOIN_PAYLOAD.pack(10, 10, 1))
+        decoder = FrameDecoder()
+        frames = decoder.feed(data[:5]) + decoder.feed(data[5:FRAME.size + 3]) + decoder.feed(data[FRAME.size + 3:])
+        self.assertEqual(frames, [(TURN, 7, b'\x02'), (JOIN, 8, JOIN_PAYLOAD.pack(10, 10, 1))])
+        with self.assertRaises(ValueError):
+            FrameDecoder(max_payload=1).feed(data[FRAME.size + 1:])
+
+    def test_session_view(self):
+        server = GameServer()
+        connection = self.join(server, 3)
+        self.assertEqual(server.n_sessions, 3)
+        decoder = FrameDecoder()
+        views = {}
+        for tick in range(30):
+            for kind, session_id, payload in decoder.feed(bytes(connection.transport.data)):
+                if kind == START:
+                    views[session_id] = SessionView(payload)
+                elif kind == DELTA:
+                    views[session_id].apply(payload)
+            connection.transport.data.clear()
+            for session_id, session in connection.sessions.items():
+                self.assertEqual(list(views[session_id].cells), session.engine.snake.get_cells().tolist())
+                self.assertEqual(views[session_id].score, session.engine.score)
+                # Follow the food, so that the snakes grow.
+                f_y, f_x = session.engine.food.get_position()
+                h_y, h_x = session.engine.snake.get_head_position()
+                direction = 'DOWN' if f_y > h_y else 'UP' if f_y < h_y else 'RIGHT' if f_x > h_x else 'LEFT'
+                connection.data_received(encode_frame(TURN, session_id, TURN_PAYLOAD.pack(
+                    ['RIGHT', 'LEFT', 'UP', 'DOWN'].index(direction))))
+            server.tick()
+        self.assertTrue(any(view.score > 0 for view in views.values()))
+
+    def test_start_payload(self):
+        # The START message carries the snake but not the free positions, whatever the board size.
+        connection = ServerConnection(GameServer())
+        connection.connection_made(FakeTransport())
+        connection.data_received(encode_frame(JOIN, 1, JOIN_PAYLOAD.pack(500, 500, 7)))
+        [(kind, session_id, payload)] = FrameDecoder().feed(bytes(connection.transport.data))
+        self.assertEqual((kind, session_id), (START, 1))
+        self.assertEqual(len(payload), START_PAYLOAD.size + 3 * 4)
+        view = SessionView(payload)
+        engine = connection.sessions[1].engine
+        self.assertEqual((view.board_height, view.board_width, view.seed), (500, 500, 7))
+        self.assertEqual((view.direction, view.status), (engine.snake.head_direction, engine.status))
+        self.assertEqual(view.get_food_position(), engine.food.get_position())
+        self.assertEqual(list(view.cells), engine.snake.get_cells().tolist())
+
+    def test_errors(self):
+        server = GameServer(max_sessions=2)
+        connection = self.join(server, 3)
+        frames = FrameDecoder().feed(bytes(connection.transport.data))
+        self.assertEqual([kind for kind, _, _ in frames], [START, START, ERROR])
+        connection.data_received(encode_frame(99, 0))
+        self.assertTrue(connection.transport.aborted)
+        connection.connection_lost(None)
+        self.assertEqual(server.n_sessions, 0)
+
+    def test_backpressure(self):
+        server = GameServer(max_stall=3)
+        connection = self.join(server, 2)
+        server.tick()
+        connection.pause_writing()
+        for _ in range(3):
+            server.tick()
+        self.assertEqual([s.engine.ticks for s in connection.sessions.values()], [1, 1])
+        self.assertFalse(connection.transport.aborted)
+        server.tick()
+        self.assertTrue(connection.transport.aborted)
+
+    def test_tcp(self):
+        async def play():
+            server = GameServer(rate=100)
+            listener = await server.start(port=0)
+            runner = asyncio.ensure_future(server.run())
+            reader, writer = await asyncio.open_connection(*listener.sockets[0].getsockname()[:2])
+            writer.write(encode_frame(JOIN, 5, JOIN_PAYLOAD.pack(10, 10, 3)))
+            kinds = []
+            while len(kinds) < 4:
+                length, kind, session_id = FRAME.unpack(await reader.readexactly(FRAME.size))
+                await reader.readexactly(length)
+                kinds.append((kind, session_id))
+            writer.close()
+            runner.cancel()
+            listener.close()
+            return kinds
+
+        self.assertEqual(asyncio.run(play()), [(START, 5), (DELTA, 5), (DELTA, 5), (DELTA, 5)])
+
+
 if __name__ == '__main__':
     unittest.main()